@@ -1,8 +1,10 @@
 from fastapi import APIRouter
 
-from app.api.api_v1.endpoints import ping, rate
+from app.api.api_v1.endpoints import batch, ping, rate, tariffs
 
 api_router = APIRouter()
 
 api_router.include_router(ping.router)
 api_router.include_router(rate.router, tags=["rate"])
+api_router.include_router(batch.router, tags=["rate"])
+api_router.include_router(tariffs.router, tags=["tariff"])
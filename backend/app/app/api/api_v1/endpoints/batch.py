@@ -0,0 +1,78 @@
+from functools import partial
+from typing import List
+
+from fastapi import APIRouter, Body, Depends
+from fastapi.responses import UJSONResponse
+from fastapi.security.api_key import APIKey
+
+from app.api.helpers import calculate_rates_batch, rate_ndjson_stream
+from app.core.config import settings
+from app.core.responses import BodyStreamingResponse
+from app.core.security import get_api_key
+from app.schemas import BatchRateItem, BatchRateResult
+
+router = APIRouter()
+
+
+@router.post("/rates/batch", response_model=BatchRateResult)
+async def apply_rate_batch(
+    api_key: APIKey = Depends(get_api_key),
+    items: List[BatchRateItem] = Body(...),
+) -> BatchRateResult:
+    """API for applying rates to a batch of CDRs.
+    Validation and calculation are done in columnar form over the whole batch,
+    with the same rules as the `/rate/` API.
+
+    Args:
+        api_key (APIKey): Uses security backend for api key authorization, receives
+        the api key through header.
+        items (List[BatchRateItem]): Array of rate and CDR pairs.
+
+    Returns:
+        [JSON]: Per item calculated rates or errors.
+
+    **Technical Details:**
+    An item failing the validation doesn't fail the whole batch, instead its
+    error is reported in the `error` field of its result, and the `result` field
+    is null. Results are in the same order as the items of the request.
+    The results are built by the calculation engine and are already in the shape
+    of the response model, so they are serialized directly to skip revalidating
+    every item of the response.
+    """
+
+    results = await calculate_rates_batch(items)
+    failed = sum(1 for result in results if result["error"])
+    return UJSONResponse(
+        {"rated": len(results) - failed, "failed": failed, "results": results}
+    )
+
+
+@router.post("/rates/stream", response_class=BodyStreamingResponse)
+async def apply_rate_stream(
+    api_key: APIKey = Depends(get_api_key),
+) -> BodyStreamingResponse:
+    """Streaming API for applying rates to an unbounded feed of CDRs.
+    Receives newline delimited JSON (NDJSON) records of `{"rate": ..., "cdr": ...}`,
+    and responds with NDJSON records in the shape of the batch API results.
+
+    Args:
+        api_key (APIKey): Uses security backend for api key authorization, receives
+        the api key through header.
+
+    Returns:
+        [NDJSON]: Per record calculated rates or errors.
+
+    **Technical Details:**
+    The request body is read while it is being uploaded, records are rated in
+    chunks (see `STREAM_CHUNK_SIZE` setting) and the results of each chunk are
+    sent right away. So the response starts before the upload finishes, and the
+    memory usage stays flat regardless of the size of the input.
+    The body is read by the response itself, see `BodyStreamingResponse`.
+    A malformed line results in an error record with the `index` of that line
+    (starting from 0), instead of aborting the stream.
+    """
+
+    return BodyStreamingResponse(
+        partial(rate_ndjson_stream, chunk_size=settings.STREAM_CHUNK_SIZE),
+        media_type="application/x-ndjson",
+    )
@@ -1,34 +1,112 @@
-import contextlib
+from datetime import date, datetime
 from logging import getLogger
+from typing import Optional
 
-import aiohttp
-import ujson
-from fastapi import APIRouter, Body, Depends, Query
+from fastapi import APIRouter, Body, Depends, Header, Query, Response
 from fastapi.security.api_key import APIKey
 
 from app.api.helpers import (
     calculate_rate,
+    calculate_tariff_rate,
+    canonical_conversion_query,
+    canonical_rate_query,
     convert_currency,
+    etag_matches,
+    fetch_conversion_result,
+    fetch_historical_conversion_result,
     get_conversion_result_from_cache,
-    set_conversion_result_to_cache,
+    get_historical_conversion_result_from_cache,
+    rate_etag,
+    result_cache,
+    result_key,
+    revalidate_rate_table,
+    tariff_registry,
     validate_meters,
+    validate_session,
     validate_timestamps,
 )
+from app.api.helpers.cache import next_utc_midnight
+from app.api.helpers.shared_rates import shared_rates
+from app.api.helpers.tariff_index import TariffIndex
+from app.api.helpers.timestamps import SECONDS_PER_DAY
 from app.core.config import settings
+from app.core.exception import bad_request, not_found
+from app.core.metrics import stage_latency, timed_json_response
+from app.core.responses import (
+    fast_json_response,
+    fast_response,
+    serialize_converted_rate_result,
+    serialize_rate_result,
+)
 from app.core.security import get_api_key
 from app.schemas import CDR, ConvertedRateResult, Currency, Rate, RateResult
 
 router = APIRouter()
 logger = getLogger(__name__)
 
-session = aiohttp.ClientSession(json_serialize=ujson.dumps)
-EXCHANGE_API = "https://api.exchangerate.host/convert?from={0}&to={1}"
+TARIFF_OR_RATE_ERROR = "either rate or tariff_id is required"
+# Responses of the results, with `FAST_RESPONSES`
+RateResponse = fast_json_response("rate", serialize_rate_result)
+ConvertedRateResponse = fast_json_response(
+    "conversion", serialize_converted_rate_result
+)
+
 
+async def rate_cdr(rate: Rate, cdr: CDR, index: Optional[TariffIndex] = None) -> dict:
+    """Validate and rate a CDR, shared by the rating APIs.
+    Tariffs with time windows or tiers are rated with their interval `index`.
+    Results are memoized by their canonical input, see `ResultCache`.
+    """
+    key = result_key("rate", canonical_rate_query(rate=rate, cdr=cdr))
+    with stage_latency.time(endpoint="rate", stage="cache"):
+        result = await result_cache.get(key)
+    if result is not None:
+        return result
+
+    with stage_latency.time(endpoint="rate", stage="validation"):
+        if index is None:
+            total_seconds = await validate_timestamps(
+                start=cdr.timestamp_start, stop=cdr.timestamp_stop
+            )
+        else:
+            start, total_seconds = await validate_session(
+                start=cdr.timestamp_start, stop=cdr.timestamp_stop
+            )
+        total_kwh = await validate_meters(start=cdr.meter_start, stop=cdr.meter_stop)
+    with stage_latency.time(endpoint="rate", stage="calculation"):
+        if index is None:
+            overall, energy, time, transaction = await calculate_rate(
+                total_seconds=total_seconds,
+                total_kwh=total_kwh,
+                energy_rate=rate.energy,
+                time_rate=rate.time,
+                transaction_rate=rate.transaction,
+            )
+        else:
+            overall, energy, time, transaction = await calculate_tariff_rate(
+                index,
+                start_second=start % SECONDS_PER_DAY,
+                total_seconds=total_seconds,
+                total_kwh=total_kwh,
+            )
 
-@router.post("/rate/", response_model=RateResult)
+    result = {
+        "overall": overall,
+        "components": {"energy": energy, "time": time, "transaction": transaction},
+    }
+    await result_cache.set(key, result)
+    return result
+
+
+@router.post(
+    "/rate/", response_model=RateResult, response_class=timed_json_response("rate")
+)
 async def apply_rate(
     api_key: APIKey = Depends(get_api_key),
-    rate: Rate = Body(..., embed=True),
+    rate: Optional[Rate] = Body(None, embed=True),
+    tariff_id: Optional[str] = Body(
+        None, embed=True, description="Id of a tariff of the registry, see /tariffs/"
+    ),
     cdr: CDR = Body(..., embed=True),
 ) -> RateResult:
     """Base API for applying rate to a CDR.
@@ -39,31 +117,93 @@ async def apply_rate(
         api_key (APIKey): Uses security backend for api key authorization, receives
         the api key through header.
         rate (Rate): Rate components body.
+        tariff_id (str): Id of a stored tariff, instead of the rate components.
         cdr (CDR): CDR components body.
 
     Returns:
         [JSON]: Calculated rates.
     """
 
-    total_seconds = await validate_timestamps(
-        start=cdr.timestamp_start, stop=cdr.timestamp_stop
-    )
-    total_kwh = await validate_meters(start=cdr.meter_start, stop=cdr.meter_stop)
-    overall, energy, time, transaction = await calculate_rate(
-        total_seconds=total_seconds,
-        total_kwh=total_kwh,
-        energy_rate=rate.energy,
-        time_rate=rate.time,
-        transaction_rate=rate.transaction,
-    )
+    if (rate is None) == (tariff_id is None):
+        bad_request(err=TARIFF_OR_RATE_ERROR)
+    if tariff_id is not None:
+        tariff = await tariff_registry.get(tariff_id)
+        if tariff is None:
+            not_found(err=f"tariff {tariff_id}")
+        result = await rate_cdr(rate=tariff.rate, cdr=cdr, index=tariff.index)
+    else:
+        result = await rate_cdr(rate=rate, cdr=cdr)
+    return fast_response(RateResponse, result)
 
-    return {
-        "overall": overall,
-        "components": {"energy": energy, "time": time, "transaction": transaction},
+
+@router.get(
+    "/rate/", response_model=RateResult, response_class=timed_json_response("rate")
+)
+async def get_rate(
+    response: Response,
+    api_key: APIKey = Depends(get_api_key),
+    energy: float = Query(..., gt=0),
+    time: float = Query(..., gt=0),
+    transaction: float = Query(..., gt=0),
+    timestamp_start: str = Query(..., description="ISO 8601 timestamp"),
+    timestamp_stop: str = Query(..., description="ISO 8601 timestamp"),
+    meter_start: int = Query(...),
+    meter_stop: int = Query(...),
+    if_none_match: Optional[str] = Header(None),
+) -> RateResult:
+    """Cacheable API for applying rate to a CDR, the idempotent GET form of the
+    `POST /rate/` API with the rate and CDR components as query parameters.
+
+    Args:
+        api_key (APIKey): Uses security backend for api key authorization, receives
+        the api key through header.
+        energy, time, transaction (Number): Rate components.
+        timestamp_start, timestamp_stop, meter_start, meter_stop: CDR components.
+
+    Returns:
+        [JSON]: Calculated rates | 304 Not Modified
+
+    **Technical Details:**
+    A rating result is a pure function of its input, so the response has a strong
+    `ETag`, derived from the canonical form of the query (parameters sorted by
+    name, values encoded after parsing) and the version of the rating engine, and
+    a `Cache-Control` header which lets clients and proxies reuse it (see the
+    `RATE_CACHE_MAX_AGE` setting). The canonical query is sent back in the
+    `Content-Location` header, so caches can use it as the key.
+    A request with a matching `If-None-Match` header is answered with
+    `304 Not Modified`, without rating the CDR again.
+    """
+
+    rate = Rate(energy=energy, time=time, transaction=transaction)
+    cdr = CDR(
+        timestamp_start=timestamp_start,
+        timestamp_stop=timestamp_stop,
+        meter_start=meter_start,
+        meter_stop=meter_stop,
+    )
+    canonical_query = canonical_rate_query(rate=rate, cdr=cdr)
+    headers = {
+        "ETag": rate_etag(canonical_query),
+        "Cache-Control": f"public, max-age={settings.RATE_CACHE_MAX_AGE}",
+        "Content-Location": f"{settings.API_V1_STR}/rate/?{canonical_query}",
+        # Results are only served to the authorized clients
+        "Vary": "API-Key",
     }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    result = await rate_cdr(rate=rate, cdr=cdr)
+    # A response returned by the route doesn't get the headers of `response`
+    return fast_response(RateResponse, result, headers=headers)
 
 
-@router.get("/rate/converted-rate/", response_model=ConvertedRateResult)
+@router.get(
+    "/rate/converted-rate/",
+    response_model=ConvertedRateResult,
+    response_model_exclude_unset=True,
+    response_class=timed_json_response("conversion"),
+)
 async def apply_conversion(
     api_key: APIKey = Depends(get_api_key),
     overall: float = Query(..., gt=0),
@@ -71,6 +211,11 @@ async def apply_conversion(
     time: float = Query(..., gt=0),
     transaction: float = Query(..., gt=0),
     currency: Currency = Query(default=Currency.USD),
+    session_date: Optional[date] = Query(
+        None,
+        alias="date",
+        description="Date of the charging session (its end), defaults to today",
+    ),
 ) -> ConvertedRateResult:
     """API for converting rates to another currency.
     Uses the free https://exchangerate.host service for the simplicity
@@ -85,54 +230,103 @@ async def apply_conversion(
         time (Number)
         transaction (Number)
         currency (Currency): Currency to be converted into.
+        session_date (date): Date of the charging session, converts with the
+        rates of that day.
 
     Returns:
         [JSON]: Converted rate | Default input rate
 
     **Technical Details:**
     The first time you send a request to this API, it will ask the
-    https://exchangerate.host service for currency conversion data, calculates conversions,
-    and then caches the rate in which it has received from the service. Susequent requests,
-    to this endpoint for the same currency will result to reading the rate from cache and,
-    caclculating conversions with the cached rate.
-    For details on the cache invalidation mechanism, check `get_conversion_result_from_cache` docs.
+    https://exchangerate.host service for the exchange rates of all the currencies,
+    calculates conversions, and then caches the rate table in which it has received
+    from the service. Susequent requests, to this endpoint for any currency will result
+    to reading the rate from cache and, caclculating conversions with the cached rate.
+    For details on the cache invalidation mechanism, check
+    `get_rate_table_from_cache` docs.
+    Concurrent cache misses are coalesced into a single request to the service,
+    check `fetch_rate_table` docs.
+    Once the cached rates are outdated, they are still served (flagged as `stale`)
+    while they are fetched again in the background, and while the service is
+    failing, it's not requested until its circuit breaker lets a trial request
+    through, check `CircuitBreaker` docs.
+    With `SHARED_RATES_PATH`, the rates are read from a table in memory shared by
+    the workers of the node, check `SharedRateTable` docs. Conversions with the
+    current rates of the table don't use Redis at all, they're calculated again
+    instead of being memoized.
+    Rates of a past date are cached permanently once they are fetched, and can be
+    preloaded for a date range with `python -m app.cli preload-rates`.
+    Converted rates are memoized by their canonical input and the date of the
+    rates, see `ResultCache`, so repeated requests skip the conversion.
 
     """
 
-    raw_conversion_result: dict = await get_conversion_result_from_cache(
-        currency=currency
-    )
-    if raw_conversion_result:
-        response = await convert_currency(
-            raw_conversion_result=raw_conversion_result,
-            overall=overall,
-            currency=currency,
-            energy=energy,
-            time=time,
-            transaction=transaction,
-        )
-        return response
-
-    response = dict()
-    rate_convert_api = EXCHANGE_API.format(settings.DEFAULT_CURRENCY, currency.value)
-
-    # Suppress exceptions (better alternative for try/except/pass)
-    with contextlib.suppress(aiohttp.ClientError):
-        async with session.get(rate_convert_api, timeout=2) as convertion_response:
-            raw_conversion_result = await convertion_response.json()
-
-    if raw_conversion_result and raw_conversion_result.get("result"):
-        response = await convert_currency(
-            raw_conversion_result=raw_conversion_result,
-            overall=overall,
-            currency=currency,
-            energy=energy,
-            time=time,
-            transaction=transaction,
-        )
-        await set_conversion_result_to_cache(
-            currency=currency, raw_conversion_result=raw_conversion_result
+    now = datetime.utcnow()
+    today = now.date()
+    if session_date is not None and session_date > today:
+        bad_request(err="date can't be in the future")
+
+    historical = session_date is not None and session_date < today
+    conversion_result: dict = dict()
+    if not historical:
+        # The table shared by the workers of the node converts without Redis,
+        # neither the result cache nor the rate cache is read or written
+        with stage_latency.time(endpoint="conversion", stage="rate_cache"):
+            conversion_result = shared_rates.conversion_result(currency)
+    shared = bool(conversion_result)
+    if not shared:
+        key = result_key(
+            "conversion",
+            canonical_conversion_query(
+                overall=overall,
+                energy=energy,
+                time=time,
+                transaction=transaction,
+                currency=currency,
+                day=session_date if historical else today,
+            ),
         )
+        with stage_latency.time(endpoint="conversion", stage="cache"):
+            response = await result_cache.get(key)
+        if response is not None:
+            return fast_response(ConvertedRateResponse, response)
+
+        with stage_latency.time(endpoint="conversion", stage="rate_cache"):
+            if historical:
+                conversion_result = await get_historical_conversion_result_from_cache(
+                    currency=currency, day=session_date
+                )
+            else:
+                conversion_result = await get_conversion_result_from_cache(
+                    currency=currency, stale=True
+                )
+    if not historical and conversion_result.get("stale"):
+        revalidate_rate_table()
+    if not conversion_result:
+        with stage_latency.time(endpoint="conversion", stage="upstream"):
+            if historical:
+                conversion_result = await fetch_historical_conversion_result(
+                    currency=currency, day=session_date
+                )
+            else:
+                conversion_result = await fetch_conversion_result(currency=currency)
+
+    if conversion_result:
+        with stage_latency.time(endpoint="conversion", stage="calculation"):
+            response = await convert_currency(
+                conversion_result=conversion_result,
+                overall=overall,
+                currency=currency,
+                energy=energy,
+                time=time,
+                transaction=transaction,
+            )
+        # Results of the current rates are kept until the rates expire,
+        # and results of stale rates aren't kept
+        if not shared and not response.get("stale"):
+            await result_cache.set(
+                key, response, expires_at=None if historical else next_utc_midnight(now)
+            )
     # If the service isn't available, return the default input currency
     else:
         logger.warning(
@@ -143,4 +337,4 @@ async def apply_conversion(
             "components": {"energy": energy, "time": time, "transaction": transaction},
             "currency": Currency.EUR,
         }
-    return response
+    return fast_response(ConvertedRateResponse, response)
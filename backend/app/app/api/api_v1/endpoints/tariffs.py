@@ -0,0 +1,75 @@
+from typing import List
+
+from fastapi import APIRouter, Body, Depends, Path, Response
+from fastapi.security.api_key import APIKey
+
+from app.api.helpers import tariff_registry
+from app.core.exception import not_found
+from app.core.security import get_api_key
+from app.schemas import Tariff, TariffRecord
+
+router = APIRouter()
+
+TARIFF_ID = Path(..., regex=r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+@router.get("/tariffs/", response_model=List[TariffRecord])
+async def list_tariffs(api_key: APIKey = Depends(get_api_key)) -> List[TariffRecord]:
+    """API for listing the tariffs of the tariff registry, ordered by id"""
+
+    return [tariff.record() for tariff in await tariff_registry.list()]
+
+
+@router.get("/tariffs/{tariff_id}", response_model=TariffRecord)
+async def get_tariff(
+    api_key: APIKey = Depends(get_api_key), tariff_id: str = TARIFF_ID
+) -> TariffRecord:
+    """API for reading a tariff of the tariff registry"""
+
+    tariff = await tariff_registry.get(tariff_id)
+    if tariff is None:
+        not_found(err=f"tariff {tariff_id}")
+    return tariff.record()
+
+
+@router.put("/tariffs/{tariff_id}", response_model=TariffRecord)
+async def put_tariff(
+    api_key: APIKey = Depends(get_api_key),
+    tariff_id: str = TARIFF_ID,
+    tariff: Tariff = Body(...),
+) -> TariffRecord:
+    """API for creating or updating a tariff of the tariff registry.
+    Tariffs are referenced by their id in the `tariff_id` field of the `/rate/`
+    API, instead of sending the rate components along with every CDR.
+
+    Args:
+        api_key (APIKey): Uses security backend for api key authorization, receives
+        the api key through header.
+        tariff_id (str): Letters, digits, `_`, `.` and `-`, up to 64 characters.
+        tariff (Tariff): Rate components, time of use windows and energy tiers.
+
+    Returns:
+        [JSON]: The tariff and its version.
+
+    **Technical Details:**
+    Within a time window (UTC) its energy and time prices apply instead of those
+    of the tariff, and above the `from_kwh` of a tier its energy price applies,
+    unless a window sets one. Sessions are split into segments of constant
+    prices, using the interval index of the tariff, see `price_session`.
+    Every update increments the version of the tariff. Workers keep the tariffs
+    they use in process, and are notified of the updates through Redis pub/sub,
+    so all of them price with the latest version.
+    """
+
+    return (await tariff_registry.put(tariff_id, tariff)).record()
+
+
+@router.delete("/tariffs/{tariff_id}", status_code=204, response_class=Response)
+async def delete_tariff(
+    api_key: APIKey = Depends(get_api_key), tariff_id: str = TARIFF_ID
+) -> Response:
+    """API for deleting a tariff of the tariff registry"""
+
+    if not await tariff_registry.delete(tariff_id):
+        not_found(err=f"tariff {tariff_id}")
+    return Response(status_code=204)
@@ -1,5 +1,27 @@
 """The module for API helper functions"""
 
-from .cache import get_conversion_result_from_cache, set_conversion_result_to_cache
+from .batch import calculate_rates_batch, rate_ndjson_stream
+from .cache import (
+    get_conversion_result_from_cache,
+    get_historical_conversion_result_from_cache,
+    get_rate_table_from_cache,
+    set_historical_rates_to_cache,
+    set_rate_table_to_cache,
+)
 from .calculation import calculate_rate, convert_currency
-from .validation import validate_meters, validate_timestamps
+from .conditional import (
+    canonical_conversion_query,
+    canonical_rate_query,
+    etag_matches,
+    rate_etag,
+)
+from .exchange import (
+    fetch_conversion_result,
+    fetch_historical_conversion_result,
+    preload_historical_rates,
+    revalidate_rate_table,
+)
+from .results import result_cache, result_key
+from .tariff_index import calculate_tariff_rate, compile_index
+from .tariffs import tariff_registry
+from .validation import validate_meters, validate_session, validate_timestamps
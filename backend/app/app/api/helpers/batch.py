@@ -0,0 +1,277 @@
+from operator import itemgetter
+from typing import AsyncIterator, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+import ujson
+from pydantic import ValidationError
+
+from app.api.helpers.calculation import (
+    RATE_DENOMINATOR,
+    SECONDS_PER_HOUR,
+    UNIT_SCALE,
+    WH_PER_KWH,
+    format_cents,
+    format_millis,
+    rate_numerators,
+)
+from app.api.helpers.timestamps import MICROSECONDS_PER_SECOND, parse_timestamps
+from app.api.helpers.validation import METER_ORDER_ERROR, TIMESTAMP_ORDER_ERROR
+from app.core.exception import BAD_REQUEST_DETAIL, WRONG_ISOFORMAT_DETAIL
+from app.schemas.batch import BatchRateItem
+
+# Bound of the int64 numerators of the rates, leaves room for the rounding
+MAX_NUMERATOR = 2**61
+
+
+class RatedColumns(NamedTuple):
+    """Columnar rating result, one entry per CDR.
+    Rates of the rows which have an error are undefined.
+    """
+
+    overall: np.ndarray
+    energy: np.ndarray
+    time: np.ndarray
+    transaction: np.ndarray
+    errors: List[Optional[str]]
+
+
+def to_units_array(scaled: np.ndarray, exact: bool = False) -> np.ndarray:
+    """Vectorized `to_units` of prices already multiplied by `UNIT_SCALE`, rounded
+    half up as well, as int64 or, if `exact`, as Python ints which don't overflow.
+    """
+    rounded = np.floor(scaled + 0.5)
+    if exact:
+        return np.array([int(value) for value in rounded.tolist()], dtype=object)
+    return rounded.astype(np.int64)
+
+
+def round_fixed(numerators: np.ndarray, denominator: int, places: int) -> np.ndarray:
+    """Vectorized equivalent of the per component formatting of `calculate_rate`,
+    round exact rates half up to the decimal places and return them as floats.
+    """
+    unit = denominator // 10**places
+    rounded = (2 * numerators + unit) // (2 * unit)
+    return (rounded / 10**places).astype(np.float64)
+
+
+def format_column(column: np.ndarray, places: int) -> List[Union[str, int]]:
+    """Format a column of rates rounded by `round_fixed` as `calculate_rate` formats
+    them, e.g. `"3.277"`, or as an int if it's a whole number.
+    """
+    format_rate = format_cents if places == 2 else format_millis
+    scaled = np.rint(column * 10**places).tolist()
+    return [format_rate(int(value), 1) for value in scaled]
+
+
+def rate_columns(
+    timestamp_start: Sequence[str],
+    timestamp_stop: Sequence[str],
+    meter_start: Sequence[int],
+    meter_stop: Sequence[int],
+    energy_rate: Sequence[float],
+    time_rate: Sequence[float],
+    transaction_rate: Sequence[float],
+) -> RatedColumns:
+    """Validate and rate CDRs in columnar form.
+    Applies the same validation rules and arithmetic as `validate_timestamps`,
+    `validate_meters` and `calculate_rate`, but over whole columns at once.
+    Instead of raising, the failing rows get an error message.
+
+    Returns:
+        RatedColumns: Calculated and formatted rates and per row errors
+    """
+    start = parse_timestamps(timestamp_start)
+    stop = parse_timestamps(timestamp_stop)
+    meter_start = np.asarray(meter_start, dtype=np.int64)
+    meter_stop = np.asarray(meter_stop, dtype=np.int64)
+
+    wrong_isoformat = start.mask | stop.mask
+    start, stop = start.filled(0), stop.filled(0)
+    wrong_timestamp_order = ~wrong_isoformat & (start >= stop)
+    wrong_meter_order = ~(meter_stop > meter_start)
+
+    errors: List[Optional[str]] = [None] * len(start)
+    for rows, error in (
+        (wrong_meter_order, BAD_REQUEST_DETAIL.format(METER_ORDER_ERROR)),
+        (wrong_timestamp_order, BAD_REQUEST_DETAIL.format(TIMESTAMP_ORDER_ERROR)),
+        (wrong_isoformat, WRONG_ISOFORMAT_DETAIL),
+    ):
+        for row in np.flatnonzero(rows).tolist():
+            errors[row] = error
+
+    total_seconds = (stop - start) // MICROSECONDS_PER_SECOND
+    total_wh = meter_stop - meter_start
+    energy_scaled, time_scaled, transaction_scaled = (
+        np.asarray(rate, dtype=np.float64) * UNIT_SCALE
+        for rate in (energy_rate, time_rate, transaction_rate)
+    )
+
+    # Rates which could overflow int64 are calculated with Python ints instead
+    exact = bool(
+        (
+            np.abs(total_wh) * np.abs(energy_scaled) * SECONDS_PER_HOUR
+            + np.abs(total_seconds) * np.abs(time_scaled) * WH_PER_KWH
+            + np.abs(transaction_scaled) * SECONDS_PER_HOUR * WH_PER_KWH
+            >= MAX_NUMERATOR
+        ).any()
+    )
+    if exact:
+        total_seconds, total_wh = total_seconds.astype(object), total_wh.astype(object)
+    energy_units, time_units, transaction_units = (
+        to_units_array(scaled, exact=exact)
+        for scaled in (energy_scaled, time_scaled, transaction_scaled)
+    )
+
+    overall, energy, time, transaction = rate_numerators(
+        total_seconds=total_seconds,
+        total_wh=total_wh,
+        energy_units=energy_units,
+        time_units=time_units,
+        transaction_units=transaction_units,
+    )
+    return RatedColumns(
+        overall=round_fixed(overall, RATE_DENOMINATOR, places=2),
+        energy=round_fixed(energy, RATE_DENOMINATOR, places=3),
+        time=round_fixed(time, RATE_DENOMINATOR, places=3),
+        transaction=round_fixed(transaction, RATE_DENOMINATOR, places=3),
+        errors=errors,
+    )
+
+
+def build_results(
+    columns: RatedColumns, indexes: Optional[Sequence[int]] = None
+) -> List[dict]:
+    """Convert rated columns to per item result dicts.
+    Items are numbered by their position in the columns, unless their indexes
+    are given.
+    """
+    if indexes is None:
+        indexes = range(len(columns.errors))
+    results = []
+    for index, overall, energy, time, transaction, error in zip(
+        indexes,
+        columns.overall.tolist(),
+        columns.energy.tolist(),
+        columns.time.tolist(),
+        columns.transaction.tolist(),
+        columns.errors,
+    ):
+        if error:
+            results.append({"index": index, "result": None, "error": error})
+            continue
+        results.append(
+            {
+                "index": index,
+                "result": {
+                    "overall": overall,
+                    "components": {
+                        "energy": energy,
+                        "time": time,
+                        "transaction": transaction,
+                    },
+                },
+                "error": None,
+            }
+        )
+    return results
+
+
+def rate_items(
+    items: Sequence[BatchRateItem], indexes: Optional[Sequence[int]] = None
+) -> List[dict]:
+    """Rate parsed rate/CDR pairs and build their results"""
+    columns = rate_columns(
+        timestamp_start=[item.cdr.timestamp_start for item in items],
+        timestamp_stop=[item.cdr.timestamp_stop for item in items],
+        meter_start=[item.cdr.meter_start for item in items],
+        meter_stop=[item.cdr.meter_stop for item in items],
+        energy_rate=[item.rate.energy for item in items],
+        time_rate=[item.rate.time for item in items],
+        transaction_rate=[item.rate.transaction for item in items],
+    )
+    return build_results(columns, indexes=indexes)
+
+
+async def calculate_rates_batch(items: List[BatchRateItem]) -> List[dict]:
+    """Rate a batch of rate/CDR pairs.
+    A failing item doesn't fail the batch, its error is reported next to the
+    results of the other items.
+
+    Args:
+        items (List[BatchRateItem]): Rate and CDR pairs
+
+    Returns:
+        List[dict]: Per item results in the order of the items
+    """
+    return rate_items(items)
+
+
+def describe_validation_error(error: ValidationError) -> str:
+    """Flatten pydantic validation errors into a single line"""
+    return "; ".join(
+        "{0}: {1}".format(".".join(map(str, detail["loc"])), detail["msg"])
+        for detail in error.errors()
+    )
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a stream of byte chunks into lines, without buffering more than
+    a single incomplete line.
+    """
+    pending = b""
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def encode_ndjson(results: List[dict]) -> bytes:
+    """Encode results as NDJSON in the order of their indexes"""
+    results.sort(key=itemgetter("index"))
+    return "".join(ujson.dumps(result) + "\n" for result in results).encode()
+
+
+async def rate_ndjson_stream(
+    chunks: AsyncIterator[bytes], chunk_size: int
+) -> AsyncIterator[bytes]:
+    """Rate a newline delimited JSON stream of rate/CDR records.
+    Records are rated in chunks of `chunk_size`, and the NDJSON results of every
+    chunk are yielded as soon as it is rated, so the memory usage doesn't grow
+    with the size of the stream.
+    A malformed line results in an error record for that line and doesn't
+    abort the stream. Blank lines are skipped but still counted, so the `index`
+    of a result is the line number (starting from 0) of its record.
+
+    Args:
+        chunks (AsyncIterator[bytes]): Raw NDJSON input, e.g. the request body
+        chunk_size (int): Number of records rated at once
+
+    Yields:
+        bytes: NDJSON encoded results
+    """
+    items: List[BatchRateItem] = []
+    indexes: List[int] = []
+    results: List[dict] = []
+    index = -1
+    async for line in iter_lines(chunks):
+        index += 1
+        if not line.strip():
+            continue
+        try:
+            items.append(BatchRateItem.parse_obj(ujson.loads(line)))
+            indexes.append(index)
+        except ValueError as error:
+            message = (
+                describe_validation_error(error)
+                if isinstance(error, ValidationError)
+                else "Invalid JSON record"
+            )
+            results.append({"index": index, "result": None, "error": message})
+        if len(items) + len(results) >= chunk_size:
+            yield encode_ndjson(results + rate_items(items, indexes=indexes))
+            items, indexes, results = [], [], []
+    if items or results:
+        yield encode_ndjson(results + rate_items(items, indexes=indexes))
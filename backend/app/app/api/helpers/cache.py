@@ -1,23 +1,101 @@
-import json
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 from logging import getLogger
+from typing import Any, Dict, Hashable, Optional, Tuple
 
 import aioredis
 
-from app.core.connections import redis_cache
+from app.api.helpers.records import (
+    RateRecord,
+    decode_rate_record,
+    encode_rate_record,
+    rate_record_of,
+)
+from app.core.config import settings
+from app.core.connections import epoch_milliseconds, redis_cache
+from app.core.metrics import cache_invalidations
 from app.schemas.conversion import Currency
 
 logger = getLogger(__name__)
 
+# The current exchange rate table, expired by Redis at the midnight (UTC)
+EXCHANGE_RATES_KEY = "exchange-rates:current"
+# The last exchange rate table cached, served as stale data once the current
+# one expired
+LAST_GOOD_RATES_KEY = "exchange-rates:last-good"
+# Hash of the historical rates, date (ISO format) -> rates of the currencies
+HISTORICAL_RATES_KEY = "exchange-rates:history"
 
-async def get_conversion_result_from_cache(currency: Currency) -> dict:
-    """Checks for conversion result data obtained by another service.
-    If there are no data in the cache, returns an empty dict.
-    If data is available, first check if data is not outdated yet,
-    and if so, invalidates the cache. Otherwise returns the conversion result data,
-    inside the cache.
 
-    Cache invalidation mechanism: Time Expiration.
+def next_utc_midnight(timestamp: datetime) -> datetime:
+    """Midnight (UTC) of the day after the timestamp, where daily data expire"""
+    return (timestamp + timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+class LocalCache:
+    """In process (per worker) LRU cache, used as the L1 cache in front of Redis.
+    Every entry has an expiration time, and the least recently used entries are
+    evicted when the cache is full.
+    Not thread safe, it is meant to be used from the event loop only.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Tuple[datetime, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the value of the key, or None if it's missing or expired"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if datetime.utcnow() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any, expires_at: datetime) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# Decoded exchange rate records, the current one and historical ones
+local_cache = LocalCache(max_size=settings.LOCAL_CACHE_MAX_SIZE)
+
+
+async def get_rate_table_from_cache(stale: bool = False) -> Optional[RateRecord]:
+    """Checks for the exchange rate table obtained by another service.
+    The table is cached as a compact binary record, see `RateRecord`.
+    The decoded record is first looked up in the in process cache (L1) of the worker,
+    and then in Redis (L2), which is shared between the workers.
+    If there are no data in the cache, returns None.
+    The current table and the last good one are read from Redis with a single
+    `MGET`. Outdated tables are expired by Redis itself, so there is no expiry
+    logic here, and the last good table is kept for `RATE_STALE_TTL` seconds, to
+    be served when stale data are allowed (stale-while-revalidate), flagged as
+    `stale`.
+
+    Cache invalidation mechanism: Time Expiration, at the next midnight (UTC),
+    see `set_rate_table_to_cache`.
 
     Algorythm: Based on my understanding from reading
     [this artice](https://support.has-to-be.com/hc/en-us/articles/360005026959-Overview-of-be-ENERGISED-COMMUNITY-tariffs)
@@ -25,59 +103,173 @@ async def get_conversion_result_from_cache(currency: Currency) -> dict:
     so upon requesting, invalidate the cache if it's older than a day.
 
     Args:
-        currency (Currency): [description]
+        stale (bool): Return the last good table if the current one expired
 
     Returns:
-        dict: [description]
+        RateRecord: Exchange rates of all the currencies
     """
 
+    record = local_cache.get(EXCHANGE_RATES_KEY)
+    if record is not None:
+        return record
+
     try:
-        cache_value: json = await redis_cache.get(currency.value)
+        current, last_good = await redis_cache.mget(
+            EXCHANGE_RATES_KEY, LAST_GOOD_RATES_KEY
+        )
     except aioredis.RedisError:  # pragma: no cover # general exception
-        return dict()
-    if not cache_value:
-        return dict()
-
-    cache_value: dict = json.loads(cache_value)
-    cached_timestamp: datetime = cache_value.get("timestamp")
-    cached_timestamp = datetime.fromisoformat(cached_timestamp)
-    # Calculate the next day from the cached_timestamp
-    next_day_of_cached = (cached_timestamp + timedelta(days=1)).replace(
-        hour=0, minute=0, second=0
-    )
-    # If it's older than a day, invalidate the cache
-    if datetime.utcnow() >= next_day_of_cached:
-        await redis_cache.delete(currency.value)
-        logger.info(
-            "Cache data was outdated, since it got invalidate, currency: %s",
-            currency.value,
+        return None
+    record = decode_rate_record(current) if current else None
+    if record is not None:
+        logger.info("Reading exchange rate table from cache")
+        # Expired by Redis at the midnight at the latest
+        local_cache.set(
+            EXCHANGE_RATES_KEY, record, expires_at=next_utc_midnight(datetime.utcnow())
         )
+        return record
+    record = decode_rate_record(last_good) if last_good else None
+    if record is not None:
+        cache_invalidations.inc(cache="exchange_rates")
+        if stale:
+            logger.info("Reading outdated exchange rate table from cache")
+            return record._replace(stale=True)
+        logger.info("Cache data was outdated, since it got invalidate")
+    return None
+
+
+def conversion_result_of(record: Optional[RateRecord], currency: Currency) -> dict:
+    """Conversion data of a currency from an exchange rate record.
+
+    Args:
+        record (RateRecord): Exchange rates, if any
+        currency (Currency): Currency to be converted into
+
+    Returns:
+        dict: The rate, its date and if it's stale, empty if there's no record or
+        it doesn't have the currency
+    """
+    rate = record.rate(currency) if record is not None else None
+    if rate is None:
         return dict()
-    logger.info(
-        "Reading currency conversion data from cache, currency: %s", currency.value
-    )
-    return cache_value.get("data")
+    conversion_result = {"rate": rate, "date": record.day}
+    if record.stale:
+        conversion_result["stale"] = True
+    return conversion_result
 
 
-async def set_conversion_result_to_cache(
-    currency: Currency, raw_conversion_result: dict
-) -> None:
-    """Store currency convert data in cache.
-    Default expiration time is 24 hours.
-    Also store timestamp from the time the cache is created,
-    to later user for cache invalidation.
+async def get_conversion_result_from_cache(
+    currency: Currency, stale: bool = False
+) -> dict:
+    """Conversion data of a currency, from the cached exchange rate table.
+    A single cache read serves all the currencies, see `get_rate_table_from_cache`.
 
     Args:
-        currency (Currency): Used as the key for the key/value store
-        raw_conversion_result (dict): Conversion data provided by a service
+        currency (Currency): Currency to be converted into
+        stale (bool): Return the data even if they're outdated
+
+    Returns:
+        dict: The rate, its date and if it's stale, empty if it isn't cached
     """
+    record = await get_rate_table_from_cache(stale=stale)
+    return conversion_result_of(record, currency)
+
+
+async def set_rate_table_to_cache(
+    rate_table: dict, timestamp: Optional[datetime] = None
+) -> RateRecord:
+    """Store the exchange rate table of all the currencies in cache,
+    as a single compact record (see `RateRecord`), set to expire (`EXPIREAT`)
+    at the midnight (UTC) after the timestamp, along with the last good table,
+    which is kept for `RATE_STALE_TTL` seconds. Both are written in a single
+    transaction.
+    The table is also stored in the in process cache of the worker, until the
+    same midnight.
+
+    Args:
+        rate_table (dict): Exchange rate table provided by a service
+        timestamp (datetime): Time of the cache creation (UTC), defaults to now,
+        a timestamp of the upcoming day keeps the data valid through that day.
+
+    Returns:
+        RateRecord: The cached record of the table
+    """
+
+    now = datetime.utcnow()
+    expires_at = next_utc_midnight(timestamp or now)
+    record = rate_record_of(rate_table, fetched_at=now)
+    local_cache.set(EXCHANGE_RATES_KEY, record, expires_at=expires_at)
+    cache_value = encode_rate_record(record)
+    transaction = redis_cache.transaction()
+    transaction.set(EXCHANGE_RATES_KEY, cache_value)
+    transaction.pexpireat(EXCHANGE_RATES_KEY, epoch_milliseconds(expires_at))
+    transaction.set(LAST_GOOD_RATES_KEY, cache_value, expire=settings.RATE_STALE_TTL)
+    try:
+        await transaction.execute()
+    except aioredis.RedisError:  # pragma: no cover # general exception
+        return record
+    logger.info("New exchange rate table is cached, date: %s", record.day)
+    return record
+
+
+def historical_rate_table(day: str, rates: dict) -> dict:
+    """Exchange rate table of a day, in the format of the service"""
+    return {"base": settings.DEFAULT_CURRENCY, "date": day, "rates": rates}
+
+
+async def get_historical_rate_table_from_cache(day: date) -> Optional[RateRecord]:
+    """Checks for the exchange rate table of a past day.
+    Looked up in the in process cache and then in the Redis hash of the historical
+    rates, historical rates never change so they don't expire.
+
+    Args:
+        day (date): Date of the rates
+
+    Returns:
+        RateRecord: Exchange rates of the day, None if they aren't cached
+    """
+    local_key = (HISTORICAL_RATES_KEY, day)
+    record = local_cache.get(local_key)
+    if record is not None:
+        return record
 
-    timestamp = datetime.utcnow().isoformat()
-    cache_value = json.dumps({"timestamp": timestamp, "data": raw_conversion_result})
     try:
-        await redis_cache.execute(
-            "set", currency.value, cache_value, "ex", twenty_four := 24 * 3600
+        cache_value = await redis_cache.hget(HISTORICAL_RATES_KEY, day.isoformat())
+    except aioredis.RedisError:  # pragma: no cover # general exception
+        return None
+    record = decode_rate_record(cache_value) if cache_value else None
+    if record is not None:
+        local_cache.set(local_key, record, expires_at=datetime.max)
+    return record
+
+
+async def get_historical_conversion_result_from_cache(
+    currency: Currency, day: date
+) -> dict:
+    """Conversion data of a currency on a past day, see
+    `get_historical_rate_table_from_cache`.
+    """
+    record = await get_historical_rate_table_from_cache(day)
+    return conversion_result_of(record, currency)
+
+
+async def set_historical_rates_to_cache(rates_by_date: Dict[str, dict]) -> None:
+    """Store the rates of many days in the Redis hash of the historical rates,
+    as a record per day (see `RateRecord`), with a single write.
+
+    Args:
+        rates_by_date (Dict[str, dict]): Date (ISO format) -> rates of the currencies
+    """
+    if not rates_by_date:
+        return
+    now = datetime.utcnow()
+    mapping = {
+        day: encode_rate_record(
+            rate_record_of(historical_rate_table(day, rates), fetched_at=now)
         )
+        for day, rates in rates_by_date.items()
+    }
+    try:
+        await redis_cache.hset_mapping(HISTORICAL_RATES_KEY, mapping)
     except aioredis.RedisError:  # pragma: no cover # general exception
         return
-    logger.info("New currency convert data is cached, %s", currency.value)
+    logger.info("Historical rates of %s days are cached", len(mapping))
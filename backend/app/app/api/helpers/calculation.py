@@ -1,7 +1,108 @@
-from typing import Tuple
+from typing import Tuple, Union
 
 from app.schemas.conversion import Currency
 
+# Version of the rating rules and arithmetic, part of the ETag of the rating
+# results, must be bumped whenever a change could alter a result
+ENGINE_VERSION = "3"
+
+# Prices and amounts are scaled to integer millionths (micro units), those with
+# up to 6 decimal places are represented exactly. Results are rounded to milli
+# units (cents for the overall), but prices need the finer scale, e.g. a time
+# price of 0.0045 per hour or an energy price of 1.0005 per kWh
+UNIT_SCALE = 10**6
+SECONDS_PER_HOUR = 3600
+WH_PER_KWH = 1000
+# Common denominator of the exact (rational) rates of `calculate_rate`,
+# a rate is its numerator over this denominator
+RATE_DENOMINATOR = SECONDS_PER_HOUR * WH_PER_KWH * UNIT_SCALE
+# Numerator of a price in micro units over `RATE_DENOMINATOR`
+RATE_UNIT = SECONDS_PER_HOUR * WH_PER_KWH
+# Common denominator of the exact converted amounts of `convert_currency`
+CONVERSION_DENOMINATOR = UNIT_SCALE * UNIT_SCALE
+# Steps of the rounding to milli units and to cents, of the energy rates (over
+# Wh * micro units), the time rates (over seconds * micro units), the prices
+# and the amounts (micro units), the rates over `RATE_DENOMINATOR` and the
+# amounts over `CONVERSION_DENOMINATOR`
+ENERGY_MILLI_STEP = WH_PER_KWH * UNIT_SCALE // 1000
+TIME_MILLI_STEP = SECONDS_PER_HOUR * UNIT_SCALE // 1000
+UNIT_MILLI_STEP = UNIT_SCALE // 1000
+RATE_CENT_STEP = RATE_DENOMINATOR // 100
+CONVERSION_MILLI_STEP = CONVERSION_DENOMINATOR // 1000
+CONVERSION_CENT_STEP = CONVERSION_DENOMINATOR // 100
+# Formatted rates below 10 units, by their value in milli units and in cents,
+# so the common rates are formatted with a lookup, and the formatted fractions
+# of the others
+FORMATTED_RATES = 10_000
+FORMATTED_MILLIS = ["%d.%03d" % divmod(value, 1000) for value in range(FORMATTED_RATES)]
+FORMATTED_CENTS = ["%d.%02d" % divmod(value, 100) for value in range(FORMATTED_RATES)]
+MILLI_FRACTIONS = [".%03d" % value for value in range(1000)]
+CENT_FRACTIONS = [".%02d" % value for value in range(100)]
+
+
+def to_units(value: float) -> int:
+    """Scale a non negative price or amount to integer micro units"""
+    return int(value * UNIT_SCALE + 0.5)
+
+
+def format_millis(numerator: int, step: int) -> Union[str, int]:
+    """Format an exact non negative rate, `numerator / (step * 1000)`, rounded
+    half up to 3 decimal places, e.g. `"3.277"`, or as an int if it's a whole
+    number.
+    """
+    value = (numerator + (step >> 1)) // step
+    if value % 1000 == 0 and value * step == numerator:
+        return value // 1000
+    if value < FORMATTED_RATES:
+        return FORMATTED_MILLIS[value]
+    return f"{value // 1000}{MILLI_FRACTIONS[value % 1000]}"
+
+
+def format_cents(numerator: int, step: int) -> Union[str, int]:
+    """Format an exact non negative rate, `numerator / (step * 100)`, rounded
+    half up to 2 decimal places, e.g. `"7.04"`, or as an int if it's a whole
+    number.
+    """
+    value = (numerator + (step >> 1)) // step
+    if value % 100 == 0 and value * step == numerator:
+        return value // 100
+    if value < FORMATTED_RATES:
+        return FORMATTED_CENTS[value]
+    return f"{value // 100}{CENT_FRACTIONS[value % 100]}"
+
+
+def format_fixed(numerator: int, denominator: int, places: int) -> Union[str, int]:
+    """Format an exact non negative rate with the precision of the decimal places,
+    see `format_millis` and `format_cents`.
+
+    Args:
+        numerator (int): Numerator of the rate
+        denominator (int): Denominator of the rate, divisible by 10 ** places
+        places (int): Decimal places, 2 or 3
+
+    Returns:
+        [str, int]: Formatted rate
+    """
+    if places == 2:
+        return format_cents(numerator, denominator // 100)
+    return format_millis(numerator, denominator // 1000)
+
+
+def rate_numerators(
+    total_seconds: int,
+    total_wh: int,
+    energy_units: int,
+    time_units: int,
+    transaction_units: int,
+) -> Tuple[int, int, int, int]:
+    """Exact overall, energy, time and transaction rates, as numerators over
+    `RATE_DENOMINATOR`. Prices are in micro units, see `to_units`.
+    """
+    energy = total_wh * energy_units * SECONDS_PER_HOUR
+    time = total_seconds * time_units * WH_PER_KWH
+    transaction = transaction_units * RATE_UNIT
+    return energy + time + transaction, energy, time, transaction
+
 
 async def calculate_rate(
     total_seconds: int,
@@ -9,9 +110,10 @@ async def calculate_rate(
     energy_rate: float,
     time_rate: float,
     transaction_rate: float,
-) -> Tuple[int, float]:
+) -> Tuple[Union[str, int], ...]:
     """Calculate rate based on the price metrics and consumption metrics,
     Format price rates by precision of x decimal places based on the requirement.
+    Rates are calculated in fixed point, exactly, and rounded half up.
 
     Args:
         total_seconds (int): Total time consumed in seconds
@@ -23,45 +125,50 @@ async def calculate_rate(
     Returns:
         [str]: Calculated and formatted rates
     """
-    energy = total_kwh * energy_rate
-    time = (total_seconds / 3600) * time_rate
-    overall = energy + time + transaction_rate
-
-    # Precision of 3 decimal places for the prices
-    # Additional check for if the float value is a whole number
-    energy, time, transaction = map(
-        lambda rate: "{0:0.3f}".format(rate)
-        if not float(rate).is_integer()
-        else int(rate),
-        [energy, time, transaction_rate],
-    )
+    # Exact rates, each over the denominator of its own rounding step (see
+    # `rate_numerators` for a common one), `to_units` is inlined on the hot path
+    energy = int(total_kwh * WH_PER_KWH + 0.5) * int(energy_rate * UNIT_SCALE + 0.5)
+    time = total_seconds * int(time_rate * UNIT_SCALE + 0.5)
+    transaction = int(transaction_rate * UNIT_SCALE + 0.5)
     # Precision of 2 decimal places for the overall value
-    overall = "{0:0.2f}".format(overall) if not overall.is_integer() else int(overall)
+    overall = format_cents(
+        energy * SECONDS_PER_HOUR + time * WH_PER_KWH + transaction * RATE_UNIT,
+        RATE_CENT_STEP,
+    )
+    # Precision of 3 decimal places for the prices
+    # Additional check for if the value is a whole number
+    energy = format_millis(energy, ENERGY_MILLI_STEP)
+    time = format_millis(time, TIME_MILLI_STEP)
+    transaction = format_millis(transaction, UNIT_MILLI_STEP)
     return overall, energy, time, transaction
 
 
 async def convert_currency(
-    raw_conversion_result: dict,
+    conversion_result: dict,
     overall: float,
     currency: Currency,
     energy: float,
     time: float,
     transaction: float,
 ) -> dict:
-    conversaion_rate = raw_conversion_result.get("info").get("rate")
-    overall, converted_energy, converted_time, converted_transaction = map(
-        lambda rate: rate * conversaion_rate, [overall, energy, time, transaction]
-    )
-    overall = "{0:0.2f}".format(overall) if not overall.is_integer() else overall
-    energy, time, transaction = map(
-        lambda rate: "{0:0.3f}".format(rate)
-        if not float(rate).is_integer()
-        else int(rate),
-        [converted_energy, converted_time, converted_transaction],
-    )
+    # Amounts in micro units, see `to_units`, inlined on the hot path
+    conversion_units = int(conversion_result["rate"] * UNIT_SCALE + 0.5)
+    overall = int(overall * UNIT_SCALE + 0.5) * conversion_units
+    if overall % CONVERSION_DENOMINATOR:
+        overall = format_cents(overall, CONVERSION_CENT_STEP)
+    else:
+        overall = float(overall // CONVERSION_DENOMINATOR)
+    energy = int(energy * UNIT_SCALE + 0.5) * conversion_units
+    time = int(time * UNIT_SCALE + 0.5) * conversion_units
+    transaction = int(transaction * UNIT_SCALE + 0.5) * conversion_units
+    energy = format_millis(energy, CONVERSION_MILLI_STEP)
+    time = format_millis(time, CONVERSION_MILLI_STEP)
+    transaction = format_millis(transaction, CONVERSION_MILLI_STEP)
     response = {
         "overall": overall,
         "components": {"energy": energy, "time": time, "transaction": transaction},
         "currency": currency,
     }
+    if conversion_result.get("stale"):
+        response["stale"] = True
     return response
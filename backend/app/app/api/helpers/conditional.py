@@ -0,0 +1,78 @@
+import json
+from datetime import date
+from hashlib import sha256
+from typing import Optional
+from urllib.parse import urlencode
+
+from app.api.helpers.calculation import ENGINE_VERSION
+from app.schemas.conversion import Currency
+from app.schemas.rate import CDR, Rate
+
+
+def canonical_rate_query(rate: Rate, cdr: CDR) -> str:
+    """Canonical query string of a rating request.
+    Parameters are sorted by name and their values are encoded after parsing,
+    so equivalent requests (e.g. `time=2` and `time=2.0`, in any order) share it.
+    The windows and tiers of a tariff are encoded as compact JSON.
+
+    Args:
+        rate (Rate): Rate components
+        cdr (CDR): CDR components
+
+    Returns:
+        str: URL encoded query string
+    """
+    parameters = {
+        name: (
+            json.dumps(value, default=str, separators=(",", ":"))
+            if isinstance(value, list)
+            else value
+        )
+        for name, value in {**rate.dict(), **cdr.dict()}.items()
+    }
+    return urlencode(sorted(parameters.items()))
+
+
+def canonical_conversion_query(
+    overall: float,
+    energy: float,
+    time: float,
+    transaction: float,
+    currency: Currency,
+    day: date,
+) -> str:
+    """Canonical query string of a currency conversion request, see
+    `canonical_rate_query`. `day` is the date of the exchange rates.
+    """
+    return urlencode(
+        sorted(
+            {
+                "overall": overall,
+                "energy": energy,
+                "time": time,
+                "transaction": transaction,
+                "currency": currency.value,
+                "date": day.isoformat(),
+            }.items()
+        )
+    )
+
+
+def rate_etag(canonical_query: str) -> str:
+    """Strong entity tag of a rating result, derived from its canonical input and
+    the version of the rating engine, so it's known without rating the CDR.
+    """
+    digest = sha256(f"{ENGINE_VERSION}:{canonical_query}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an `If-None-Match` header matches an entity tag.
+    Uses the weak comparison, as required for `If-None-Match` (RFC 7232).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
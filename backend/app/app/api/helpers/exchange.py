@@ -0,0 +1,336 @@
+import asyncio
+import contextlib
+import time
+from datetime import date, timedelta
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from uuid import uuid4
+
+import aiohttp
+import aioredis
+
+from app.api.helpers.cache import (
+    EXCHANGE_RATES_KEY,
+    HISTORICAL_RATES_KEY,
+    conversion_result_of,
+    get_rate_table_from_cache,
+    historical_rate_table,
+    set_historical_rates_to_cache,
+    set_rate_table_to_cache,
+)
+from app.api.helpers.records import RateRecord, rate_record_of
+from app.core.config import settings
+from app.core.connections import http_client, redis_cache
+from app.core.metrics import upstream_failures
+from app.schemas.conversion import Currency
+
+logger = getLogger(__name__)
+
+# Endpoints of the exchange rate service, relative to `EXCHANGE_API_URL`
+EXCHANGE_API = "{0}/latest?base={1}&symbols={2}"
+HISTORICAL_API = "{0}/{1}?base={2}&symbols={3}"
+TIMESERIES_API = "{0}/timeseries?start_date={1}&end_date={2}&base={3}&symbols={4}"
+# Max number of days of a time series request
+TIMESERIES_MAX_DAYS = 365
+EXCHANGE_LOCK_KEY = f"lock:{EXCHANGE_RATES_KEY}"
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single call,
+    every caller gets the result (or the exception) of that call.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+
+    def start(self, key: Hashable, function: Callable[[], Awaitable]) -> asyncio.Future:
+        """Start the call for the key, unless it's in flight already"""
+        future = self._futures.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(function())
+            self._futures[key] = future
+            future.add_done_callback(lambda _: self._futures.pop(key, None))
+        else:
+            self.coalesced += 1
+        return future
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable]) -> Any:
+        # A cancelled caller shouldn't cancel the call for the others
+        return await asyncio.shield(self.start(key, function))
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._futures
+
+
+class CircuitBreaker:
+    """Fails calls fast while a service is failing.
+
+    The circuit opens after `threshold` consecutive failures, and while it's open
+    calls are rejected without calling the service. After `reset_timeout` seconds
+    a single trial call is let through (half open), its success closes the circuit
+    and its failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Whether a call is allowed, call `record` with the outcome of the call"""
+        if self.state == self.CLOSED:
+            return True
+        if (
+            self.state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self.state = self.HALF_OPEN
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, success: bool) -> None:
+        if success:
+            self.state = self.CLOSED
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                logger.warning("Exchange rate service circuit is open")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class FetchStats:
+    """Counters of the exchange rate fetches"""
+
+    def __init__(self):
+        # Requests sent to the exchange rate service
+        self.fetches = 0
+        # Fetches collapsed into the fetch of another worker
+        self.remote_coalesced = 0
+
+    @property
+    def coalesced(self) -> int:
+        """All the fetches collapsed into another one, within and across workers"""
+        return single_flight.coalesced + self.remote_coalesced
+
+
+single_flight = SingleFlight()
+fetch_stats = FetchStats()
+circuit_breaker = CircuitBreaker(
+    threshold=settings.CIRCUIT_BREAKER_THRESHOLD,
+    reset_timeout=settings.CIRCUIT_BREAKER_RESET_TIMEOUT,
+)
+
+
+async def request_rates(url: str, timeout: float = 2) -> dict:
+    """Request exchange rates from the exchange rate service.
+    While the service is failing, fails fast without a request, see `CircuitBreaker`.
+
+    Returns:
+        dict: Raw response of the service, empty if the service isn't available
+    """
+    if not circuit_breaker.allow():
+        upstream_failures.inc(reason="circuit_open")
+        return dict()
+    fetch_stats.fetches += 1
+    result = dict()
+    # Suppress exceptions (better alternative for try/except/pass)
+    with contextlib.suppress(aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        async with http_client.get(url, timeout=timeout) as rates_response:
+            result = await rates_response.json()
+    if not (result and result.get("success") and result.get("rates")):
+        upstream_failures.inc(reason="error")
+        circuit_breaker.record(success=False)
+        return dict()
+    circuit_breaker.record(success=True)
+    return result
+
+
+def currency_symbols() -> str:
+    return ",".join(currency.value for currency in Currency)
+
+
+async def request_rate_table() -> dict:
+    """Request the latest exchange rates of all the currencies from the exchange
+    rate service, with a single request.
+
+    Returns:
+        dict: Raw exchange rate table, empty if the service isn't available
+    """
+    return await request_rates(
+        EXCHANGE_API.format(
+            settings.EXCHANGE_API_URL, settings.DEFAULT_CURRENCY, currency_symbols()
+        )
+    )
+
+
+async def request_historical_rate_table(day: date) -> dict:
+    """Request the exchange rates of all the currencies on a past day.
+
+    Returns:
+        dict: Raw exchange rate table, empty if the service isn't available
+    """
+    return await request_rates(
+        HISTORICAL_API.format(
+            settings.EXCHANGE_API_URL,
+            day.isoformat(),
+            settings.DEFAULT_CURRENCY,
+            currency_symbols(),
+        )
+    )
+
+
+async def request_timeseries(start: date, end: date) -> dict:
+    """Request the daily exchange rates of all the currencies within a date range
+    (inclusive), of at most `TIMESERIES_MAX_DAYS` days.
+
+    Returns:
+        dict: Raw time series, empty if the service isn't available
+    """
+    return await request_rates(
+        TIMESERIES_API.format(
+            settings.EXCHANGE_API_URL,
+            start.isoformat(),
+            end.isoformat(),
+            settings.DEFAULT_CURRENCY,
+            currency_symbols(),
+        ),
+        timeout=30,
+    )
+
+
+async def fetch_and_cache() -> Optional[RateRecord]:
+    rate_table = await request_rate_table()
+    if not rate_table:
+        return None
+    return await set_rate_table_to_cache(rate_table=rate_table)
+
+
+async def fetch_with_lock() -> Optional[RateRecord]:
+    """Fetch the exchange rate table while holding the lock of the table,
+    or if another worker holds it, wait for that worker to cache the table.
+    """
+    token = uuid4().hex
+    try:
+        locked = await redis_cache.acquire_lock(
+            EXCHANGE_LOCK_KEY,
+            token,
+            timeout_ms=int(settings.EXCHANGE_LOCK_TIMEOUT * 1000),
+        )
+    except aioredis.RedisError:  # pragma: no cover # general exception
+        return await fetch_and_cache()
+
+    if locked:
+        try:
+            return await fetch_and_cache()
+        finally:
+            with contextlib.suppress(aioredis.RedisError):
+                await redis_cache.release_lock(EXCHANGE_LOCK_KEY, token)
+
+    fetch_stats.remote_coalesced += 1
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + settings.EXCHANGE_LOCK_TIMEOUT
+    with contextlib.suppress(aioredis.RedisError):
+        while loop.time() < deadline:
+            await asyncio.sleep(settings.EXCHANGE_LOCK_POLL_INTERVAL)
+            record = await get_rate_table_from_cache()
+            if record is not None:
+                return record
+            # Released without caching a table, the service isn't available
+            if not await redis_cache.exists(EXCHANGE_LOCK_KEY):
+                break
+    return None
+
+
+async def fetch_rate_table() -> Optional[RateRecord]:
+    """Fetch the exchange rate table from the exchange rate service and cache it.
+
+    Only a single fetch is in flight at a time, concurrent callers of the same
+    worker share the fetch of the first caller (single flight), and other workers
+    wait for it to be cached, using a lock in Redis.
+
+    Returns:
+        RateRecord: Exchange rates, None if the service isn't available
+    """
+    return await single_flight.do(EXCHANGE_RATES_KEY, fetch_with_lock)
+
+
+def revalidate_rate_table() -> None:
+    """Fetch the exchange rate table in the background, unless it's being fetched
+    already, so outdated (stale) data can be served in the meantime.
+    """
+    if not single_flight.in_flight(EXCHANGE_RATES_KEY):
+        single_flight.start(EXCHANGE_RATES_KEY, fetch_with_lock)
+
+
+async def fetch_conversion_result(currency: Currency) -> dict:
+    """Fetch the conversion data of a currency, see `fetch_rate_table`.
+
+    Args:
+        currency (Currency): Currency to be converted into
+
+    Returns:
+        dict: The rate and its date, empty if the service isn't available
+    """
+    return conversion_result_of(await fetch_rate_table(), currency)
+
+
+async def fetch_and_cache_historical(day: date) -> Optional[RateRecord]:
+    rate_table = await request_historical_rate_table(day)
+    if not rate_table:
+        return None
+    await set_historical_rates_to_cache({day.isoformat(): rate_table["rates"]})
+    return rate_record_of(historical_rate_table(day.isoformat(), rate_table["rates"]))
+
+
+async def fetch_historical_conversion_result(currency: Currency, day: date) -> dict:
+    """Fetch the conversion data of a currency on a past day and cache the rates
+    of all the currencies on that day.
+    Concurrent fetches of the same day are coalesced into a single request.
+
+    Args:
+        currency (Currency): Currency to be converted into
+        day (date): Date of the rate
+
+    Returns:
+        dict: The rate and its date, empty if the service isn't available
+    """
+    record = await single_flight.do(
+        (HISTORICAL_RATES_KEY, day), lambda: fetch_and_cache_historical(day)
+    )
+    return conversion_result_of(record, currency)
+
+
+async def preload_historical_rates(start: date, end: date) -> int:
+    """Fetch and cache the rates of all the currencies for every day within a date
+    range (inclusive), with a request and a cache write per `TIMESERIES_MAX_DAYS`.
+
+    Args:
+        start (date): First day of the range
+        end (date): Last day of the range
+
+    Returns:
+        int: Number of days cached
+    """
+    days = 0
+    while start <= end:
+        window_end = min(end, start + timedelta(days=TIMESERIES_MAX_DAYS - 1))
+        timeseries = await request_timeseries(start, window_end)
+        if not timeseries:
+            logger.warning("Couldn't preload rates from %s to %s", start, window_end)
+        else:
+            await set_historical_rates_to_cache(timeseries["rates"])
+            days += len(timeseries["rates"])
+        start = window_end + timedelta(days=1)
+    return days
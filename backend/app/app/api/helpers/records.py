@@ -0,0 +1,81 @@
+import math
+import struct
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional, Tuple
+
+from app.core.connections import EPOCH, epoch_milliseconds
+from app.schemas.conversion import Currency
+
+# Version of the layout of the records, the first byte of a record
+RECORD_VERSION = 1
+# Currencies of the rate slots of a record, in order. Only ever appended to,
+# records with fewer slots are still read (without the rates of the new ones)
+RECORD_CURRENCIES: Tuple[str, ...] = ("EUR", "USD", "GBP", "JPY", "CAD")
+# Version, date of the rates (proleptic ordinal), fetch time (Unix time in
+# milliseconds) and the number of rate slots which follow
+HEADER = struct.Struct("<BIqB")
+RATE = struct.Struct("<d")
+SLOTS = {code: slot for slot, code in enumerate(RECORD_CURRENCIES)}
+
+
+class RateRecord(NamedTuple):
+    """Exchange rates of all the currencies on a day, as cached.
+    Holds only what the conversions need: a rate per currency slot (NaN if the
+    service didn't have it), the date of the rates and when they were fetched.
+    """
+
+    day: str
+    fetched_at: datetime
+    rates: Tuple[float, ...]
+    stale: bool = False
+
+    def rate(self, currency: Currency) -> Optional[float]:
+        slot = SLOTS.get(currency.value)
+        if slot is None or slot >= len(self.rates):
+            return None
+        rate = self.rates[slot]
+        return None if math.isnan(rate) else rate
+
+
+def rate_record_of(
+    rate_table: dict, fetched_at: Optional[datetime] = None
+) -> RateRecord:
+    """Record of an exchange rate table of the service, e.g. its latest rates
+
+    Args:
+        rate_table (dict): Exchange rate table, with the `rates` of the currencies
+        against its `base` and their `date`
+        fetched_at (datetime): Time of the request (UTC), defaults to now
+    """
+    rates = {**rate_table.get("rates", {}), rate_table.get("base"): 1}
+    return RateRecord(
+        day=rate_table["date"],
+        fetched_at=fetched_at or datetime.utcnow(),
+        rates=tuple(float(rates.get(code, math.nan)) for code in RECORD_CURRENCIES),
+    )
+
+
+def encode_rate_record(record: RateRecord) -> bytes:
+    """Pack a record in a few dozen bytes, see `HEADER`"""
+    return HEADER.pack(
+        RECORD_VERSION,
+        date.fromisoformat(record.day).toordinal(),
+        epoch_milliseconds(record.fetched_at),
+        len(record.rates),
+    ) + struct.pack(f"<{len(record.rates)}d", *record.rates)
+
+
+def decode_rate_record(data: bytes) -> Optional[RateRecord]:
+    """Unpack a record, None if it isn't a record of the current version,
+    e.g. one cached in an earlier format.
+    """
+    if len(data) < HEADER.size or data[0] != RECORD_VERSION:
+        return None
+    _, ordinal, fetched_at, slots = HEADER.unpack_from(data)
+    if len(data) != HEADER.size + slots * RATE.size:
+        return None
+    return RateRecord(
+        day=date.fromordinal(ordinal).isoformat(),
+        fetched_at=EPOCH + timedelta(milliseconds=fetched_at),
+        rates=struct.unpack_from(f"<{slots}d", data, HEADER.size),
+    )
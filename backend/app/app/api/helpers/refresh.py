@@ -0,0 +1,145 @@
+import asyncio
+import contextlib
+import random
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import Optional
+from uuid import uuid4
+
+import aioredis
+
+from app.api.helpers import exchange
+from app.api.helpers.cache import (
+    get_rate_table_from_cache,
+    next_utc_midnight,
+    set_rate_table_to_cache,
+)
+from app.core.config import settings
+from app.core.connections import redis_cache
+
+logger = getLogger(__name__)
+
+REFRESHER_LOCK_KEY = "lock:rate-refresher:{0}"
+# Max seconds between the retries of a failed refresh
+MAX_RETRY_INTERVAL = 300
+
+
+class RateRefresher:
+    """Background task which refreshes the cached exchange rate table of all the
+    currencies right after it expires at midnight (UTC), so requests don't have
+    to wait for the exchange rate service once the cache rolled over. Until the
+    table is refreshed, requests are served the last good table, flagged as
+    stale, and revalidate it in the background.
+
+    Rates are only fetched once the day started, the table of the new day
+    expires at the next midnight, like any table cached that day.
+
+    Every worker runs the task, but at each refresh only a single worker in the
+    stack (the leader) fetches the rates at a time, see `refresh`. A failed
+    refresh is retried until the table of the day is cached.
+    """
+
+    def __init__(self, jitter: float, retry_interval: float):
+        # Max random delay of the refresh, spreads the workers' attempts
+        self.jitter = jitter
+        # Seconds before a failed refresh is retried, doubled on each failure
+        # up to `MAX_RETRY_INTERVAL`
+        self.retry_interval = retry_interval
+        self.refreshes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def next_run(self, now: datetime) -> datetime:
+        """Time of the next refresh, within the jitter after the next midnight"""
+        return next_utc_midnight(now) + timedelta(
+            seconds=random.uniform(0, self.jitter)
+        )
+
+    async def refresh(self, midnight: datetime) -> bool:
+        """Fetch and cache the rate table of all the currencies for the day starting
+        at midnight, unless it's cached already, if this worker is elected as the
+        leader. The leader is the worker which acquires the lock of the refresh,
+        which is released once the table is cached or the fetch failed.
+
+        Args:
+            midnight (datetime): Start of the day the rates are cached for
+
+        Returns:
+            bool: Whether the rate table of the day is cached, by any worker
+        """
+        if await self.refreshed(midnight):
+            return True
+        lock_key = REFRESHER_LOCK_KEY.format(midnight.date().isoformat())
+        token = uuid4().hex
+        try:
+            leader = await redis_cache.acquire_lock(
+                lock_key,
+                token,
+                timeout_ms=int(settings.EXCHANGE_LOCK_TIMEOUT * 1000),
+            )
+        except aioredis.RedisError:  # pragma: no cover # general exception
+            return False
+        if not leader:
+            return False
+
+        try:
+            # Cached by another worker (or a request) since the check above
+            if await self.refreshed(midnight):
+                return True
+            rate_table = await exchange.request_rate_table()
+            if not rate_table:
+                logger.warning("Couldn't refresh the exchange rate table")
+                return False
+            await set_rate_table_to_cache(rate_table=rate_table)
+        finally:
+            with contextlib.suppress(aioredis.RedisError):
+                await redis_cache.release_lock(lock_key, token)
+        self.refreshes += 1
+        logger.info("Exchange rate table is refreshed for %s", midnight.date())
+        return True
+
+    @staticmethod
+    async def refreshed(midnight: datetime) -> bool:
+        """Whether the cached rate table was fetched since midnight"""
+        record = await get_rate_table_from_cache()
+        return record is not None and record.fetched_at >= midnight
+
+    async def refresh_until_cached(self, midnight: datetime) -> None:
+        """Refresh the rate table of the day, retrying while it fails"""
+        retry_interval = self.retry_interval
+        while True:
+            try:
+                if await self.refresh(midnight):
+                    return
+            except Exception:  # pragma: no cover # keep the task running
+                logger.exception("Refreshing the exchange rate table failed")
+            # Past the day, the refresh of the next one takes over
+            if next_utc_midnight(midnight) <= datetime.utcnow() + timedelta(
+                seconds=retry_interval
+            ):
+                return
+            await asyncio.sleep(retry_interval)
+            retry_interval = min(retry_interval * 2, MAX_RETRY_INTERVAL)
+
+    async def run(self) -> None:
+        while True:
+            now = datetime.utcnow()
+            run_at = self.next_run(now)
+            await asyncio.sleep((run_at - now).total_seconds())
+            await self.refresh_until_cached(midnight=next_utc_midnight(now))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+rate_refresher = RateRefresher(
+    jitter=settings.RATE_REFRESH_JITTER,
+    retry_interval=settings.RATE_REFRESH_RETRY_INTERVAL,
+)
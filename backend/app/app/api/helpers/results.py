@@ -0,0 +1,111 @@
+import json
+from datetime import datetime, timedelta
+from hashlib import sha256
+from logging import getLogger
+from typing import Optional
+
+import aioredis
+from fastapi.encoders import jsonable_encoder
+
+from app.api.helpers.cache import LocalCache
+from app.api.helpers.calculation import ENGINE_VERSION
+from app.core.config import settings
+from app.core.connections import redis_cache
+
+logger = getLogger(__name__)
+
+# Versioned by the format of the values, results are stored without an envelope
+# since Redis expires them
+RESULTS_KEY = "results:2:{0}"
+
+
+def result_key(kind: str, canonical_query: str) -> str:
+    """Key of a memoized result, a hash of the canonical input of an API and
+    the version of the rating engine.
+
+    Args:
+        kind (str): Name of the API, e.g. `rate` or `conversion`
+        canonical_query (str): Canonical (normalized) input of the request
+
+    Returns:
+        str: Hex digest
+    """
+    return sha256(f"{kind}:{ENGINE_VERSION}:{canonical_query}".encode()).hexdigest()
+
+
+class ResultCache:
+    """Memoized API results, keyed by `result_key`.
+    Results are looked up in a bounded in process LRU cache (L1) and then in Redis
+    (L2), which is shared between the workers.
+    Results are stored as the dicts returned by the APIs, so a cached result is
+    serialized exactly like a freshly computed one.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.local = LocalCache(max_size=max_size)
+        # Seconds a result is kept, unless it expires earlier
+        self.ttl = ttl
+        self.redis_hits = 0
+        self.misses = 0
+
+    @property
+    def hits(self) -> int:
+        return self.local.hits + self.redis_hits
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "local_hits": self.local.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "size": len(self.local),
+        }
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Return the memoized result of the key, or None if it isn't cached"""
+        result = self.local.get(key)
+        if result is not None:
+            return result
+
+        try:
+            cache_value, ttl = await redis_cache.get_with_ttl(RESULTS_KEY.format(key))
+        except aioredis.RedisError:  # pragma: no cover # general exception
+            cache_value = None
+        if cache_value is not None:
+            self.redis_hits += 1
+            result = json.loads(cache_value)
+            # Kept in process for the time Redis keeps it
+            ttl = timedelta(milliseconds=ttl) if ttl > 0 else timedelta(0)
+            self.local.set(key, result, expires_at=datetime.utcnow() + ttl)
+            return result
+        self.misses += 1
+        return None
+
+    async def set(
+        self, key: str, result: dict, expires_at: Optional[datetime] = None
+    ) -> None:
+        """Memoize a result, for `ttl` seconds or until it expires (UTC)"""
+        now = datetime.utcnow()
+        expires_at = min(expires_at or datetime.max, now + timedelta(seconds=self.ttl))
+        self.local.set(key, result, expires_at=expires_at)
+        cache_value = json.dumps(jsonable_encoder(result), separators=(",", ":"))
+        try:
+            await redis_cache.set_expire_at(
+                RESULTS_KEY.format(key), cache_value, expires_at
+            )
+        except aioredis.RedisError:  # pragma: no cover # general exception
+            return
+
+    def clear(self) -> None:
+        """Clear the in process cache"""
+        self.local.clear()
+
+
+result_cache = ResultCache(
+    max_size=settings.RESULT_CACHE_MAX_SIZE, ttl=settings.RESULT_CACHE_TTL
+)
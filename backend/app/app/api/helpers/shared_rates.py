@@ -0,0 +1,218 @@
+import asyncio
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+from logging import getLogger
+from typing import Optional, Tuple
+
+from app.api.helpers import exchange
+from app.api.helpers.cache import (
+    conversion_result_of,
+    get_rate_table_from_cache,
+    next_utc_midnight,
+)
+from app.api.helpers.records import RateRecord, decode_rate_record, encode_rate_record
+from app.core.config import settings
+from app.core.connections import epoch_milliseconds
+from app.schemas.conversion import Currency
+
+logger = getLogger(__name__)
+
+# Version of the layout of the shared file
+LAYOUT_VERSION = 1
+# Sequence number (odd while being written), layout version, expiration of the
+# record (Unix time in milliseconds) and the length of the record which follows
+HEADER = struct.Struct("<QIqI")
+SEQUENCE = struct.Struct("<Q")
+# Size of the shared file, room for a record of a few dozen currencies
+SIZE = 512
+# Reads retried while the record is being written, before falling back
+READ_RETRIES = 8
+
+
+class SharedRateTable:
+    """Exchange rate record of the current day, shared by the workers of a node
+    through a memory mapped file (e.g. in `/dev/shm`), so the workers don't ask
+    Redis for the same rates one by one.
+
+    A single worker of the node, the writer, fills the table from the cache (or
+    from the exchange rate service if it isn't cached), see `fill`. The writer
+    is the worker which holds the `flock` of the lock file, so the next worker to
+    try takes over if it exits. The others only read the table.
+
+    Reads are lock free, with a seqlock: the writer makes the sequence number odd
+    before it changes the record and even again once it's done, and a reader
+    retries if the sequence number was odd or changed while it copied the record.
+    A read is a few loads from the mapped memory, without system calls, and the
+    decoded record is reused until the sequence number changes.
+    A record is only served until its expiration (the next midnight, UTC), after
+    that the readers fall back to the Redis cache until the writer fills the
+    table again.
+    """
+
+    def __init__(self, path: Optional[str], interval: float):
+        self.path = path
+        # Seconds between the attempts to become the writer and to fill the table
+        self.interval = interval
+        self.reads = 0
+        self.misses = 0
+        self.retries = 0
+        self.writes = 0
+        self._map: Optional[mmap.mmap] = None
+        self._lock_file = None
+        self._written: Optional[Tuple[RateRecord, int]] = None
+        # Decoded record of the last sequence number read and its expiration
+        self._sequence = -1
+        self._record: Optional[RateRecord] = None
+        self._expires_at = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def writer(self) -> bool:
+        return self._lock_file is not None
+
+    def open(self) -> None:
+        """Map the shared file, creating it if it doesn't exist"""
+        if self._map is not None:
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < SIZE:
+                os.ftruncate(fd, SIZE)
+            self._map = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        self.resign()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def elect(self) -> bool:
+        """Become the writer of the node, unless another worker is"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info("Writing the shared exchange rate table of the node")
+        return True
+
+    def resign(self) -> None:
+        if self._lock_file is not None:
+            # Closing the file releases the lock
+            self._lock_file.close()
+            self._lock_file = None
+
+    def write(self, record: RateRecord, expires_at: datetime) -> None:
+        """Publish a record, only called by the writer"""
+        data = encode_rate_record(record)
+        (sequence,) = SEQUENCE.unpack_from(self._map, 0)
+        # Odd from here on, if the last write was interrupted it's odd already
+        sequence = sequence + 1 if sequence % 2 == 0 else sequence
+        SEQUENCE.pack_into(self._map, 0, sequence)
+        self._map[HEADER.size : HEADER.size + len(data)] = data
+        HEADER.pack_into(
+            self._map,
+            0,
+            sequence,
+            LAYOUT_VERSION,
+            epoch_milliseconds(expires_at),
+            len(data),
+        )
+        SEQUENCE.pack_into(self._map, 0, sequence + 1)
+        self.writes += 1
+
+    def read(self) -> Optional[RateRecord]:
+        """The shared record, None if there's none or it expired"""
+        if self._map is None:
+            return None
+        self.reads += 1
+        for _ in range(READ_RETRIES):
+            (sequence,) = SEQUENCE.unpack_from(self._map, 0)
+            if sequence == self._sequence:
+                break
+            if sequence % 2:
+                self.retries += 1
+                continue
+            _, version, expires_at, length = HEADER.unpack_from(self._map, 0)
+            data = self._map[HEADER.size : HEADER.size + length]
+            if SEQUENCE.unpack_from(self._map, 0)[0] != sequence:
+                self.retries += 1
+                continue
+            record = None
+            if version == LAYOUT_VERSION and length:
+                record = decode_rate_record(data)
+            self._sequence, self._record, self._expires_at = (
+                sequence,
+                record,
+                expires_at,
+            )
+            break
+        else:
+            self.misses += 1
+            return None
+        if self._record is None or time.time() * 1000 >= self._expires_at:
+            self.misses += 1
+            return None
+        return self._record
+
+    def conversion_result(self, currency: Currency) -> dict:
+        """Conversion data of a currency, empty if the table can't serve it"""
+        return conversion_result_of(self.read(), currency)
+
+    async def fill(self) -> bool:
+        """Write the current record of the cache (or of the exchange rate service)
+        to the table, if it changed.
+
+        Returns:
+            bool: Whether the table was written
+        """
+        record = await get_rate_table_from_cache()
+        if record is None:
+            record = await exchange.fetch_rate_table()
+        if record is None:
+            return False
+        expires_at = next_utc_midnight(datetime.utcnow())
+        written = (record, epoch_milliseconds(expires_at))
+        if written == self._written:
+            return False
+        self.write(record, expires_at=expires_at)
+        self._written = written
+        return True
+
+    async def run(self) -> None:
+        while True:
+            try:
+                if self.elect():
+                    await self.fill()
+            except Exception:  # pragma: no cover # keep the task running
+                logger.exception("Filling the shared exchange rate table failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None and self.path:
+            self.open()
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self.close()
+
+
+shared_rates = SharedRateTable(
+    path=settings.SHARED_RATES_PATH, interval=settings.SHARED_RATES_INTERVAL
+)
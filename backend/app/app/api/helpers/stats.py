@@ -0,0 +1,152 @@
+from typing import Iterator
+
+from app.api.helpers.cache import LocalCache, local_cache
+from app.api.helpers.exchange import circuit_breaker, fetch_stats, single_flight
+from app.api.helpers.refresh import rate_refresher
+from app.api.helpers.results import result_cache
+from app.api.helpers.shared_rates import shared_rates
+from app.api.helpers.tariffs import tariff_registry
+from app.core.connections import http_client
+from app.core.metrics import Sample
+from app.core.rate_limit import rate_limiter
+
+CACHE_LOOKUPS = "rating_cache_lookups_total"
+CACHE_LOOKUPS_HELP = "Cache lookups by their result"
+
+
+def local_cache_samples(cache: LocalCache, name: str) -> Iterator[Sample]:
+    for result, value in (("hit", cache.hits), ("miss", cache.misses)):
+        yield Sample(
+            CACHE_LOOKUPS,
+            "counter",
+            CACHE_LOOKUPS_HELP,
+            {"cache": name, "result": result},
+            value,
+        )
+    yield Sample(
+        "rating_cache_evictions_total",
+        "counter",
+        "Cache entries evicted to make room for new ones",
+        {"cache": name},
+        cache.evictions,
+    )
+    yield Sample(
+        "rating_cache_entries",
+        "gauge",
+        "Entries of the caches",
+        {"cache": name},
+        len(cache),
+    )
+
+
+def collect_stats() -> Iterator[Sample]:
+    """Read the counters kept by the components of the worker, see
+    `MetricsRegistry.register_collector`.
+    """
+    yield from local_cache_samples(local_cache, "exchange_rates")
+    yield from local_cache_samples(result_cache.local, "results")
+    yield from local_cache_samples(tariff_registry.compiled, "tariffs")
+    # Results missed in process and found in Redis
+    yield Sample(
+        CACHE_LOOKUPS,
+        "counter",
+        CACHE_LOOKUPS_HELP,
+        {"cache": "results_redis", "result": "hit"},
+        result_cache.redis_hits,
+    )
+    yield Sample(
+        CACHE_LOOKUPS,
+        "counter",
+        CACHE_LOOKUPS_HELP,
+        {"cache": "results_redis", "result": "miss"},
+        result_cache.misses,
+    )
+
+    yield Sample(
+        "rating_upstream_requests_total",
+        "counter",
+        "Requests sent to the exchange rate service",
+        {},
+        fetch_stats.fetches,
+    )
+    yield Sample(
+        "rating_upstream_coalesced_total",
+        "counter",
+        "Exchange rate fetches coalesced into another one",
+        {"scope": "worker"},
+        single_flight.coalesced,
+    )
+    yield Sample(
+        "rating_upstream_coalesced_total",
+        "counter",
+        "Exchange rate fetches coalesced into another one",
+        {"scope": "stack"},
+        fetch_stats.remote_coalesced,
+    )
+    yield Sample(
+        "rating_circuit_breaker_open",
+        "gauge",
+        "Workers whose exchange rate service circuit isn't closed",
+        {},
+        int(circuit_breaker.state != circuit_breaker.CLOSED),
+    )
+    yield Sample(
+        "rating_rate_refreshes_total",
+        "counter",
+        "Exchange rate tables refreshed after their expiry at midnight",
+        {},
+        rate_refresher.refreshes,
+    )
+
+    for result, value in (
+        ("hit", shared_rates.reads - shared_rates.misses),
+        ("miss", shared_rates.misses),
+    ):
+        yield Sample(
+            CACHE_LOOKUPS,
+            "counter",
+            CACHE_LOOKUPS_HELP,
+            {"cache": "shared_rates", "result": result},
+            value,
+        )
+    yield Sample(
+        "rating_shared_rates_writer",
+        "gauge",
+        "Workers writing the shared exchange rate table of their node",
+        {},
+        int(shared_rates.writer),
+    )
+
+    for tenant, value in rate_limiter.rejected.items():
+        yield Sample(
+            "rating_rate_limited_total",
+            "counter",
+            "Requests rejected by the rate limits, by tenant",
+            {"tenant": tenant},
+            value,
+        )
+    yield Sample(
+        "rating_rate_limit_syncs_total",
+        "counter",
+        "Reconciliations of the rate limits of the worker with Redis",
+        {},
+        rate_limiter.syncs,
+    )
+
+    pool = http_client.stats()
+    for state in ("acquired", "idle"):
+        yield Sample(
+            "rating_http_pool_connections",
+            "gauge",
+            "Connections of the HTTP client pool",
+            {"state": state},
+            pool[state],
+        )
+    for event in ("created", "reused"):
+        yield Sample(
+            "rating_http_connections_total",
+            "counter",
+            "Connections of the HTTP client pool created or reused",
+            {"event": event},
+            pool[event],
+        )
@@ -0,0 +1,185 @@
+from bisect import bisect_right
+from fractions import Fraction
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+from app.api.helpers.calculation import (
+    RATE_DENOMINATOR,
+    SECONDS_PER_HOUR,
+    WH_PER_KWH,
+    format_fixed,
+    to_units,
+)
+from app.api.helpers.timestamps import SECONDS_PER_DAY
+from app.schemas.tariff import Tariff
+
+
+class TariffIndex(NamedTuple):
+    """Interval index of a tariff, prices are in micro units (see `to_units`).
+
+    The day is split at the boundaries of the time of use windows into intervals
+    of constant prices, and the consumption of a session is split at the
+    thresholds of the tiers. A session is priced by walking the boundaries it
+    crosses, see `price_session`.
+    """
+
+    # Seconds of the day where the prices change, sorted, starting with 0
+    boundaries: List[int]
+    # Energy prices of the intervals, None where the tiers apply
+    energy: List[Optional[int]]
+    # Time prices of the intervals
+    time: List[int]
+    # Wh of a session where the tiers start, sorted, starting with 0
+    tier_boundaries: List[int]
+    # Energy prices of the tiers
+    tier_energy: List[int]
+    transaction: int
+    # Sum of the time prices of the seconds of a day
+    day_time: int
+    # Sum of the energy prices of the seconds of a day, of the windows
+    day_energy: int
+    # Seconds of a day where the tiers apply
+    day_tiered_seconds: int
+
+
+def compile_index(tariff: Tariff) -> TariffIndex:
+    """Compile a tariff to its interval index"""
+    boundaries = {0}
+    for window in tariff.windows:
+        boundaries.update(window.seconds())
+    boundaries = sorted(boundaries)
+
+    energy, time = [], []
+    day_time = day_energy = day_tiered_seconds = 0
+    for start, end in zip(boundaries, boundaries[1:] + [SECONDS_PER_DAY]):
+        window = next((w for w in tariff.windows if w.covers(start)), None)
+        energy_price = window and window.energy
+        time_price = (window and window.time) or tariff.time
+        energy.append(None if energy_price is None else to_units(energy_price))
+        time.append(to_units(time_price))
+        day_time += (end - start) * time[-1]
+        if energy[-1] is None:
+            day_tiered_seconds += end - start
+        else:
+            day_energy += (end - start) * energy[-1]
+
+    tier_boundaries, tier_energy = [0], [to_units(tariff.energy)]
+    for tier in tariff.tiers:
+        from_wh = round(tier.from_kwh * WH_PER_KWH)
+        if from_wh == tier_boundaries[-1]:
+            tier_energy[-1] = to_units(tier.energy)
+        else:
+            tier_boundaries.append(from_wh)
+            tier_energy.append(to_units(tier.energy))
+
+    return TariffIndex(
+        boundaries=boundaries,
+        energy=energy,
+        time=time,
+        tier_boundaries=tier_boundaries,
+        tier_energy=tier_energy,
+        transaction=to_units(tariff.transaction),
+        day_time=day_time,
+        day_energy=day_energy,
+        day_tiered_seconds=day_tiered_seconds,
+    )
+
+
+def price_session(
+    index: TariffIndex, start_second: int, total_seconds: int, total_wh: int
+) -> Tuple[Fraction, Fraction, Fraction, Fraction]:
+    """Exact overall, energy, time and transaction rates of a session, as
+    numerators over `RATE_DENOMINATOR`, see `rate_numerators`.
+
+    The session is split into segments of constant prices at the boundaries of
+    the intervals and of the tiers it crosses. The interval of the start is found
+    by bisection, and whole days without a tier boundary are priced at once, so
+    the cost doesn't grow with the duration of the session.
+    The power is assumed to be constant over the session, the meters only tell
+    its consumption, so a tier starts after its share of the duration.
+
+    Args:
+        index (TariffIndex): Interval index of the tariff
+        start_second (int): Start of the session, in seconds of the day (UTC)
+        total_seconds (int): Duration of the session in seconds
+        total_wh (int): Consumption of the session in Wh
+
+    Returns:
+        Tuple[Fraction, ...]: Numerators of the rates
+    """
+    boundaries, tier_boundaries = index.boundaries, index.tier_boundaries
+    interval = bisect_right(boundaries, start_second) - 1
+    # Start of the day of the interval, relative to the start of the session
+    day_start = -start_second
+    # Positions (seconds) of the session where the tiers start
+    tier_starts = [Fraction(total_seconds * wh, total_wh) for wh in tier_boundaries]
+    tier_starts.append(total_seconds)
+    tier = 0
+
+    # Sums of the prices of the seconds of the session
+    energy = time = 0
+    position = 0
+    while position < total_seconds:
+        segment_end = min(tier_starts[tier + 1], total_seconds)
+        days = int((segment_end - position) // SECONDS_PER_DAY)
+        if days:
+            time += days * index.day_time
+            energy += days * (
+                index.day_energy + index.day_tiered_seconds * index.tier_energy[tier]
+            )
+            position += days * SECONDS_PER_DAY
+            day_start += days * SECONDS_PER_DAY
+            continue
+
+        interval_end = day_start + (
+            boundaries[interval + 1]
+            if interval + 1 < len(boundaries)
+            else SECONDS_PER_DAY
+        )
+        end = min(interval_end, segment_end)
+        energy_price = index.energy[interval]
+        if energy_price is None:
+            energy_price = index.tier_energy[tier]
+        energy += (end - position) * energy_price
+        time += (end - position) * index.time[interval]
+        position = end
+        if end == interval_end:
+            interval += 1
+            if interval == len(boundaries):
+                interval = 0
+                day_start += SECONDS_PER_DAY
+        if end == tier_starts[tier + 1] and tier + 1 < len(tier_boundaries):
+            tier += 1
+
+    energy = Fraction(energy * total_wh * SECONDS_PER_HOUR, total_seconds)
+    time = Fraction(time * WH_PER_KWH)
+    transaction = Fraction(index.transaction * SECONDS_PER_HOUR * WH_PER_KWH)
+    return energy + time + transaction, energy, time, transaction
+
+
+async def calculate_tariff_rate(
+    index: TariffIndex, start_second: int, total_seconds: int, total_kwh: float
+) -> Tuple[Union[str, int], ...]:
+    """Calculate the rate of a session with a time of use and tiered tariff,
+    formatted like the rates of `calculate_rate`.
+
+    Args:
+        index (TariffIndex): Interval index of the tariff
+        start_second (int): Start of the session, in seconds of the day (UTC)
+        total_seconds (int): Total time consumed in seconds
+        total_kwh (float): Total kWh of energy used
+
+    Returns:
+        [str]: Calculated and formatted rates
+    """
+    overall, energy, time, transaction = price_session(
+        index,
+        start_second=start_second,
+        total_seconds=total_seconds,
+        total_wh=round(total_kwh * WH_PER_KWH),
+    )
+    energy, time, transaction = (
+        format_fixed(rate, RATE_DENOMINATOR, places=3)
+        for rate in (energy, time, transaction)
+    )
+    overall = format_fixed(overall, RATE_DENOMINATOR, places=2)
+    return overall, energy, time, transaction
@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import json
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import List, NamedTuple, Optional
+
+import aioredis
+
+from app.api.helpers.cache import LocalCache
+from app.api.helpers.tariff_index import TariffIndex, compile_index
+from app.core.config import settings
+from app.core.connections import redis_cache
+from app.core.metrics import cache_invalidations
+from app.schemas.tariff import Tariff
+
+logger = getLogger(__name__)
+
+# Hash of the tariffs, id -> tariff record (JSON)
+TARIFFS_KEY = "tariffs"
+# Hash of the latest versions of the tariffs, id -> version
+TARIFF_VERSIONS_KEY = "tariffs:versions"
+# Channel of the ids of the updated (or deleted) tariffs
+TARIFF_CHANNEL = "tariffs:updates"
+# Stores a tariff with the next version of its id, atomically
+PUT_TARIFF_SCRIPT = """
+local version = redis.call("hincrby", KEYS[2], ARGV[1], 1)
+local record = '{"version":' .. version .. ',"tariff":' .. ARGV[2] .. '}'
+redis.call("hset", KEYS[1], ARGV[1], record)
+return version
+"""
+# Seconds to wait before subscribing again to the updates, after a failure
+RESUBSCRIBE_DELAY = 1
+
+
+class CompiledTariff(NamedTuple):
+    """A tariff of the registry, validated and ready to price CDRs with"""
+
+    id: str
+    version: int
+    rate: Tariff
+    # Interval index of the tariff, None for the flat tariffs (without windows
+    # or tiers), which are rated by `calculate_rate`
+    index: Optional[TariffIndex]
+
+    def record(self) -> dict:
+        return {"id": self.id, "version": self.version, "tariff": self.rate.dict()}
+
+
+def compile_tariff(tariff_id: str, version: int, tariff: Tariff) -> CompiledTariff:
+    return CompiledTariff(
+        id=tariff_id,
+        version=version,
+        rate=tariff,
+        index=compile_index(tariff) if tariff.windows or tariff.tiers else None,
+    )
+
+
+def parse_tariff(tariff_id: str, record: bytes) -> CompiledTariff:
+    record = json.loads(record)
+    return compile_tariff(
+        tariff_id, version=record["version"], tariff=Tariff.parse_obj(record["tariff"])
+    )
+
+
+class TariffRegistry:
+    """Tariffs stored in Redis and referenced by their id.
+
+    Every worker keeps the compiled tariffs in process, so the tariffs aren't read
+    and validated on every request. On an update the id of the tariff is published,
+    every worker listens to the updates and drops its copy of the tariff, see `run`.
+    Copies are also dropped after `ttl` seconds, in case an update is missed.
+    Subscriptions are shared by the Redis pool, so only a single registry of a
+    worker (`tariff_registry`) may listen to the updates.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.compiled = LocalCache(max_size=settings.LOCAL_CACHE_MAX_SIZE)
+        # Number of the dropped tariffs, a tariff read before a drop isn't kept
+        self._drops = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def get(self, tariff_id: str) -> Optional[CompiledTariff]:
+        """Return the compiled tariff of the id, or None if there isn't a tariff"""
+        tariff = self.compiled.get(tariff_id)
+        if tariff is not None:
+            return tariff
+        drops = self._drops
+        record = await redis_cache.hget(TARIFFS_KEY, tariff_id)
+        if record is None:
+            return None
+        tariff = parse_tariff(tariff_id, record)
+        # Unless it's updated in the meantime
+        if drops == self._drops:
+            self.compiled.set(
+                tariff_id,
+                tariff,
+                expires_at=datetime.utcnow() + timedelta(seconds=self.ttl),
+            )
+        return tariff
+
+    def drop(self, tariff_id: str) -> None:
+        self._drops += 1
+        self.compiled.delete(tariff_id)
+        cache_invalidations.inc(cache="tariffs")
+
+    async def list(self) -> List[CompiledTariff]:
+        records = await redis_cache.hgetall(TARIFFS_KEY)
+        return sorted(
+            (
+                parse_tariff(tariff_id.decode(), record)
+                for tariff_id, record in records.items()
+            ),
+            key=lambda tariff: tariff.id,
+        )
+
+    async def put(self, tariff_id: str, tariff: Tariff) -> CompiledTariff:
+        """Create or update a tariff, with the next version of the id"""
+        version = await redis_cache.eval(
+            PUT_TARIFF_SCRIPT,
+            keys=[TARIFFS_KEY, TARIFF_VERSIONS_KEY],
+            args=[tariff_id, tariff.json()],
+        )
+        await self.publish(tariff_id)
+        return compile_tariff(tariff_id, version=version, tariff=tariff)
+
+    async def delete(self, tariff_id: str) -> bool:
+        """Delete a tariff, returns whether it existed.
+        Its version is kept, so a tariff recreated with the id gets a new version.
+        """
+        deleted = await redis_cache.hdel(TARIFFS_KEY, tariff_id)
+        await self.publish(tariff_id)
+        return bool(deleted)
+
+    async def publish(self, tariff_id: str) -> None:
+        self.drop(tariff_id)
+        with contextlib.suppress(aioredis.RedisError):
+            await redis_cache.publish(TARIFF_CHANNEL, tariff_id)
+
+    async def listen(self) -> None:
+        """Drop the compiled tariffs which are updated by any worker"""
+        channel = await redis_cache.subscribe(TARIFF_CHANNEL)
+        try:
+            # Updates might have been missed while not subscribed
+            self.compiled.clear()
+            async for tariff_id in channel.iter(encoding="utf-8"):
+                self.drop(tariff_id)
+        finally:
+            with contextlib.suppress(aioredis.RedisError):
+                await redis_cache.unsubscribe(TARIFF_CHANNEL)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.listen()
+            except (aioredis.RedisError, OSError):
+                logger.warning("Tariff updates subscription is lost")
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self.compiled.clear()
+
+
+tariff_registry = TariffRegistry(ttl=settings.TARIFF_CACHE_TTL)
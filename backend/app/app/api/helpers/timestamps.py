@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+UTC_EPOCH = EPOCH.replace(tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+SECONDS_PER_DAY = 24 * 3600
+MICROSECONDS_PER_SECOND = 1_000_000
+
+# The common shape of the timestamps, `YYYY-MM-DDTHH:MM:SSZ`, as a template of
+# its characters, where the digits are zeros
+FAST_SHAPE = b"0000-00-00T00:00:00Z"
+FAST_LENGTH = len(FAST_SHAPE)
+DAYS_IN_MONTH = np.array([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+# Microseconds of the minutes and seconds (`:MM:SS`) of the common shape
+MINUTE_MICROSECONDS = {
+    ":%02d:%02d" % (minute, second): (minute * 60 + second) * MICROSECONDS_PER_SECOND
+    for minute in range(60)
+    for second in range(60)
+}
+# Epoch microseconds of the hours (`YYYY-MM-DDTHH`) of the common shape parsed
+# lately, a few months of hours
+HOURS_CACHE_SIZE = 4096
+hour_microseconds: Dict[str, int] = {}
+
+
+def parse_hour(hour: str) -> Optional[int]:
+    """Epoch microseconds of an hour of the common shape, `YYYY-MM-DDTHH`,
+    parsed field by field. None if it isn't a valid hour of that shape.
+    """
+    fields = hour[:4], hour[5:7], hour[8:10], hour[11:13]
+    if not (
+        hour.isascii()
+        and hour[4] == "-"
+        and hour[7] == "-"
+        and hour[10] == "T"
+        and all(field.isdigit() for field in fields)
+    ):
+        return None
+    year, month, day, hours = map(int, fields)
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    if not (
+        year >= 1
+        and 1 <= month <= 12
+        and 1 <= day <= DAYS_IN_MONTH[month] - (month == 2 and not leap)
+        and hours < 24
+    ):
+        return None
+    seconds = days_from_civil(year, month, day) * SECONDS_PER_DAY + hours * 3600
+    return seconds * MICROSECONDS_PER_SECOND
+
+
+def parse_epoch_microseconds(timestamp: str) -> int:
+    """Parse an ISO 8601 timestamp to integer microseconds since the epoch.
+    Timestamps of the common shape (`YYYY-MM-DDTHH:MM:SSZ`) are computed from
+    their fields, with the hours cached and the minutes and seconds looked up,
+    without creating a datetime. The others are parsed in general.
+    Timestamps without an offset are considered to be UTC.
+
+    Args:
+        timestamp (str): ISO 8601 timestamp
+
+    Returns:
+        int: Microseconds since the epoch
+
+    Raises:
+        ValueError, TypeError, AttributeError: If it isn't an ISO 8601 timestamp
+    """
+    if len(timestamp) == FAST_LENGTH and timestamp[-1] == "Z":
+        try:
+            return (
+                hour_microseconds[timestamp[:13]]
+                + MINUTE_MICROSECONDS[timestamp[13:19]]
+            )
+        except KeyError:
+            hour = parse_hour(timestamp[:13])
+            if hour is not None:
+                if len(hour_microseconds) >= HOURS_CACHE_SIZE:
+                    hour_microseconds.clear()
+                hour_microseconds[timestamp[:13]] = hour
+                minute = MINUTE_MICROSECONDS.get(timestamp[13:19])
+                if minute is not None:
+                    return hour + minute
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        return (parsed - EPOCH) // ONE_MICROSECOND
+    return (parsed - UTC_EPOCH) // ONE_MICROSECOND
+
+
+def days_from_civil(year: np.ndarray, month: np.ndarray, day: np.ndarray):
+    """Days since the epoch of proleptic Gregorian dates, works for arrays too"""
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def parse_fast_timestamps(timestamps: Sequence[str]) -> np.ma.MaskedArray:
+    """Parse timestamps of the common shape, see `parse_timestamps`.
+
+    Returns:
+        np.ma.MaskedArray: int64 microseconds, timestamps of other shapes are masked
+    """
+    rows = len(timestamps)
+    try:
+        # With room for a character after the shape, to tell longer strings apart
+        encoded = np.array(timestamps, dtype=f"S{FAST_LENGTH + 1}")
+    except UnicodeEncodeError:
+        return np.ma.masked_all(rows, dtype=np.int64)
+    # A row per character position, of the characters of all the timestamps
+    characters = np.ascontiguousarray(
+        encoded.view(np.uint8).reshape(rows, FAST_LENGTH + 1).T
+    )
+    digits = (characters[:FAST_LENGTH] - np.uint8(ord("0"))).astype(np.int32)
+
+    fast = characters[FAST_LENGTH] == 0
+    for position, character in enumerate(FAST_SHAPE):
+        if character == ord("0"):
+            fast &= digits[position] <= 9
+        else:
+            fast &= characters[position] == character
+
+    year = digits[0] * 1000 + digits[1] * 100 + digits[2] * 10 + digits[3]
+    month, day, hour, minute, second = (
+        digits[position] * 10 + digits[position + 1] for position in range(5, 18, 3)
+    )
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    fast &= (
+        (year >= 1)
+        & (month >= 1)
+        & (month <= 12)
+        & (day >= 1)
+        & (day <= DAYS_IN_MONTH[np.clip(month, 0, 12)] - ((month == 2) & ~leap))
+        & (hour < 24)
+        & (minute < 60)
+        & (second < 60)
+    )
+
+    seconds = days_from_civil(year, month, day).astype(np.int64) * SECONDS_PER_DAY
+    seconds += hour * 3600 + minute * 60 + second
+    return np.ma.masked_array(seconds * MICROSECONDS_PER_SECOND, mask=~fast)
+
+
+def parse_timestamps(timestamps: Sequence[str]) -> np.ma.MaskedArray:
+    """Vectorized `parse_epoch_microseconds`, converts ISO 8601 timestamps to
+    integer microseconds since the epoch.
+    Timestamps of the common shape (`YYYY-MM-DDTHH:MM:SSZ`) are parsed at once,
+    as arrays of characters, the others are parsed one by one.
+
+    Args:
+        timestamps (Sequence[str]): ISO 8601 timestamps
+
+    Returns:
+        np.ma.MaskedArray: int64 microseconds, invalid timestamps are masked
+    """
+    epoch_microseconds = parse_fast_timestamps(timestamps)
+    for index in np.flatnonzero(np.ma.getmaskarray(epoch_microseconds)).tolist():
+        try:
+            epoch_microseconds[index] = parse_epoch_microseconds(timestamps[index])
+        except (ValueError, TypeError, AttributeError):
+            continue
+    return epoch_microseconds
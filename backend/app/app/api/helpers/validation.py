@@ -1,44 +1,61 @@
-from datetime import datetime
+from typing import Tuple
 
+from app.api.helpers.timestamps import MICROSECONDS_PER_SECOND, parse_epoch_microseconds
 from app.core.exception import bad_request, wrong_isoformat
 
+TIMESTAMP_ORDER_ERROR = "timestamp_stop cannot be before timestamp_start or be equal"
+METER_ORDER_ERROR = "meter_start cannot be greater than meter_stop or be equal!"
+
+
+def parse_session(start: str, stop: str) -> Tuple[int, int]:
+    """Parse and validate the timestamps of a session, see `validate_timestamps`.
+
+    Returns:
+        [int, int]: Start of the session, in seconds since the epoch, and its
+        total seconds
+    """
+    try:
+        timestamp_start = parse_epoch_microseconds(start)
+        timestamp_stop = parse_epoch_microseconds(stop)
+    except (ValueError, TypeError, AttributeError):
+        return wrong_isoformat()
+    if timestamp_start >= timestamp_stop:
+        return bad_request(err=TIMESTAMP_ORDER_ERROR)
+    return (
+        timestamp_start // MICROSECONDS_PER_SECOND,
+        (timestamp_stop - timestamp_start) // MICROSECONDS_PER_SECOND,
+    )
+
+
+async def validate_session(start: str, stop: str) -> Tuple[int, int]:
+    """Validate the timestamps of a session, see `parse_session`"""
+    return parse_session(start, stop)
+
 
 async def validate_timestamps(start: str, stop: str) -> int:
     """Validator function and convertor for timestamps
 
     1 - Validation check for timestamps to be of type ISO 8601
-    2 - Convert timestamps from isoformat to python datetime format
+    2 - Convert timestamps from isoformat to microseconds since the epoch
     3 - Validation check for the correctness of time entries(order and equality)
+    Timestamps without an offset are considered to be UTC.
 
     Args:
         start (str) charging start timestamp
         stop (str) charging stop timestamp
 
     Returns:
-        [int]: Integer of total seconds
+        [int]: Integer of total seconds, of the whole duration (including days)
 
     Raises:
         HTTPException
     """
-    try:
-        timestamp_start, timestamp_stop = map(
-            lambda timestamp: datetime.fromisoformat(timestamp.replace("Z", "+00:00")),
-            [start, stop],
-        )
-    except (ValueError, TypeError, AttributeError):
-        return wrong_isoformat()
-    if timestamp_start >= timestamp_stop:
-        return bad_request(
-            err="timestamp_stop cannot be before timestamp_start or be equal"
-        )
-    return (timestamp_stop - timestamp_start).seconds
+    return parse_session(start, stop)[1]
 
 
 async def validate_meters(start: int, stop: int) -> float:
     """Validate meters and convert Wh to kWh"""
     if not stop > start:
-        return bad_request(
-            err="meter_start cannot be greater than meter_stop or be equal!"
-        )
+        return bad_request(err=METER_ORDER_ERROR)
     watt_hour = stop - start
     return watt_hour / 1000
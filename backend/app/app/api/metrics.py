@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Response
+
+from app.core.metrics import CONTENT_TYPE, metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    """Metrics of all the workers, in the Prometheus text exposition format.
+    Served outside of the API prefix, so it's not routed by the proxy and is
+    scraped from within the network.
+    """
+    return Response(metrics.collect(), media_type=CONTENT_TYPE)
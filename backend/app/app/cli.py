@@ -0,0 +1,340 @@
+"""Command line tools for offline (bulk) rating.
+
+Usage:
+    python -m app.cli rate cdrs.csv rated.csv --tariff tariff.json
+    python -m app.cli preload-rates 2021-01-01 2021-08-31
+    python -m app.cli hash-api-key < key.txt
+
+The input is a CSV (with a header) or a Parquet file with the columns of a CDR
+(`timestamp_start`, `timestamp_stop`, `meter_start`, `meter_stop`), and the
+tariff is a JSON file with the body of a rate (`energy`, `time`, `transaction`).
+The output file has the same format as the input, and for every CDR, in the same
+order, its `overall`, `energy`, `time` and `transaction` rates or its `error`.
+
+`preload-rates` fetches the exchange rates of every day within a date range and
+caches them, so converting the rates of past sessions doesn't hit the service.
+
+`hash-api-key` prints the digest of an API key (read from stdin), to be added
+to the `API_KEYS` of the tenants.
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import partial
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from app.api.helpers.batch import RatedColumns, format_column, rate_columns
+from app.api.helpers.exchange import preload_historical_rates
+from app.core.connections import http_client, redis_cache
+from app.core.security import hash_api_key
+from app.schemas import Rate
+
+CDR_COLUMNS = ("timestamp_start", "timestamp_stop", "meter_start", "meter_stop")
+RESULT_COLUMNS = ("overall", "energy", "time", "transaction", "error")
+INVALID_ROW_ERROR = (
+    "Invalid row - expected a timestamp_start, timestamp_stop, "
+    "meter_start and meter_stop value"
+)
+# Bytes of CSV input handled by a worker at once
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def rate_cdr_columns(
+    timestamp_start: Sequence[str],
+    timestamp_stop: Sequence[str],
+    meter_start: Sequence[int],
+    meter_stop: Sequence[int],
+    tariff: Rate,
+) -> RatedColumns:
+    """Rate CDR columns with a single tariff"""
+    rows = len(timestamp_start)
+    return rate_columns(
+        timestamp_start=timestamp_start,
+        timestamp_stop=timestamp_stop,
+        meter_start=meter_start,
+        meter_stop=meter_stop,
+        energy_rate=np.full(rows, tariff.energy),
+        time_rate=np.full(rows, tariff.time),
+        transaction_rate=np.full(rows, tariff.transaction),
+    )
+
+
+def split_csv(path: str, chunk_size: int) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """Read the header of a CSV file and split the rest of it into byte ranges of
+    about `chunk_size`, which end at line boundaries.
+    """
+    with open(path, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            return [], []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header_end = data.find(b"\n") + 1 or len(data)
+            header = next(csv.reader([data[:header_end].decode()]), [])
+            ranges = []
+            start = header_end
+            while start < len(data):
+                end = data.find(b"\n", start + chunk_size)
+                end = len(data) if end == -1 else end + 1
+                ranges.append((start, end))
+                start = end
+    return header, ranges
+
+
+def rate_csv_chunk(
+    byte_range: Tuple[int, int], path: str, indexes: Sequence[int], tariff: Rate
+) -> Tuple[str, int, int]:
+    """Rate the CSV rows inside of a byte range of the (memory mapped) input.
+
+    Args:
+        byte_range (Tuple[int, int]): Start and end offsets of the rows
+        path (str): Input file path
+        indexes (Sequence[int]): Positions of the CDR columns inside of a row
+        tariff (Rate): Rate components
+
+    Returns:
+        Tuple[str, int, int]: Result rows as CSV, number of rows and failed rows
+    """
+    start, end = byte_range
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text = data[start:end].decode()
+
+    cdrs, invalid = [], []
+    for row in csv.reader(io.StringIO(text)):
+        if not row:
+            continue
+        try:
+            timestamp_start, timestamp_stop, meter_start, meter_stop = (
+                row[index] for index in indexes
+            )
+            cdrs.append(
+                (timestamp_start, timestamp_stop, int(meter_start), int(meter_stop))
+            )
+            invalid.append(False)
+        except (IndexError, ValueError):
+            cdrs.append(("", "", 0, 0))
+            invalid.append(True)
+
+    output = io.StringIO()
+    if not cdrs:
+        return output.getvalue(), 0, 0
+    columns = rate_cdr_columns(*zip(*cdrs), tariff=tariff)
+    writer = csv.writer(output, lineterminator="\n")
+    failed = 0
+    # Formatted as the results of the `/rate/` API
+    for row_invalid, error, *rates in zip(
+        invalid,
+        columns.errors,
+        format_column(columns.overall, places=2),
+        format_column(columns.energy, places=3),
+        format_column(columns.time, places=3),
+        format_column(columns.transaction, places=3),
+    ):
+        error = INVALID_ROW_ERROR if row_invalid else error
+        if error:
+            failed += 1
+            writer.writerow(["", "", "", "", error])
+        else:
+            writer.writerow(rates + [""])
+    return output.getvalue(), len(invalid), failed
+
+
+def rate_csv(
+    input_path: str, output_path: str, tariff: Rate, workers: int, chunk_size: int
+) -> Tuple[int, int]:
+    """Rate a CSV file of CDRs, see `rate_csv_chunk`"""
+    header, ranges = split_csv(input_path, chunk_size=chunk_size)
+    missing = set(CDR_COLUMNS) - set(header)
+    if missing:
+        raise SystemExit(f"Missing CSV columns: {', '.join(sorted(missing))}")
+    indexes = [header.index(column) for column in CDR_COLUMNS]
+
+    rows = failed = 0
+    with open(output_path, "w", newline="") as output:
+        output.write(",".join(RESULT_COLUMNS) + "\n")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = executor.map(
+                partial(
+                    rate_csv_chunk, path=input_path, indexes=indexes, tariff=tariff
+                ),
+                ranges,
+            )
+            for chunk, chunk_rows, chunk_failed in chunks:
+                output.write(chunk)
+                rows += chunk_rows
+                failed += chunk_failed
+    return rows, failed
+
+
+def rate_parquet_row_group(row_group: int, path: str, tariff: Rate):
+    """Rate a single row group of a (memory mapped) Parquet file.
+
+    Returns:
+        Tuple[pyarrow.Table, int]: Results and number of failed rows
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pq.ParquetFile(path, memory_map=True).read_row_group(
+        row_group, columns=list(CDR_COLUMNS)
+    )
+    columns = rate_cdr_columns(
+        timestamp_start=table["timestamp_start"].cast(pa.string()).to_pylist(),
+        timestamp_stop=table["timestamp_stop"].cast(pa.string()).to_pylist(),
+        meter_start=table["meter_start"].to_numpy(),
+        meter_stop=table["meter_stop"].to_numpy(),
+        tariff=tariff,
+    )
+    failed = np.array([error is not None for error in columns.errors], dtype=bool)
+    results = pa.table(
+        {
+            "overall": pa.array(columns.overall, mask=failed),
+            "energy": pa.array(columns.energy, mask=failed),
+            "time": pa.array(columns.time, mask=failed),
+            "transaction": pa.array(columns.transaction, mask=failed),
+            "error": pa.array(columns.errors, type=pa.string()),
+        }
+    )
+    return results, int(failed.sum())
+
+
+def rate_parquet(
+    input_path: str, output_path: str, tariff: Rate, workers: int
+) -> Tuple[int, int]:
+    """Rate a Parquet file of CDRs, a row group at a time"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:  # pragma: no cover
+        raise SystemExit("Rating Parquet files requires pyarrow to be installed")
+
+    row_groups = pq.ParquetFile(input_path, memory_map=True).num_row_groups
+    rows = failed = 0
+    writer = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            partial(rate_parquet_row_group, path=input_path, tariff=tariff),
+            range(row_groups),
+        )
+        for table, table_failed in results:
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+            failed += table_failed
+    if writer is not None:
+        writer.close()
+    return rows, failed
+
+
+def is_parquet(path: str) -> bool:
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def rate_file(args: argparse.Namespace) -> None:
+    with open(args.tariff) as tariff_file:
+        tariff = Rate.parse_obj(json.load(tariff_file))
+
+    started = time.perf_counter()
+    if is_parquet(args.input):
+        rows, failed = rate_parquet(
+            args.input, args.output, tariff=tariff, workers=args.workers
+        )
+    else:
+        rows, failed = rate_csv(
+            args.input,
+            args.output,
+            tariff=tariff,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+        )
+    elapsed = time.perf_counter() - started
+    print(
+        f"Rated {rows} rows ({failed} failed) in {elapsed:.2f}s, "
+        f"{rows / elapsed if elapsed else 0:.0f} rows/s"
+    )
+
+
+async def preload_rates(start: date, end: date) -> int:
+    await redis_cache.init_cache()
+    await http_client.init_session()
+    try:
+        return await preload_historical_rates(start, end)
+    finally:
+        await http_client.close()
+        await redis_cache.close()
+
+
+def preload_rates_command(args: argparse.Namespace) -> None:
+    if args.start > args.end:
+        raise SystemExit("START can't be after END")
+    days = asyncio.run(preload_rates(args.start, args.end))
+    print(f"Cached the rates of {days} days from {args.start} to {args.end}")
+
+
+def hash_api_key_command(args: argparse.Namespace) -> None:
+    api_key = sys.stdin.readline().strip()
+    if not api_key:
+        raise SystemExit("An API key is required on stdin")
+    print(hash_api_key(api_key))
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__)
+    parser.set_defaults(func=None)
+    commands = parser.add_subparsers(title="commands")
+
+    rate = commands.add_parser("rate", help="Rate a CSV or Parquet file of CDRs")
+    rate.add_argument("input", help="CDR file (.csv or .parquet)")
+    rate.add_argument("output", help="Result file, in the format of the input")
+    rate.add_argument(
+        "--tariff", required=True, help="JSON file with the rate components"
+    )
+    rate.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    rate.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Bytes of CSV input rated by a worker at once",
+    )
+    rate.set_defaults(func=rate_file)
+
+    preload = commands.add_parser(
+        "preload-rates", help="Fetch and cache the exchange rates of a date range"
+    )
+    preload.add_argument("start", type=date.fromisoformat, help="First day (ISO)")
+    preload.add_argument("end", type=date.fromisoformat, help="Last day (ISO)")
+    preload.set_defaults(func=preload_rates_command)
+
+    hash_key = commands.add_parser(
+        "hash-api-key", help="Print the digest of an API key read from stdin"
+    )
+    hash_key.set_defaults(func=hash_api_key_command)
+
+    args = parser.parse_args(argv)
+    if args.func is None:
+        parser.error("a command is required")
+    return args
+
+
+def main(argv: Sequence[str] = None) -> None:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import os
-from typing import List, Union
+from typing import Dict, List, Optional, Union
 
 from pydantic import AnyHttpUrl, BaseSettings, validator
 
@@ -10,8 +10,22 @@ class Settings(BaseSettings):
     SERVER_HOST: AnyHttpUrl
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = []
     API_KEY_SECRET = os.environ.get("API_KEY_SECRET")
+    # API keys of the tenants, tenant -> SHA-256 hex digest of its key, see
+    # `python -m app.cli hash-api-key`. `API_KEY_SECRET` is the "default" tenant's
+    API_KEYS: Dict[str, str] = {}
+    # Requests per second allowed to each tenant, not limited if 0, and the burst
+    # of requests allowed above that rate
+    RATE_LIMIT_RATE: float = 0
+    RATE_LIMIT_BURST: int = 100
+    # Requests per second of the tenants with a quota of their own, tenant -> rate
+    RATE_LIMIT_QUOTAS: Dict[str, float] = {}
+    # Seconds between the reconciliations of a worker's buckets with Redis
+    RATE_LIMIT_SYNC_INTERVAL: float = 1
     REDIS_HOST = os.environ.get("REDIS_HOST")
     REDIS_PORT = os.environ.get("REDIS_PORT")
+    # Min and max number of connections of the Redis pool of each worker
+    REDIS_POOL_MIN_SIZE: int = 1
+    REDIS_POOL_MAX_SIZE: int = 10
 
     @validator("BACKEND_CORS_ORIGINS", pre=True)
     def assemble_cors_origins(
@@ -25,6 +39,63 @@ class Settings(BaseSettings):
 
     PROJECT_NAME: str
     DEFAULT_CURRENCY = "EUR"
+    # Base URL of the exchange rate service, e.g. a local stub for load tests
+    EXCHANGE_API_URL: str = "https://api.exchangerate.host"
+    # Serialize the rating results with the prebuilt serializers of their shapes,
+    # without validating them against the response models again
+    FAST_RESPONSES: bool = False
+    # Seconds clients and proxies may reuse a rating result of the GET rating API
+    RATE_CACHE_MAX_AGE: int = 24 * 3600
+    # Max number of memoized API results in the in process cache of each worker
+    RESULT_CACHE_MAX_SIZE: int = 4096
+    # Seconds a memoized API result is kept, in process and in Redis
+    RESULT_CACHE_TTL: int = 24 * 3600
+    # Seconds a worker keeps a compiled tariff of the tariff registry, in case an
+    # update notification is missed
+    TARIFF_CACHE_TTL: int = 300
+    # Number of records rated at once by the streaming rating API
+    STREAM_CHUNK_SIZE: int = 500
+    # Max number of entries of the in process (L1) cache of each worker
+    LOCAL_CACHE_MAX_SIZE: int = 1024
+    # Seconds a worker may fetch the exchange rates before others fetch them too
+    EXCHANGE_LOCK_TIMEOUT: float = 5
+    # Seconds between cache lookups, while waiting for another worker's fetch
+    EXCHANGE_LOCK_POLL_INTERVAL: float = 0.05
+    # Seconds to keep outdated exchange rates, to serve them while revalidating
+    RATE_STALE_TTL: int = 7 * 24 * 3600
+    # Consecutive failures of the exchange rate service which open the circuit
+    CIRCUIT_BREAKER_THRESHOLD: int = 5
+    # Seconds the circuit stays open, before a trial request is let through
+    CIRCUIT_BREAKER_RESET_TIMEOUT: float = 30
+    # Max number of connections of the HTTP client pool, in total and per host
+    HTTP_POOL_SIZE: int = 100
+    HTTP_POOL_SIZE_PER_HOST: int = 10
+    # Seconds to cache DNS lookups and to keep idle connections alive
+    HTTP_DNS_CACHE_TTL: int = 300
+    HTTP_KEEPALIVE_TIMEOUT: float = 30
+    # Directory of the metrics snapshots of the workers, shared by the workers of
+    # a container, only the metrics of the serving worker are exposed without it
+    METRICS_DIR: Optional[str] = None
+    # Seconds between the metrics snapshots of a worker
+    METRICS_FLUSH_INTERVAL: float = 5
+    # Probability of a request to be profiled, see `ProfilingMiddleware`
+    PROFILER_SAMPLE_RATE: float = 0
+    # Secret of the `Profile-Request` header, which has a request profiled
+    PROFILER_SECRET: Optional[str] = None
+    # Directory of the profiles, and the max number of profiles kept in it
+    PROFILER_DIR: str = "/tmp/profiles"
+    PROFILER_MAX_FILES: int = 100
+    # File of the exchange rate table shared by the workers of a node, e.g. in
+    # /dev/shm, see `SharedRateTable`, not shared without it
+    SHARED_RATES_PATH: Optional[str] = None
+    # Seconds between the checks of the writer of the shared table
+    SHARED_RATES_INTERVAL: float = 1
+    # Refresh the cached exchange rates in the background, once they expired
+    RATE_REFRESH_ENABLED: bool = True
+    # Max random delay of the refresh after midnight (UTC), in seconds
+    RATE_REFRESH_JITTER: float = 60
+    # Seconds before a failed refresh is retried, doubled on each failure
+    RATE_REFRESH_RETRY_INTERVAL: float = 5
 
     class Config:
         case_sensitive = True
@@ -1,9 +1,27 @@
-from typing import Optional
+from datetime import datetime
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
 
+import aiohttp
+import ujson
 from aioredis import Redis, create_redis_pool
 
 from app.core.config import settings
 
+# Deletes the lock only if it's still owned by the token
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+EPOCH = datetime(1970, 1, 1)
+
+
+def epoch_milliseconds(moment: datetime) -> int:
+    """Unix time of a naive UTC datetime, in milliseconds"""
+    return (moment - EPOCH) // (EPOCH.resolution * 1000)
+
 
 class RedisCache:
     def __init__(self):
@@ -11,7 +29,10 @@ class RedisCache:
 
     async def init_cache(self, db=0):
         self.redis_cache = await create_redis_pool(
-            f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}", db=db
+            f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}",
+            db=db,
+            minsize=settings.REDIS_POOL_MIN_SIZE,
+            maxsize=settings.REDIS_POOL_MAX_SIZE,
         )
 
     async def keys(self, pattern):
@@ -23,6 +44,40 @@ class RedisCache:
     async def get(self, key):
         return await self.redis_cache.get(key)
 
+    async def mget(self, *keys) -> List[Optional[bytes]]:
+        return await self.redis_cache.mget(*keys)
+
+    def pipeline(self):
+        """Commands sent in a single round trip, not atomically.
+        Queue the commands without awaiting them, then `await pipeline.execute()`.
+        """
+        return self.redis_cache.pipeline()
+
+    def transaction(self):
+        """Commands run atomically (MULTI/EXEC), sent in a single round trip.
+        Queue the commands without awaiting them, then `await transaction.execute()`.
+        """
+        return self.redis_cache.multi_exec()
+
+    async def set_expire_at(self, key, value, expire_at: datetime):
+        """Set the key to expire at a time (UTC), e.g. the next midnight, so Redis
+        drops it without any expiry logic of the readers.
+        """
+        transaction = self.transaction()
+        transaction.set(key, value)
+        transaction.pexpireat(key, epoch_milliseconds(expire_at))
+        return await transaction.execute()
+
+    async def get_with_ttl(self, key) -> Tuple[Optional[bytes], int]:
+        """The value of the key and its remaining time to live in milliseconds,
+        negative if it doesn't expire or doesn't exist, in a single round trip.
+        """
+        pipeline = self.pipeline()
+        pipeline.get(key)
+        pipeline.pttl(key)
+        value, ttl = await pipeline.execute()
+        return value, ttl
+
     async def execute(self, command, key, value, ex_command, ex_value, **kwargs):
         return await self.redis_cache.execute(
             command, key, value, ex_command, ex_value, **kwargs
@@ -35,5 +90,114 @@ class RedisCache:
     async def delete(self, key):
         await self.redis_cache.delete(key)
 
+    async def hget(self, key, field):
+        return await self.redis_cache.hget(key, field)
+
+    async def hset_mapping(self, key, mapping):
+        return await self.redis_cache.hmset_dict(key, mapping)
+
+    async def hgetall(self, key):
+        return await self.redis_cache.hgetall(key)
+
+    async def hdel(self, key, field):
+        return await self.redis_cache.hdel(key, field)
+
+    async def hincrby(self, key, field, increment=1):
+        return await self.redis_cache.hincrby(key, field, increment)
+
+    async def eval(self, script, keys=(), args=()):
+        return await self.redis_cache.eval(script, keys=list(keys), args=list(args))
+
+    async def publish(self, channel, message):
+        return await self.redis_cache.publish(channel, message)
+
+    async def subscribe(self, channel):
+        """Subscribe to a channel, returns the channel to read the messages from"""
+        (subscription,) = await self.redis_cache.subscribe(channel)
+        return subscription
+
+    async def unsubscribe(self, channel):
+        return await self.redis_cache.unsubscribe(channel)
+
+    async def exists(self, key):
+        return await self.redis_cache.exists(key)
+
+    async def acquire_lock(self, key, token, timeout_ms):
+        """Set the lock key to the token, if it isn't set already.
+        The lock is released automatically after the timeout.
+        """
+        return await self.redis_cache.set(
+            key, token, pexpire=timeout_ms, exist=Redis.SET_IF_NOT_EXIST
+        )
+
+    async def release_lock(self, key, token):
+        return await self.redis_cache.eval(
+            RELEASE_LOCK_SCRIPT, keys=[key], args=[token]
+        )
+
 
 redis_cache = RedisCache()
+
+
+class HTTPClient:
+    """Pooled HTTP client, shared by the requests of a worker.
+    Connections are kept alive and reused, and DNS lookups are cached, see the
+    `HTTP_*` settings.
+    """
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    async def init_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_POOL_SIZE,
+            limit_per_host=settings.HTTP_POOL_SIZE_PER_HOST,
+            use_dns_cache=True,
+            ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+        )
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_created)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            json_serialize=ujson.dumps,
+            trace_configs=[trace_config],
+        )
+
+    async def _on_connection_created(
+        self, session: aiohttp.ClientSession, context: SimpleNamespace, params
+    ):
+        self.connections_created += 1
+
+    async def _on_connection_reused(
+        self, session: aiohttp.ClientSession, context: SimpleNamespace, params
+    ):
+        self.connections_reused += 1
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def stats(self) -> dict:
+        """Utilisation of the connection pool"""
+        connector = self.session.connector if self.session else None
+        return {
+            "limit": connector.limit if connector else 0,
+            "limit_per_host": connector.limit_per_host if connector else 0,
+            # Connections in use by requests
+            "acquired": len(getattr(connector, "_acquired", ())),
+            # Kept alive connections, ready to be reused
+            "idle": sum(map(len, getattr(connector, "_conns", {}).values())),
+            "created": self.connections_created,
+            "reused": self.connections_reused,
+        }
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+http_client = HTTPClient()
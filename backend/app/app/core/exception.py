@@ -1,12 +1,30 @@
+import math
+
 from fastapi import HTTPException
 
+WRONG_ISOFORMAT_DETAIL = "Invalid timestamp - timestamp should be of type isoformat"
+BAD_REQUEST_DETAIL = "BAD REQUEST - reason: {0}"
+NOT_FOUND_DETAIL = "NOT FOUND - {0}"
+TOO_MANY_REQUESTS_DETAIL = "TOO MANY REQUESTS - retry after {0} seconds"
+
 
 def wrong_isoformat():
-    raise HTTPException(
-        status_code=422,
-        detail="Invalid timestamp - timestamp should be of type isoformat",
-    )
+    raise HTTPException(status_code=422, detail=WRONG_ISOFORMAT_DETAIL)
 
 
 def bad_request(err: str):
-    raise HTTPException(status_code=400, detail=f"BAD REQUEST - reason: {err}")
+    raise HTTPException(status_code=400, detail=BAD_REQUEST_DETAIL.format(err))
+
+
+def not_found(err: str):
+    raise HTTPException(status_code=404, detail=NOT_FOUND_DETAIL.format(err))
+
+
+def too_many_requests(retry_after: float):
+    # Retry-After is a whole number of seconds
+    seconds = max(1, math.ceil(retry_after))
+    raise HTTPException(
+        status_code=429,
+        detail=TOO_MANY_REQUESTS_DETAIL.format(seconds),
+        headers={"Retry-After": str(seconds)},
+    )
@@ -0,0 +1,429 @@
+import asyncio
+import contextlib
+import fcntl
+import json
+import os
+import time
+from bisect import bisect_left
+from logging import getLogger
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Type
+
+from starlette.responses import JSONResponse
+
+from app.core.config import settings
+
+logger = getLogger(__name__)
+
+# Media type of the Prometheus text exposition format, the charset is appended
+# by the response
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Upper bounds (seconds) of the buckets of the latency histograms
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+)
+
+# Snapshot of the metrics of the exited workers, without their gauges, and the
+# lock of the directory while it is updated
+EXITED_SNAPSHOT = "exited.json"
+LOCK_FILE = ".lock"
+
+LabelValues = Tuple[str, ...]
+
+
+class Sample(NamedTuple):
+    """A value read from the stats of a component when the metrics are collected,
+    see `MetricsRegistry.register_collector`.
+    """
+
+    name: str
+    type: str
+    help: str
+    labels: Dict[str, str]
+    value: float
+
+
+class Counter:
+    """Monotonic counter, per label values"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[list]:
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+class Histogram:
+    """Histogram of observed values, per label values.
+    Stores the count of every bucket (not cumulative) along with the sum and the
+    count of the observations, the cumulative counts are rendered on exposition.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # Bucket counts (the last one is +Inf), sum and count of each label values
+        self.values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.labelnames)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels: str):
+        """Observe the seconds spent within the block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[list]:
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+class MetricsRegistry:
+    """Metrics of a worker, aggregated across the workers on exposition.
+
+    Every worker updates its own metrics in process, without locks or any
+    coordination on the request path (a worker runs a single event loop).
+    Under gunicorn every worker is a separate process, so each one writes a
+    snapshot of its metrics to a file of its own (named by its pid and start
+    time) within `directory`, every `flush_interval` seconds and when it exits.
+    A scrape, served by any of the workers, merges the snapshots of all of them,
+    the latest ones of the other workers and a fresh one of its own.
+    The snapshots of exited workers (whose pid isn't running, or was reused by a
+    newer worker) are folded into a single snapshot, without their gauges, and
+    removed, so the counters of the stack don't go back and the gauges are only
+    the ones of the running workers.
+    Without a directory, only the metrics of the serving worker are exposed.
+    """
+
+    def __init__(self, directory: Optional[str], flush_interval: float):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics: List = []
+        self.collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._task: Optional[asyncio.Task] = None
+        # Pid and start time (Unix time in milliseconds) of the worker
+        self._worker: Optional[Tuple[int, int]] = None
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        metric = Counter(name, help, tuple(labelnames))
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames=(), **kwargs) -> Histogram:
+        metric = Histogram(name, help, tuple(labelnames), **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """Register a function which reads the stats of a component on collection,
+        for counters which are kept by the components themselves.
+        """
+        self.collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        """Metrics of this worker, as JSON serializable dict"""
+        snapshot = {}
+        for metric in self.metrics:
+            snapshot[metric.name] = {
+                "type": metric.type,
+                "help": metric.help,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": metric.samples(),
+            }
+        for collector in self.collectors:
+            for sample in collector():
+                entry = snapshot.setdefault(
+                    sample.name,
+                    {
+                        "type": sample.type,
+                        "help": sample.help,
+                        "labelnames": list(sample.labels),
+                        "buckets": [],
+                        "samples": [],
+                    },
+                )
+                entry["samples"].append([list(sample.labels.values()), sample.value])
+        return snapshot
+
+    def snapshot_path(self) -> str:
+        pid = os.getpid()
+        # Forked workers inherit the registry
+        if self._worker is None or self._worker[0] != pid:
+            self._worker = (pid, int(time.time() * 1000))
+        return os.path.join(self.directory, "{0}-{1}.json".format(*self._worker))
+
+    def write_snapshot(self) -> None:
+        """Write the snapshot of this worker, atomically"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        write_json(self.snapshot_path(), self.snapshot())
+
+    def read_snapshots(self) -> List[dict]:
+        """Snapshots of all the workers, a fresh one of this worker, and the one
+        of the exited workers.
+        """
+        if not self.directory:
+            return [self.snapshot()]
+        self.write_snapshot()
+        with open(os.path.join(self.directory, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            exited = self.fold_exited_snapshots()
+        snapshots = [exited["metrics"]]
+        for name in self.snapshot_names():
+            if name in exited["folded"]:
+                continue
+            snapshot = read_json(os.path.join(self.directory, name))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def snapshot_names(self) -> List[str]:
+        return sorted(
+            name
+            for name in os.listdir(self.directory)
+            if name.endswith(".json") and name != EXITED_SNAPSHOT
+        )
+
+    def fold_exited_snapshots(self) -> dict:
+        """Fold the snapshots of the exited workers into the snapshot of the exited
+        workers, without their gauges, and remove them. Called with the lock of
+        the directory held.
+
+        Returns:
+            dict: The snapshot of the exited workers (`metrics`) and the names of
+            the snapshots folded into it last (`folded`)
+        """
+        path = os.path.join(self.directory, EXITED_SNAPSHOT)
+        exited = read_json(path) or {"folded": [], "metrics": {}}
+        # Left over if the last fold was interrupted
+        for name in exited["folded"]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.directory, name))
+        names = exited_snapshot_names(self.snapshot_names())
+        if not names:
+            return exited
+        snapshots = [exited["metrics"]]
+        for name in names:
+            snapshot = read_json(os.path.join(self.directory, name))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        metrics = {
+            name: {
+                **metric,
+                "samples": [
+                    [list(labels), value] for labels, value in metric["samples"].items()
+                ],
+            }
+            for name, metric in merge(snapshots).items()
+            if metric["type"] != "gauge"
+        }
+        exited = {"folded": names, "metrics": metrics}
+        write_json(path, exited)
+        for name in names:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.directory, name))
+        return exited
+
+    def collect(self) -> str:
+        """Metrics of all the workers in the Prometheus text exposition format"""
+        return render(merge(self.read_snapshots()))
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.write_snapshot()
+            except OSError:  # pragma: no cover # keep the task running
+                logger.exception("Writing the metrics snapshot failed")
+
+    def start(self) -> None:
+        if self._task is None and self.directory:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        with contextlib.suppress(OSError):
+            self.write_snapshot()
+
+
+def read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):  # pragma: no cover # being replaced or removed
+        return None
+
+
+def write_json(path: str, document: dict) -> None:
+    """Write a JSON file atomically"""
+    with open(f"{path}.tmp", "w") as json_file:
+        json.dump(document, json_file, separators=(",", ":"))
+    os.replace(f"{path}.tmp", path)
+
+
+def pid_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover # running as another user
+        return True
+    return True
+
+
+def exited_snapshot_names(names: List[str]) -> List[str]:
+    """Names of the snapshots (`<pid>-<start time>.json`) of the exited workers:
+    their pid isn't running, or a newer worker runs with the same pid.
+    """
+    workers = {}
+    for name in names:
+        pid, _, started = name[: -len(".json")].partition("-")
+        with contextlib.suppress(ValueError):
+            workers[name] = (int(pid), int(started or 0))
+    latest: Dict[int, int] = {}
+    for pid, started in workers.values():
+        latest[pid] = max(latest.get(pid, started), started)
+    return [
+        name
+        for name, (pid, started) in workers.items()
+        if started < latest[pid] or not pid_running(pid)
+    ]
+
+
+def merge(snapshots: List[dict]) -> dict:
+    """Sum the metrics of snapshots by name and label values"""
+    merged: dict = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            entry = merged.setdefault(name, {**metric, "samples": {}})
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                if key not in entry["samples"]:
+                    entry["samples"][key] = value
+                elif metric["type"] == "histogram":
+                    buckets, total, count = entry["samples"][key]
+                    entry["samples"][key] = [
+                        [a + b for a, b in zip(buckets, value[0])],
+                        total + value[1],
+                        count + value[2],
+                    ]
+                else:
+                    entry["samples"][key] += value
+    return merged
+
+
+def format_labels(labelnames: Iterable[str], labels: Iterable[str]) -> str:
+    pairs = ",".join(
+        '{0}="{1}"'.format(
+            name,
+            str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"),
+        )
+        for name, value in zip(labelnames, labels)
+    )
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def render(merged: dict) -> str:
+    """Render merged metrics in the Prometheus text exposition format"""
+    lines = []
+    for name, metric in sorted(merged.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{format_labels(labelnames, labels)} {value}")
+                continue
+            buckets, total, count = value
+            cumulative = 0
+            bounds = [str(bound) for bound in metric["buckets"]] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, buckets):
+                cumulative += bucket_count
+                bucket_labels = format_labels([*labelnames, "le"], [*labels, bound])
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labelnames, labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labelnames, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(
+    directory=settings.METRICS_DIR, flush_interval=settings.METRICS_FLUSH_INTERVAL
+)
+
+# Latency of the stages of the rating and conversion APIs
+stage_latency = metrics.histogram(
+    "rating_stage_duration_seconds",
+    "Latency of the stages of the API requests",
+    labelnames=("endpoint", "stage"),
+)
+# Outdated (or replaced) cache entries dropped on a lookup or a notification
+cache_invalidations = metrics.counter(
+    "rating_cache_invalidations_total",
+    "Cache entries invalidated",
+    labelnames=("cache",),
+)
+# Failed requests to the exchange rate service, or rejected by its circuit breaker
+upstream_failures = metrics.counter(
+    "rating_upstream_failures_total",
+    "Failed exchange rate service requests",
+    labelnames=("reason",),
+)
+
+
+def timed_json_response(endpoint: str) -> Type[JSONResponse]:
+    """JSON response class which observes the latency of its encoding, as the
+    `serialization` stage of the endpoint.
+    """
+
+    class TimedJSONResponse(JSONResponse):
+        def render(self, content) -> bytes:
+            with stage_latency.time(endpoint=endpoint, stage="serialization"):
+                return super().render(content)
+
+    return TimedJSONResponse
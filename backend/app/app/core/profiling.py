@@ -0,0 +1,122 @@
+import asyncio
+import contextlib
+import cProfile
+import hmac
+import os
+import random
+import re
+import time
+from logging import getLogger
+from typing import Optional
+
+logger = getLogger(__name__)
+
+PROFILE_HEADER = b"profile-request"
+# Name of the profile of a request, sent back in a header of its response
+PROFILE_FILE_HEADER = b"profile-file"
+PROFILE_SUFFIX = ".pstats"
+
+
+class ProfilingMiddleware:
+    """ASGI middleware which profiles sampled requests with cProfile, and writes
+    the profile of each one to a pstats file in `directory`, e.g. to be viewed with
+    `python -m pstats` or snakeviz, or converted to a flame graph.
+
+    A request is profiled at random with the probability of `sample_rate`, or if
+    it has a `Profile-Request` header with the `secret`. Only the newest
+    `max_files` profiles are kept. Unsampled requests pass through with a random
+    draw and a header lookup, so the middleware can stay enabled in production.
+
+    cProfile profiles the thread, so a profile includes whatever else the event
+    loop runs meanwhile (e.g. concurrent requests), and a single request of the
+    worker is profiled at a time.
+    """
+
+    def __init__(
+        self,
+        app,
+        directory: str,
+        sample_rate: float = 0,
+        secret: Optional[str] = None,
+        max_files: int = 100,
+    ):
+        self.app = app
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.secret = secret.encode() if secret else None
+        self.max_files = max_files
+        self.profiles = 0
+        self._profiling = False
+
+    def sampled(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if self.secret is None:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, self.secret)
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._profiling or not self.sampled(scope):
+            return await self.app(scope, receive, send)
+
+        name = profile_name(scope)
+
+        async def send_with_profile_name(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (PROFILE_FILE_HEADER, name.encode()),
+                    ],
+                }
+            await send(message)
+
+        self._profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_name)
+        finally:
+            profiler.disable()
+            self._profiling = False
+            await asyncio.get_event_loop().run_in_executor(
+                None, self.write, profiler, name
+            )
+
+    def write(self, profiler: cProfile.Profile, name: str) -> None:
+        """Write a profile and remove the oldest ones beyond `max_files`"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.directory, name))
+            self.profiles += 1
+            profiles = sorted(
+                entry
+                for entry in os.listdir(self.directory)
+                if entry.endswith(PROFILE_SUFFIX)
+            )
+            for entry in profiles[: max(0, len(profiles) - self.max_files)]:
+                # Unless another worker removed it already
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.directory, entry))
+        except OSError:
+            logger.exception("Writing the profile of a request failed")
+
+
+def profile_name(scope) -> str:
+    """Name of the profile file of a request, sorted by time, e.g.
+    `20210405T102700.123456-42-POST-api_v1_rate.pstats`
+    """
+    now = time.time()
+    path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+    return "{0}.{1:06d}-{2}-{3}-{4}{5}".format(
+        time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)),
+        int(now % 1 * 1_000_000),
+        os.getpid(),
+        scope["method"],
+        path[:64],
+        PROFILE_SUFFIX,
+    )
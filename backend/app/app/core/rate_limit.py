@@ -0,0 +1,169 @@
+import asyncio
+import contextlib
+import time
+from logging import getLogger
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.connections import redis_cache
+
+logger = getLogger(__name__)
+
+RATE_LIMIT_KEY = "rate-limit:{0}"
+
+# Refills the buckets of the stack (KEYS) up to the current time (ARGV[1]) and
+# takes the tokens the worker took since its last sync from them. ARGV holds the
+# tokens taken, the rate and the burst of each bucket after the time. Returns the
+# tokens left in each bucket, as strings since Redis truncates Lua numbers
+SYNC_BUCKETS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens_left = {}
+for i, key in ipairs(KEYS) do
+    local taken = tonumber(ARGV[i * 3 - 1])
+    local rate = tonumber(ARGV[i * 3])
+    local burst = tonumber(ARGV[i * 3 + 1])
+    local bucket = redis.call("HMGET", key, "tokens", "updated")
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate) - taken
+    redis.call("HMSET", key, "tokens", tostring(tokens), "updated", tostring(now))
+    redis.call("EXPIRE", key, math.ceil(burst / rate) + 60)
+    tokens_left[i] = tostring(tokens)
+end
+return tokens_left
+"""
+
+
+class TokenBucket:
+    """Token bucket of a tenant in a worker: filled with `rate` tokens a second up
+    to `burst` tokens, and a request takes one.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "taken")
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+        # Tokens taken since the last sync with Redis
+        self.taken = 0
+
+    def take(self, now: float) -> float:
+        """Take a token.
+
+        Returns:
+            float: 0 if a token was taken, else the seconds until there is one
+        """
+        self.tokens = min(
+            self.burst, self.tokens + max(0.0, now - self.updated) * self.rate
+        )
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.taken += 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Per tenant rate limiter, with a token bucket per tenant.
+
+    Requests are let through or rejected by the buckets of the worker, without a
+    request to Redis. Every `interval`, the tokens the worker took are taken from
+    the buckets of the stack in Redis, in a single script call for all the
+    tenants, and the buckets of the worker are set to what is left there, so the
+    workers see the requests of each other. Between two syncs each worker lets
+    its share of requests through on its own, so the stack may exceed a rate by
+    up to the requests of an interval of the other workers.
+    If Redis is down, each worker keeps limiting on its own.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        quotas: Dict[str, float],
+        interval: float,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.quotas = quotas
+        self.interval = interval
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.rejected: Dict[str, int] = {}
+        self.syncs = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 or any(rate > 0 for rate in self.quotas.values())
+
+    def acquire(self, tenant: str) -> float:
+        """Let a request of a tenant through, if there's a token left.
+
+        Returns:
+            float: 0 if the request may go on, else the seconds to retry after
+        """
+        bucket = self.buckets.get(tenant)
+        if bucket is None:
+            rate = self.quotas.get(tenant, self.rate)
+            if rate <= 0:
+                return 0
+            bucket = self.buckets[tenant] = TokenBucket(rate, self.burst, time.time())
+        retry_after = bucket.take(time.time())
+        if retry_after:
+            self.rejected[tenant] = self.rejected.get(tenant, 0) + 1
+        return retry_after
+
+    async def sync(self) -> None:
+        """Reconcile the buckets of the worker with the buckets of the stack"""
+        now = time.time()
+        synced: List[Tuple[TokenBucket, int]] = []
+        keys, args = [], [repr(now)]
+        for tenant, bucket in self.buckets.items():
+            synced.append((bucket, bucket.taken))
+            keys.append(RATE_LIMIT_KEY.format(tenant))
+            args.extend((bucket.taken, repr(bucket.rate), bucket.burst))
+        if not synced:
+            return
+        tokens_left = await redis_cache.eval(SYNC_BUCKETS_SCRIPT, keys=keys, args=args)
+        for (bucket, taken), tokens in zip(synced, tokens_left):
+            # Keep the tokens taken while waiting for Redis, for the next sync
+            bucket.taken -= taken
+            bucket.tokens = float(tokens) - bucket.taken
+            bucket.updated = max(bucket.updated, now)
+        self.syncs += 1
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception:  # pragma: no cover # keep the task running
+                logger.exception("Syncing the rate limits with Redis failed")
+
+    def start(self) -> None:
+        if self._task is None and self.enabled:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        # Hand the tokens taken since the last sync over to the other workers
+        try:
+            await self.sync()
+        except Exception:  # pragma: no cover
+            logger.exception("Syncing the rate limits with Redis failed")
+
+
+rate_limiter = RateLimiter(
+    rate=settings.RATE_LIMIT_RATE,
+    burst=settings.RATE_LIMIT_BURST,
+    quotas=settings.RATE_LIMIT_QUOTAS,
+    interval=settings.RATE_LIMIT_SYNC_INTERVAL,
+)
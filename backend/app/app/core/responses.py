@@ -0,0 +1,129 @@
+import asyncio
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Optional, Type
+
+from starlette.concurrency import run_until_first_complete
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import stage_latency
+from app.schemas import Currency
+
+Serializer = Callable[[Any], bytes]
+BodyHandler = Callable[[AsyncIterator[bytes]], AsyncIterable[bytes]]
+
+# Templates of the result shapes, in the field order of the response models and
+# with the compact separators of `JSONResponse`
+RATE_RESULT = (
+    '{{"overall":{0!r},"components":'
+    '{{"energy":{1!r},"time":{2!r},"transaction":{3!r}}}'
+)
+CONVERTED_RATE_RESULT = RATE_RESULT + ',"currency":"{4}"'
+
+
+def rate_components(result: dict) -> tuple:
+    components = result["components"]
+    return (
+        float(result["overall"]),
+        float(components["energy"]),
+        float(components["time"]),
+        float(components["transaction"]),
+    )
+
+
+def serialize_rate_result(result: dict) -> bytes:
+    """Serialize a result of `rate_cdr` as its `RateResult`, e.g. the formatted
+    rates (`"3.277"`) as numbers, the same bytes as the validated response model.
+    """
+    return (RATE_RESULT.format(*rate_components(result)) + "}").encode()
+
+
+def serialize_converted_rate_result(result: dict) -> bytes:
+    """Serialize a converted rate as its `ConvertedRateResult`, `stale` is only
+    included if it's set, as with `response_model_exclude_unset`.
+    """
+    currency = Currency(result["currency"]).value
+    body = CONVERTED_RATE_RESULT.format(*rate_components(result), currency)
+    if "stale" in result:
+        body += ',"stale":true' if result["stale"] else ',"stale":false'
+    return (body + "}").encode()
+
+
+def fast_json_response(endpoint: str, serializer: Serializer) -> Type[Response]:
+    """JSON response class of a result shape, which serializes its content with
+    the serializer, observed as the `serialization` stage of the endpoint.
+
+    Routes return it instead of the result (see `fast_response`), so FastAPI
+    neither validates the result against the response model of the route nor
+    encodes it again, while the model still documents the response.
+    """
+
+    class FastJSONResponse(Response):
+        media_type = "application/json"
+
+        def render(self, content) -> bytes:
+            with stage_latency.time(endpoint=endpoint, stage="serialization"):
+                return serializer(content)
+
+    return FastJSONResponse
+
+
+def fast_response(
+    response_class: Type[Response],
+    result: dict,
+    headers: Optional[Dict[str, str]] = None,
+):
+    """The result as a fast JSON response if `FAST_RESPONSES` is set, otherwise the
+    result itself, to be validated and encoded by FastAPI.
+    Only for results built by the service itself, which match the response model.
+    """
+    if not settings.FAST_RESPONSES:
+        return result
+    return response_class(result, headers=headers)
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """Streaming response of the request body, e.g. its rated records, which may
+    start before the upload finishes.
+
+    `StreamingResponse` listens for the disconnect of the client on `receive`,
+    so it would take the messages of the body from under `Request.stream`.
+    Instead, a single reader takes every message: the chunks of the body are
+    passed on to the handler, through a queue of a single chunk so the upload
+    is read as fast as the handler goes, and a disconnect stops the response.
+    """
+
+    def __init__(self, handler: BodyHandler, **kwargs: Any):
+        super().__init__(content=(), **kwargs)
+        self.handler = handler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+        async def body() -> AsyncIterator[bytes]:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    return
+                yield chunk
+
+        async def read_messages() -> None:
+            more_body = True
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                if more_body and message["type"] == "http.request":
+                    if message.get("body"):
+                        await chunks.put(message["body"])
+                    more_body = message.get("more_body", False)
+                    if not more_body:
+                        await chunks.put(None)
+
+        self.body_iterator = self.handler(body())
+        await run_until_first_complete(
+            (self.stream_response, {"send": send}),
+            (read_messages, {}),
+        )
+        if self.background is not None:
+            await self.background()
@@ -1,16 +1,53 @@
+import hashlib
+from typing import Dict, Optional
+
 from fastapi import Security
 from fastapi.exceptions import HTTPException
 from fastapi.security.api_key import APIKey, APIKeyHeader
 
 from app.core.config import settings
+from app.core.exception import too_many_requests
+from app.core.rate_limit import rate_limiter
 
 API_KEY_NAME = "API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME)
+# Tenant of the `API_KEY_SECRET`
+DEFAULT_TENANT = "default"
+
+
+def hash_api_key(api_key: str) -> str:
+    """SHA-256 hex digest of an API key, as kept in `API_KEYS`"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class APIKeyRegistry:
+    """Tenants of the API keys, by the digests of their keys.
+
+    Only the digests are kept, and a key is looked up by its digest, so the time
+    of a lookup doesn't tell anything about the keys: it only depends on how
+    much of the digest of the sent key matches one of them, and a key can't be
+    guessed from its digest.
+    """
+
+    def __init__(self, keys: Dict[str, str], secret: Optional[str] = None):
+        self._tenants = {digest.lower(): tenant for tenant, digest in keys.items()}
+        if secret:
+            self._tenants[hash_api_key(secret)] = DEFAULT_TENANT
+
+    def tenant_of(self, api_key: str) -> Optional[str]:
+        return self._tenants.get(hash_api_key(api_key))
+
+
+api_keys = APIKeyRegistry(settings.API_KEYS, secret=settings.API_KEY_SECRET)
 
 
 async def get_api_key(
     api_key_header: str = Security(api_key_header),
 ) -> APIKey:  # pragma: no cover - it is tested in test_security
-    if api_key_header == settings.API_KEY_SECRET:
-        return api_key_header
-    raise HTTPException(status_code=403, detail="WRONG API KEY - not authorized")
+    tenant = api_keys.tenant_of(api_key_header)
+    if tenant is None:
+        raise HTTPException(status_code=403, detail="WRONG API KEY - not authorized")
+    retry_after = rate_limiter.acquire(tenant)
+    if retry_after:
+        too_many_requests(retry_after)
+    return api_key_header
@@ -1,9 +1,22 @@
+from logging import getLogger
+
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.api_v1.api import api_router
+from app.api.helpers.refresh import rate_refresher
+from app.api.helpers.results import result_cache
+from app.api.helpers.shared_rates import shared_rates
+from app.api.helpers.stats import collect_stats
+from app.api.helpers.tariffs import tariff_registry
+from app.api.metrics import router as metrics_router
 from app.core.config import settings
-from app.core.connections import redis_cache
+from app.core.connections import http_client, redis_cache
+from app.core.metrics import metrics
+from app.core.profiling import ProfilingMiddleware
+from app.core.rate_limit import rate_limiter
+
+logger = getLogger(__name__)
 
 app = FastAPI(
     title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json"
@@ -20,14 +33,43 @@ if settings.BACKEND_CORS_ORIGINS:
     )
 
 
+# Profile sampled requests, or those with the profiling header
+if settings.PROFILER_SAMPLE_RATE or settings.PROFILER_SECRET:
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=settings.PROFILER_DIR,
+        sample_rate=settings.PROFILER_SAMPLE_RATE,
+        secret=settings.PROFILER_SECRET,
+        max_files=settings.PROFILER_MAX_FILES,
+    )
+
+
 @app.on_event("startup")
 async def startup_event(db=0):
     await redis_cache.init_cache(db=db)
+    await http_client.init_session()
+    tariff_registry.start()
+    shared_rates.start()
+    rate_limiter.start()
+    metrics.start()
+    if settings.RATE_REFRESH_ENABLED:
+        rate_refresher.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await rate_refresher.stop()
+    await tariff_registry.stop()
+    await shared_rates.stop()
+    await rate_limiter.stop()
+    await metrics.stop()
+    logger.info("HTTP client pool: %s", http_client.stats())
+    logger.info("Result cache: %s", result_cache.stats())
+    await http_client.close()
     await redis_cache.close()
 
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
+app.include_router(metrics_router)
+
+metrics.register_collector(collect_stats)
@@ -1,2 +1,4 @@
+from .batch import BatchRateItem, BatchRateItemResult, BatchRateResult
 from .conversion import ConvertedRateResult, Currency
 from .rate import CDR, Rate, RateResult
+from .tariff import EnergyTier, Tariff, TariffRecord, TimeWindow
@@ -0,0 +1,31 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from .rate import CDR, Rate, RateResult
+
+
+class BatchRateItem(BaseModel):
+    """A single rate/CDR pair inside of a batch rating request"""
+
+    rate: Rate
+    cdr: CDR
+
+
+class BatchRateItemResult(BaseModel):
+    """Result of a single batch item.
+    Exactly one of `result` or `error` is set, `index` refers to the position
+    of the item inside of the request.
+    """
+
+    index: int
+    result: Optional[RateResult] = None
+    error: Optional[str] = None
+
+
+class BatchRateResult(BaseModel):
+    """Response model class for batch rating"""
+
+    rated: int
+    failed: int
+    results: List[BatchRateItemResult]
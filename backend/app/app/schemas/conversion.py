@@ -1,5 +1,7 @@
 from enum import Enum
 
+from pydantic import Field
+
 from .rate import RateResult
 
 
@@ -13,3 +15,8 @@ class Currency(Enum):
 
 class ConvertedRateResult(RateResult):
     currency: Currency
+    stale: bool = Field(
+        False,
+        description="The rate is outdated, since the exchange rate service "
+        "isn't available. Only included if it's true",
+    )
@@ -0,0 +1,84 @@
+import datetime
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, Field, validator
+
+from .rate import Rate
+
+
+class TimeWindow(BaseModel):
+    """Prices of a time of day window (UTC), from `start` until `end`.
+    A window which ends before its start spans midnight, and the prices which
+    aren't set are those of the tariff.
+    """
+
+    start: datetime.time
+    end: datetime.time
+    energy: Optional[float] = Field(
+        None, gt=0, description="The price must be greater than zero"
+    )
+    time: Optional[float] = Field(
+        None, gt=0, description="The price must be greater than zero"
+    )
+
+    @validator("end")
+    def end_differs_from_start(cls, end, values):
+        if "start" in values and end == values["start"]:
+            raise ValueError("a window can't end at its start")
+        return end
+
+    def seconds(self) -> Tuple[int, int]:
+        """Start and end of the window, in seconds of the day"""
+        return tuple(
+            moment.hour * 3600 + moment.minute * 60 + moment.second
+            for moment in (self.start, self.end)
+        )
+
+    def covers(self, second: int) -> bool:
+        start, end = self.seconds()
+        if start < end:
+            return start <= second < end
+        return second >= start or second < end
+
+
+class EnergyTier(BaseModel):
+    """Energy price of the consumption of a session above `from_kwh`"""
+
+    from_kwh: float = Field(..., ge=0)
+    energy: float = Field(..., gt=0, description="The price must be greater than zero")
+
+
+class Tariff(Rate):
+    """Rate components along with time of use windows and consumption tiers.
+    The rate components are the prices outside of the windows, and the energy
+    price below the first tier. The energy price of a window takes precedence
+    over the tiers.
+    """
+
+    windows: List[TimeWindow] = Field([], description="Must not overlap")
+    tiers: List[EnergyTier] = Field([], description="Ordered by from_kwh")
+
+    @validator("windows")
+    def windows_dont_overlap(cls, windows):
+        boundaries = {0}
+        for window in windows:
+            boundaries.update(window.seconds())
+        for second in boundaries:
+            if sum(window.covers(second) for window in windows) > 1:
+                raise ValueError("windows can't overlap")
+        return windows
+
+    @validator("tiers")
+    def tiers_are_ordered(cls, tiers):
+        thresholds = [tier.from_kwh for tier in tiers]
+        if any(low >= high for low, high in zip(thresholds, thresholds[1:])):
+            raise ValueError("tiers must be ordered by from_kwh, without duplicates")
+        return tiers
+
+
+class TariffRecord(BaseModel):
+    """Response model class for a tariff of the tariff registry"""
+
+    id: str
+    version: int = Field(..., description="Incremented on every update")
+    tariff: Tariff
@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+
+headers = {"API-Key": settings.API_KEY_SECRET}
+
+
+def test_batch_correct_result(client: TestClient, rate_cdr_obj: dict) -> None:
+    rate_cdr_obj = json.loads(rate_cdr_obj)
+    wrong_cdr_obj = json.loads(json.dumps(rate_cdr_obj))
+    wrong_cdr_obj["cdr"]["meter_stop"] = 0
+    expected_output = {
+        "rated": 1,
+        "failed": 1,
+        "results": [
+            {
+                "index": 0,
+                "result": {
+                    "overall": 7.04,
+                    "components": {"energy": 3.277, "time": 2.767, "transaction": 1},
+                },
+                "error": None,
+            },
+            {
+                "index": 1,
+                "result": None,
+                "error": "BAD REQUEST - reason: meter_start cannot be greater "
+                "than meter_stop or be equal!",
+            },
+        ],
+    }
+    r = client.post(
+        f"{settings.API_V1_STR}/rates/batch",
+        json=[rate_cdr_obj, wrong_cdr_obj],
+        headers=headers,
+    )
+    assert r.status_code == 200
+    assert r.json() == expected_output
+
+
+def test_batch_schema_validation(client: TestClient, rate_cdr_obj: dict) -> None:
+    rate_cdr_obj = json.loads(rate_cdr_obj)
+    rate_cdr_obj["rate"]["energy"] = 0
+    r = client.post(
+        f"{settings.API_V1_STR}/rates/batch", json=[rate_cdr_obj], headers=headers
+    )
+    assert r.status_code == 422
+
+
+def test_stream_correct_result(client: TestClient, rate_cdr_obj: dict) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/rates/stream",
+        data="\n".join([rate_cdr_obj, "[]", rate_cdr_obj]),
+        headers=headers,
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    results = [json.loads(line) for line in r.text.splitlines()]
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert results[0]["result"] == {
+        "overall": 7.04,
+        "components": {"energy": 3.277, "time": 2.767, "transaction": 1},
+    }
+    assert results[1]["result"] is None
+
+
+@pytest.mark.asyncio
+async def test_stream_chunked_upload(rate_cdr_obj: dict) -> None:
+    body = "".join(rate_cdr_obj + "\n" for _ in range(20)).encode()
+    # The body split across several messages, with records spanning two of them,
+    # and a response which may start before the upload finishes
+    messages = [
+        {"type": "http.request", "body": body[offset : offset + 100], "more_body": True}
+        for offset in range(0, len(body), 100)
+    ]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+    response_complete = asyncio.Event()
+    sent = []
+
+    async def receive() -> dict:
+        await asyncio.sleep(0)
+        if messages:
+            return messages.pop(0)
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+        if message["type"] == "http.response.body" and not message["more_body"]:
+            response_complete.set()
+
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": f"{settings.API_V1_STR}/rates/stream",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"api-key", settings.API_KEY_SECRET.encode())],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    assert sent[0]["status"] == 200
+    lines = b"".join(message.get("body", b"") for message in sent[1:]).splitlines()
+    results = [json.loads(line) for line in lines]
+    assert [result["index"] for result in results] == list(range(20))
+    assert all(result["error"] is None for result in results)
@@ -1,8 +1,12 @@
 import json
+import uuid
+from datetime import date, timedelta
 from numbers import Number
 
 from fastapi.testclient import TestClient
 
+from app.api.api_v1.endpoints import rate as rate_endpoints
+from app.api.helpers.results import result_cache
 from app.core.config import settings
 
 headers = {"API-Key": settings.API_KEY_SECRET}
@@ -91,3 +95,145 @@ def test_currency_conversion(client: TestClient, clear_cache) -> None:
     assert r.status_code == 200
     result = r.json()
     assert isinstance(result.get("overall"), Number)
+
+
+def test_currency_conversion_memoized(client: TestClient, monkeypatch) -> None:
+    async def get_conversion_result_from_cache(currency, stale=False):
+        return {"rate": 1.176132, "date": "2021-08-08"}
+
+    monkeypatch.setattr(
+        rate_endpoints,
+        "get_conversion_result_from_cache",
+        get_conversion_result_from_cache,
+    )
+    # An amount of its own, so the result isn't memoized by an earlier run
+    overall = 10 + uuid.uuid4().int % 10_000 / 10_000
+    params = [("overall", overall), ("energy", 4), ("time", 3), ("transaction", 3)]
+    result_cache.clear()
+    misses = result_cache.misses
+    r = client.get(
+        f"{settings.API_V1_STR}/rate/converted-rate/", headers=headers, params=params
+    )
+    assert r.status_code == 200
+    assert r.json()["currency"] == "USD"
+    assert result_cache.misses == misses + 1
+    # Read back from redis, as if it's requested from another worker
+    result_cache.clear()
+    cached = client.get(
+        f"{settings.API_V1_STR}/rate/converted-rate/", headers=headers, params=params
+    )
+    assert cached.status_code == 200
+    assert cached.json() == r.json()
+    assert result_cache.redis_hits >= 1
+
+
+def test_future_session_date(client: TestClient) -> None:
+
+    r = client.get(
+        f"{settings.API_V1_STR}/rate/converted-rate/",
+        headers=headers,
+        params=[
+            ("overall", 10),
+            ("energy", 4),
+            ("time", 3),
+            ("transaction", 3),
+            ("currency", "USD"),
+            ("date", (date.today() + timedelta(days=2)).isoformat()),
+        ],
+    )
+    assert r.status_code == 400
+
+
+rate_query = [
+    ("energy", 0.3),
+    ("time", 2),
+    ("transaction", 1),
+    ("timestamp_start", "2021-04-05T10:04:00Z"),
+    ("timestamp_stop", "2021-04-05T11:27:00Z"),
+    ("meter_start", 1204307),
+    ("meter_stop", 1215230),
+]
+
+
+def test_get_rate_caching_headers(client: TestClient) -> None:
+    expected_output = {
+        "overall": 7.04,
+        "components": {"energy": 3.277, "time": 2.767, "transaction": 1},
+    }
+    r = client.get(f"{settings.API_V1_STR}/rate/", headers=headers, params=rate_query)
+    assert r.status_code == 200
+    assert r.json() == expected_output
+    assert r.headers["Cache-Control"] == (
+        f"public, max-age={settings.RATE_CACHE_MAX_AGE}"
+    )
+    etag = r.headers["ETag"]
+
+    # The same input in any order and encoding has the same entity tag
+    equivalent_query = [("time", "2.0")] + rate_query[::-1][:-2] + [("energy", 0.3)]
+    r = client.get(
+        f"{settings.API_V1_STR}/rate/", headers=headers, params=equivalent_query
+    )
+    assert r.headers["ETag"] == etag
+
+    r = client.get(
+        f"{settings.API_V1_STR}/rate/",
+        headers={**headers, "If-None-Match": f'"other", W/{etag}'},
+        params=rate_query,
+    )
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert not r.content
+
+
+def test_get_rate_validation(client: TestClient) -> None:
+    query = dict(rate_query, timestamp_stop="2021-04-05T09:00:00Z")
+    r = client.get(f"{settings.API_V1_STR}/rate/", headers=headers, params=query)
+    assert r.status_code == 400
+    assert "ETag" not in r.headers
+
+
+def test_get_rate_memoized(client: TestClient) -> None:
+    result_cache.clear()
+    r = client.get(f"{settings.API_V1_STR}/rate/", headers=headers, params=rate_query)
+    hits = result_cache.hits
+    for _ in range(2):
+        cached = client.get(
+            f"{settings.API_V1_STR}/rate/", headers=headers, params=rate_query
+        )
+        assert cached.content == r.content
+        # As if it's requested from another worker
+        result_cache.clear()
+    # A hit of the in process cache and a hit of redis
+    assert result_cache.hits == hits + 2
+
+
+def test_fast_responses(client: TestClient, monkeypatch) -> None:
+    conversion_query = [
+        ("overall", 10),
+        ("energy", 4),
+        ("time", 3.5),
+        ("transaction", 3),
+        ("currency", "EUR"),
+    ]
+    requests = [
+        ("get", f"{settings.API_V1_STR}/rate/", {"params": rate_query}),
+        (
+            "get",
+            f"{settings.API_V1_STR}/rate/converted-rate/",
+            {"params": conversion_query},
+        ),
+    ]
+    validated = [
+        client.request(method, url, headers=headers, **kwargs)
+        for method, url, kwargs in requests
+    ]
+    monkeypatch.setattr(settings, "FAST_RESPONSES", True)
+    for (method, url, kwargs), expected in zip(requests, validated):
+        r = client.request(method, url, headers=headers, **kwargs)
+        assert r.status_code == 200
+        assert r.content == expected.content
+        assert r.headers["Content-Type"] == "application/json"
+    # The headers of the GET rating API are kept
+    assert r.headers.get("ETag") is None
+    r = client.get(f"{settings.API_V1_STR}/rate/", headers=headers, params=rate_query)
+    assert r.headers["ETag"] == validated[0].headers["ETag"]
@@ -0,0 +1,102 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+headers = {"API-Key": settings.API_KEY_SECRET}
+tariff = {"energy": 0.3, "time": 2, "transaction": 1}
+cdr = {
+    "timestamp_start": "2021-04-05T10:04:00Z",
+    "timestamp_stop": "2021-04-05T11:27:00Z",
+    "meter_start": 1204307,
+    "meter_stop": 1215230,
+}
+
+
+def test_tariffs_crud(client: TestClient, clear_cache) -> None:
+    url = f"{settings.API_V1_STR}/tariffs/ac-22"
+    r = client.put(url, json=tariff, headers=headers)
+    assert r.status_code == 200
+    record = r.json()
+    assert (record["id"], record["tariff"]) == (
+        "ac-22",
+        {**tariff, "windows": [], "tiers": []},
+    )
+
+    r = client.get(url, headers=headers)
+    assert r.json() == record
+    r = client.get(f"{settings.API_V1_STR}/tariffs/", headers=headers)
+    assert [record["id"] for record in r.json()] == ["ac-22"]
+
+    r = client.delete(url, headers=headers)
+    assert r.status_code == 204
+    assert client.get(url, headers=headers).status_code == 404
+    assert client.delete(url, headers=headers).status_code == 404
+    assert (
+        client.get(f"{settings.API_V1_STR}/tariffs/a b", headers=headers).status_code
+        == 422
+    )
+    clear_cache()
+
+
+def test_rate_with_tariff_id(client: TestClient, clear_cache) -> None:
+    client.put(f"{settings.API_V1_STR}/tariffs/ac-22", json=tariff, headers=headers)
+    r = client.post(
+        f"{settings.API_V1_STR}/rate/",
+        json={"tariff_id": "ac-22", "cdr": cdr},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    assert r.json() == {
+        "overall": 7.04,
+        "components": {"energy": 3.277, "time": 2.767, "transaction": 1},
+    }
+
+    r = client.post(
+        f"{settings.API_V1_STR}/rate/",
+        json={"tariff_id": "missing", "cdr": cdr},
+        headers=headers,
+    )
+    assert r.status_code == 404
+    # Either a rate or a tariff id
+    r = client.post(
+        f"{settings.API_V1_STR}/rate/",
+        json={"tariff_id": "ac-22", "rate": tariff, "cdr": cdr},
+        headers=headers,
+    )
+    assert r.status_code == 400
+    clear_cache()
+
+
+def test_rate_with_time_of_use_tariff(client: TestClient, clear_cache) -> None:
+    time_of_use = {
+        **tariff,
+        "windows": [{"start": "11:00", "end": "12:00", "energy": 0.5, "time": 4}],
+        "tiers": [{"from_kwh": 100, "energy": 0.2}],
+    }
+    url = f"{settings.API_V1_STR}/tariffs/tou"
+    r = client.put(url, json=time_of_use, headers=headers)
+    assert r.status_code == 200
+    assert r.json()["tariff"]["windows"][0]["start"] == "11:00:00"
+
+    r = client.post(
+        f"{settings.API_V1_STR}/rate/",
+        json={
+            "tariff_id": "tou",
+            "cdr": {
+                "timestamp_start": "2021-04-05T10:00:00Z",
+                "timestamp_stop": "2021-04-05T12:00:00Z",
+                "meter_start": 0,
+                "meter_stop": 10000,
+            },
+        },
+        headers=headers,
+    )
+    assert r.json() == {
+        "overall": 11,
+        "components": {"energy": 4, "time": 6, "transaction": 1},
+    }
+
+    overlapping = {**time_of_use, "windows": time_of_use["windows"] * 2}
+    assert client.put(url, json=overlapping, headers=headers).status_code == 422
+    client.delete(url, headers=headers)
+    clear_cache()
@@ -1,10 +1,14 @@
 import json
+from datetime import datetime
 from typing import Generator
 
 import pytest
 from fastapi.testclient import TestClient
 from redis import Redis
 
+from app.api.helpers.cache import local_cache
+from app.api.helpers.records import rate_record_of
+from app.api.helpers.results import result_cache
 from app.core.config import settings
 from app.main import app, shutdown_event, startup_event
 
@@ -47,22 +51,38 @@ def redis_connection():
 def clear_cache(redis_connection):
     def _clear_cache():
         redis_connection.flushdb()
+        local_cache.clear()
+        result_cache.clear()
 
     _clear_cache()
     return _clear_cache
 
 
 @pytest.fixture
-def raw_conversion_result():
+def raw_rate_table():
     return {
         "motd": {
             "msg": "If you or your company use this project or like what we doing, please consider backing us so we can continue maintaining and evolving this project.",
             "url": "https://exchangerate.host/#/donate",
         },
         "success": True,
-        "query": {"from": "EUR", "to": "USD", "amount": 10},
-        "info": {"rate": 1.176132},
-        "historical": False,
+        "base": "EUR",
         "date": "2021-08-08",
-        "result": 11.761324,
+        "rates": {
+            "USD": 1.176132,
+            "GBP": 0.848218,
+            "JPY": 129.826443,
+            "CAD": 1.474531,
+            "EUR": 1,
+        },
     }
+
+
+@pytest.fixture
+def raw_rate_record(raw_rate_table):
+    return rate_record_of(raw_rate_table, fetched_at=datetime(2021, 8, 8, 10))
+
+
+@pytest.fixture
+def conversion_result():
+    return {"rate": 1.176132, "date": "2021-08-08"}
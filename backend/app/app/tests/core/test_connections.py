@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.core.connections import HTTPClient, epoch_milliseconds, redis_cache
+
+
+@pytest.fixture
+async def exchange_server():
+    async def latest(request):
+        return web.json_response({"success": True, "rates": {"USD": 1.17}})
+
+    app = web.Application()
+    app.router.add_get("/latest", latest)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_http_client_reuses_connections(exchange_server):
+    http_client = HTTPClient()
+    await http_client.init_session()
+    for _ in range(3):
+        async with http_client.get(exchange_server.make_url("/latest")) as response:
+            assert (await response.json())["rates"] == {"USD": 1.17}
+    stats = http_client.stats()
+    assert (stats["created"], stats["reused"]) == (1, 2)
+    assert (stats["acquired"], stats["idle"]) == (0, 1)
+    await http_client.close()
+    assert http_client.stats()["limit"] == 0
+
+
+def test_epoch_milliseconds():
+    assert epoch_milliseconds(datetime(1970, 1, 2, 0, 0, 1, 500)) == 86_401_000
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_expire_at_and_pipelines(
+    redis_connection, redis_test_database
+):
+    expire_at = datetime.utcnow() + timedelta(seconds=60)
+    await redis_cache.set_expire_at("key", "value", expire_at)
+    value, ttl = await redis_cache.get_with_ttl("key")
+    assert value == b"value"
+    assert 59_000 < ttl <= 60_000
+    assert await redis_cache.get_with_ttl("missing") == (None, -2)
+    assert await redis_cache.mget("key", "missing") == [b"value", None]
+
+    pipeline = redis_cache.pipeline()
+    pipeline.incr("counter")
+    pipeline.incr("counter")
+    assert await pipeline.execute() == [1, 2]
+    # Keys set to expire in the past are dropped
+    await redis_cache.set_expire_at("key", "value", datetime(2021, 4, 5))
+    assert not redis_connection.exists("key")
+    redis_connection.flushdb()
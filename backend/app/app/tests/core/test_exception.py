@@ -1,7 +1,12 @@
 import pytest
 from fastapi import HTTPException
 
-from app.core.exception import bad_request, wrong_isoformat
+from app.core.exception import (
+    bad_request,
+    not_found,
+    too_many_requests,
+    wrong_isoformat,
+)
 
 
 def test_bad_request() -> None:
@@ -17,3 +22,18 @@ def test_wrong_isoformat() -> None:
         http_exception.value.detail
         == "Invalid timestamp - timestamp should be of type isoformat"
     )
+
+
+def test_not_found() -> None:
+    with pytest.raises(HTTPException) as http_exception:
+        not_found(err="tariff abc")
+    assert http_exception.value.status_code == 404
+    assert http_exception.value.detail == "NOT FOUND - tariff abc"
+
+
+def test_too_many_requests() -> None:
+    with pytest.raises(HTTPException) as http_exception:
+        too_many_requests(retry_after=0.2)
+    assert http_exception.value.status_code == 429
+    assert http_exception.value.headers == {"Retry-After": "1"}
+    assert http_exception.value.detail == "TOO MANY REQUESTS - retry after 1 seconds"
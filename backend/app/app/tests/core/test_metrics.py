@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.metrics import CONTENT_TYPE, MetricsRegistry, Sample
+
+
+def test_metrics_render() -> None:
+    registry = MetricsRegistry(directory=None, flush_interval=5)
+    requests = registry.counter("requests_total", "Requests", labelnames=("code",))
+    latency = registry.histogram(
+        "latency_seconds", "Latency", labelnames=("stage",), buckets=(0.1, 1)
+    )
+    requests.inc(code="200")
+    requests.inc(2, code="200")
+    latency.observe(0.05, stage="calculation")
+    latency.observe(0.5, stage="calculation")
+    registry.register_collector(
+        lambda: [Sample("entries", "gauge", "Entries", {"cache": 'a"b'}, 3)]
+    )
+
+    lines = registry.collect().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{code="200"} 3' in lines
+    assert 'latency_seconds_bucket{stage="calculation",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="calculation",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="calculation",le="+Inf"} 2' in lines
+    assert 'latency_seconds_sum{stage="calculation"} 0.55' in lines
+    assert 'latency_seconds_count{stage="calculation"} 2' in lines
+    assert 'entries{cache="a\\"b"} 3' in lines
+
+
+def test_metrics_of_workers_are_merged(tmp_path) -> None:
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=5)
+    requests = registry.counter("requests_total", "Requests")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(1,))
+    requests.inc()
+    latency.observe(0.5)
+    # Snapshot of another worker
+    (tmp_path / "1.json").write_text(json.dumps(registry.snapshot()))
+
+    requests.inc()
+    lines = registry.collect().splitlines()
+    assert "requests_total 3" in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert "latency_seconds_count 2" in lines
+
+
+def exited_pid() -> int:
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+
+def test_metrics_of_exited_workers(tmp_path) -> None:
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=5)
+    requests = registry.counter("requests_total", "Requests")
+    entries = 3
+    registry.register_collector(
+        lambda: [Sample("entries", "gauge", "Entries", {}, entries)]
+    )
+    requests.inc()
+    snapshot = json.dumps(registry.snapshot())
+    # An exited worker, and a worker whose pid was reused by a newer one
+    (tmp_path / f"{exited_pid()}-1000.json").write_text(snapshot)
+    (tmp_path / "1-1000.json").write_text(snapshot)
+    (tmp_path / "1-2000.json").write_text(snapshot)
+
+    lines = registry.collect().splitlines()
+    assert "requests_total 4" in lines
+    # Only the gauges of the running workers
+    assert "entries 6" in lines
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == sorted(
+        ["1-2000.json", os.path.basename(registry.snapshot_path()), "exited.json"]
+    )
+    # Counted once
+    assert registry.collect().splitlines() == lines
+
+
+def test_metrics_endpoint(client: TestClient, clear_cache) -> None:
+    client.post(
+        f"{settings.API_V1_STR}/rate/",
+        json={
+            "rate": {"energy": 0.3, "time": 2, "transaction": 1},
+            "cdr": {
+                "timestamp_start": "2021-04-05T10:04:00Z",
+                "timestamp_stop": "2021-04-05T11:27:00Z",
+                "meter_start": 1204307,
+                "meter_stop": 1215230,
+            },
+        },
+        headers={"API-Key": settings.API_KEY_SECRET},
+    )
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == f"{CONTENT_TYPE}; charset=utf-8"
+    # The result might be memoized in Redis already
+    for stage in ("cache", "serialization"):
+        assert (
+            f'rating_stage_duration_seconds_count{{endpoint="rate",stage="{stage}"}}'
+            in r.text
+        )
+    assert 'rating_cache_lookups_total{cache="results",result="hit"}' in r.text
+    clear_cache()
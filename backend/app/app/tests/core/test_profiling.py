@@ -0,0 +1,39 @@
+import pstats
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.profiling import ProfilingMiddleware
+
+
+def profiled_app(directory, **kwargs) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/rate/")
+    async def rate() -> dict:
+        return {"overall": sum(range(1000))}
+
+    app.add_middleware(ProfilingMiddleware, directory=str(directory), **kwargs)
+    return app
+
+
+def test_profile_requests_with_the_header(tmp_path) -> None:
+    client = TestClient(profiled_app(tmp_path, secret="secret"))
+    r = client.get("/rate/")
+    assert r.status_code == 200
+    assert "profile-file" not in r.headers
+    assert client.get("/rate/", headers={"Profile-Request": "wrong"}).status_code == 200
+    assert list(tmp_path.iterdir()) == []
+
+    r = client.get("/rate/", headers={"Profile-Request": "secret"})
+    assert r.json() == {"overall": 499500}
+    profile = tmp_path / r.headers["profile-file"]
+    assert profile.name.endswith("-GET-rate.pstats")
+    functions = pstats.Stats(str(profile)).stats
+    assert any(name == "rate" for _, _, name in functions)
+
+
+def test_sampled_profiles_are_rotated(tmp_path) -> None:
+    client = TestClient(profiled_app(tmp_path, sample_rate=1, max_files=2))
+    names = [client.get("/rate/").headers["profile-file"] for _ in range(3)]
+    assert sorted(path.name for path in tmp_path.iterdir()) == names[1:]
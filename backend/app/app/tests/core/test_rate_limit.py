@@ -0,0 +1,63 @@
+import pytest
+
+from app.core.rate_limit import RateLimiter, TokenBucket
+
+
+def test_token_bucket_takes_until_empty() -> None:
+    bucket = TokenBucket(rate=2, burst=3, now=100)
+    assert [bucket.take(now=100) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(now=100) == pytest.approx(0.5)
+    assert bucket.taken == 3
+
+
+def test_token_bucket_refills_up_to_burst() -> None:
+    bucket = TokenBucket(rate=2, burst=3, now=100)
+    for _ in range(3):
+        bucket.take(now=100)
+    assert bucket.take(now=100.5) == 0
+    assert bucket.take(now=100.5) == pytest.approx(0.5)
+    bucket.take(now=200)
+    assert bucket.tokens == pytest.approx(2)
+
+
+def test_rate_limiter_quotas() -> None:
+    limiter = RateLimiter(rate=0, burst=1, quotas={"noisy": 1}, interval=1)
+    assert limiter.enabled
+    assert limiter.acquire("noisy") == 0
+    assert limiter.acquire("noisy") > 0
+    assert limiter.acquire("noisy") > 0
+    assert [limiter.acquire("quiet") for _ in range(3)] == [0, 0, 0]
+    assert limiter.rejected == {"noisy": 2}
+    assert list(limiter.buckets) == ["noisy"]
+
+
+def test_rate_limiter_disabled() -> None:
+    assert not RateLimiter(rate=0, burst=1, quotas={}, interval=1).enabled
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_sync_shares_tokens(redis_test_database, clear_cache):
+    clear_cache()
+    workers = [RateLimiter(rate=0.001, burst=10, quotas={}, interval=1) for _ in "ab"]
+    for _ in range(4):
+        workers[0].acquire("acme")
+    workers[1].acquire("acme")
+    # Both workers start from a full bucket, and see each other's requests once
+    # they synced
+    await workers[0].sync()
+    await workers[1].sync()
+    await workers[0].sync()
+    for worker in workers:
+        assert worker.buckets["acme"].taken == 0
+        assert worker.buckets["acme"].tokens == pytest.approx(5, abs=0.01)
+        assert worker.syncs >= 1
+    for _ in range(5):
+        assert workers[1].acquire("acme") == 0
+    assert workers[1].acquire("acme") > 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_sync_without_buckets(redis_test_database):
+    limiter = RateLimiter(rate=1, burst=1, quotas={}, interval=1)
+    await limiter.sync()
+    assert limiter.syncs == 0
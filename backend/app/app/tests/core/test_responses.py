@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from app.core.responses import (
+    BodyStreamingResponse,
+    serialize_converted_rate_result,
+    serialize_rate_result,
+)
+from app.schemas import ConvertedRateResult, Currency, RateResult
+
+
+def encode(model, **kwargs) -> bytes:
+    # As FastAPI encodes the validated response model
+    return json.dumps(
+        jsonable_encoder(model, **kwargs), ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+@pytest.mark.parametrize(
+    "components",
+    [
+        ("7.04", "3.277", "2.767", 1),
+        (10, 4, 3, 3),
+        (0.1, "0.001", "1234567.891", 2.5),
+    ],
+)
+def test_serialize_rate_result(components) -> None:
+    overall, energy, time, transaction = components
+    result = {
+        "overall": overall,
+        "components": {"energy": energy, "time": time, "transaction": transaction},
+    }
+    assert serialize_rate_result(result) == encode(RateResult(**result))
+
+
+@pytest.mark.parametrize("currency", [Currency.USD, "JPY"])
+@pytest.mark.parametrize("stale", [None, True])
+def test_serialize_converted_rate_result(currency, stale) -> None:
+    result = {
+        "overall": 8.28,
+        "components": {"energy": "3.854", "time": "3.254", "transaction": "1.176"},
+        "currency": currency,
+    }
+    if stale is not None:
+        result["stale"] = stale
+    expected = encode(ConvertedRateResult(**result), exclude_unset=True)
+    assert serialize_converted_rate_result(result) == expected
+
+
+async def echo(chunks):
+    async for chunk in chunks:
+        yield chunk.upper()
+
+
+@pytest.mark.asyncio
+async def test_body_streaming_response() -> None:
+    messages = [
+        {"type": "http.request", "body": b"a", "more_body": True},
+        {"type": "http.request", "body": b"b", "more_body": True},
+        {"type": "http.request", "body": b"", "more_body": False},
+    ]
+    sent = []
+
+    async def receive() -> dict:
+        await asyncio.sleep(0)
+        if messages:
+            return messages.pop(0)
+        # As servers do once the response is complete
+        await asyncio.sleep(0.01)
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    await BodyStreamingResponse(echo)({"type": "http"}, receive, send)
+    assert b"".join(message.get("body", b"") for message in sent) == b"AB"
+    assert sent[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+
+
+@pytest.mark.asyncio
+async def test_body_streaming_response_disconnect() -> None:
+    # The client goes away in the middle of the upload
+    messages = [
+        {"type": "http.request", "body": b"a", "more_body": True},
+        {"type": "http.disconnect"},
+    ]
+    sent = []
+
+    async def receive() -> dict:
+        return messages.pop(0)
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    await asyncio.wait_for(
+        BodyStreamingResponse(echo)({"type": "http"}, receive, send), timeout=1
+    )
+    assert not any(message.get("more_body") is False for message in sent)
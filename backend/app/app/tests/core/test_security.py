@@ -1,6 +1,10 @@
+import pytest
 from fastapi.testclient import TestClient
 
+from app.core import security
 from app.core.config import settings
+from app.core.rate_limit import RateLimiter
+from app.core.security import DEFAULT_TENANT, APIKeyRegistry, hash_api_key
 
 
 def test_security_not_authorized(client: TestClient, rate_cdr_obj: dict) -> None:
@@ -24,3 +28,33 @@ def test_security_correct_api_key(client: TestClient, rate_cdr_obj: dict) -> Non
     r = client.post(f"{settings.API_V1_STR}/rate/", data=rate_cdr_obj, headers=headers)
     assert r.status_code == 200
     assert r.json() != {"detail": "WRONG API KEY - not authorized"}
+
+
+@pytest.fixture
+def tenants(monkeypatch):
+    registry = APIKeyRegistry({"acme": hash_api_key("acme-key")})
+    limiter = RateLimiter(rate=0.001, burst=1, quotas={}, interval=1)
+    monkeypatch.setattr(security, "api_keys", registry)
+    monkeypatch.setattr(security, "rate_limiter", limiter)
+    return limiter
+
+
+def test_api_key_registry() -> None:
+    registry = APIKeyRegistry(
+        {"acme": hash_api_key("acme-key").upper()}, secret="secret"
+    )
+    assert registry.tenant_of("acme-key") == "acme"
+    assert registry.tenant_of("secret") == DEFAULT_TENANT
+    assert registry.tenant_of("acme") is None
+
+
+def test_security_tenant_rate_limited(
+    client: TestClient, rate_cdr_obj: dict, tenants
+) -> None:
+    headers = {"API-Key": "acme-key"}
+    r = client.post(f"{settings.API_V1_STR}/rate/", data=rate_cdr_obj, headers=headers)
+    assert r.status_code != 429
+    r = client.post(f"{settings.API_V1_STR}/rate/", data=rate_cdr_obj, headers=headers)
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) > 0
+    assert tenants.rejected == {"acme": 1}
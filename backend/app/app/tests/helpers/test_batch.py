@@ -0,0 +1,172 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.api.helpers import calculate_rate, calculate_rates_batch, rate_ndjson_stream
+from app.api.helpers.batch import format_column, rate_columns
+from app.schemas import BatchRateItem
+
+rate = {"energy": 0.3, "time": 2, "transaction": 1.278}
+cdr = {
+    "timestamp_start": "2021-04-05T10:04:00Z",
+    "timestamp_stop": "2021-04-05T11:12:16Z",
+    "meter_start": 1204307,
+    "meter_stop": 1215207,
+}
+
+
+@pytest.mark.asyncio
+async def test_rate_columns_same_as_calculate_rate() -> None:
+    columns = rate_columns(
+        timestamp_start=[cdr["timestamp_start"]],
+        timestamp_stop=[cdr["timestamp_stop"]],
+        meter_start=[cdr["meter_start"]],
+        meter_stop=[cdr["meter_stop"]],
+        energy_rate=[rate["energy"]],
+        time_rate=[rate["time"]],
+        transaction_rate=[rate["transaction"]],
+    )
+    expected = await calculate_rate(
+        total_seconds=4096,
+        total_kwh=10.9,
+        energy_rate=rate["energy"],
+        time_rate=rate["time"],
+        transaction_rate=rate["transaction"],
+    )
+    assert columns.errors == [None]
+    assert [
+        column[0]
+        for column in [
+            columns.overall,
+            columns.energy,
+            columns.time,
+            columns.transaction,
+        ]
+    ] == list(map(float, expected))
+
+
+@pytest.mark.asyncio
+async def test_rate_columns_exact_and_overflow() -> None:
+    # A rounding boundary, and rates which don't fit into int64 numerators
+    columns = rate_columns(
+        timestamp_start=[cdr["timestamp_start"]] * 2,
+        timestamp_stop=["2021-04-05T11:04:00Z"] * 2,
+        meter_start=[0, 0],
+        meter_stop=[1000, 10**12],
+        energy_rate=[1.0005, 1000.0005],
+        time_rate=[0.0045, 0.0045],
+        transaction_rate=[1, 1],
+    )
+    assert columns.overall.tolist() == [2.01, 1000000500001.0]
+    assert columns.energy.tolist() == [1.001, 1000000500000.0]
+    assert columns.time.tolist() == [0.005, 0.005]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("exact", [False, True])
+async def test_rate_columns_half_micro_prices(exact) -> None:
+    # Prices half way between two micro units are rounded half up, as by
+    # `calculate_rate`, in int64 and, with a row which overflows it, exactly
+    prices = [2.5e-06, 5e-07, 1.5e-06, 1.0000005, 0.0000125]
+    meter_stop = [10**6] * len(prices) + [10**12] * exact
+    prices += [1000.0005] * exact
+    columns = rate_columns(
+        timestamp_start=[cdr["timestamp_start"]] * len(prices),
+        timestamp_stop=["2021-04-05T11:04:00Z"] * len(prices),
+        meter_start=[0] * len(prices),
+        meter_stop=meter_stop,
+        energy_rate=prices,
+        time_rate=prices,
+        transaction_rate=prices,
+    )
+    for row, (price, wh) in enumerate(zip(prices, meter_stop)):
+        expected = await calculate_rate(
+            total_seconds=3600,
+            total_kwh=wh / 1000,
+            energy_rate=price,
+            time_rate=price,
+            transaction_rate=price,
+        )
+        assert [
+            columns.overall[row],
+            columns.energy[row],
+            columns.time[row],
+            columns.transaction[row],
+        ] == list(map(float, expected))
+
+
+def test_format_column() -> None:
+    # Rates already rounded to the decimal places, as by `round_fixed`
+    cents = np.array([7.04, 1.0, 0.01, 1000000500001.0])
+    assert format_column(cents, places=2) == ["7.04", 1, "0.01", 1000000500001]
+    millis = np.array([3.277, 2.0, 0.005, 1000000500000.5])
+    assert format_column(millis, places=3) == ["3.277", 2, "0.005", "1000000500000.500"]
+
+
+@pytest.mark.asyncio
+async def test_rate_columns_multiple_days() -> None:
+    columns = rate_columns(
+        timestamp_start=["2021-04-05T10:04:00Z"],
+        timestamp_stop=["2021-04-07T10:04:00.500000+00:00"],
+        meter_start=[0],
+        meter_stop=[1000],
+        energy_rate=[1],
+        time_rate=[1],
+        transaction_rate=[1],
+    )
+    assert columns.time.tolist() == [48.0]
+    assert columns.overall.tolist() == [50.0]
+
+
+@pytest.mark.asyncio
+async def test_calculate_rates_batch_per_item_errors() -> None:
+    items = [
+        BatchRateItem(rate=rate, cdr=cdr),
+        BatchRateItem(rate=rate, cdr={**cdr, "timestamp_start": "yesterday"}),
+        BatchRateItem(rate=rate, cdr={**cdr, "meter_stop": cdr["meter_start"]}),
+        BatchRateItem(
+            rate=rate,
+            cdr={
+                **cdr,
+                "timestamp_start": cdr["timestamp_stop"],
+                "meter_stop": cdr["meter_start"],
+            },
+        ),
+    ]
+    results = await calculate_rates_batch(items)
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert results[0]["error"] is None
+    assert results[0]["result"]["overall"] == 6.82
+    assert all(result["result"] is None for result in results[1:])
+    assert results[1]["error"].startswith("Invalid timestamp")
+    assert "meter_start" in results[2]["error"]
+    # Timestamps are validated before the meters
+    assert "timestamp_stop" in results[3]["error"]
+
+
+@pytest.mark.asyncio
+async def test_calculate_rates_batch_empty() -> None:
+    assert await calculate_rates_batch([]) == []
+
+
+async def as_chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+@pytest.mark.asyncio
+async def test_rate_ndjson_stream() -> None:
+    record = json.dumps({"rate": rate, "cdr": cdr})
+    data = "\n".join([record, "{not json", "", '{"rate": {}}', record]).encode()
+    # Tiny chunks, to split records across them
+    output = [
+        chunk async for chunk in rate_ndjson_stream(as_chunks(data, 7), chunk_size=2)
+    ]
+    assert len(output) == 2
+    results = [json.loads(line) for line in b"".join(output).splitlines()]
+    assert [result["index"] for result in results] == [0, 1, 3, 4]
+    assert results[0] == {**results[3], "index": 0}
+    assert results[0]["result"]["overall"] == 6.82
+    assert results[1]["error"] == "Invalid JSON record"
+    assert results[2]["error"].startswith("rate.energy: field required")
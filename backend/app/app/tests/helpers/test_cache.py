@@ -1,11 +1,18 @@
-import json
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 import pytest
 
 from app.api.helpers.cache import (
+    EXCHANGE_RATES_KEY,
+    LAST_GOOD_RATES_KEY,
+    LocalCache,
     get_conversion_result_from_cache,
-    set_conversion_result_to_cache,
+    get_historical_conversion_result_from_cache,
+    get_rate_table_from_cache,
+    local_cache,
+    next_utc_midnight,
+    set_historical_rates_to_cache,
+    set_rate_table_to_cache,
 )
 from app.core.config import settings
 from app.core.connections import redis_cache
@@ -15,50 +22,138 @@ headers = {"API-Key": settings.API_KEY_SECRET}
 
 
 @pytest.mark.asyncio
-async def test_set_conversion_result_to_cache(
-    raw_conversion_result, redis_connection, redis_test_database
+async def test_set_rate_table_to_cache(
+    raw_rate_table, redis_connection, redis_test_database
 ):
 
-    currency = Currency.USD
-    await set_conversion_result_to_cache(
-        currency, raw_conversion_result=raw_conversion_result
-    )
-    cache_value = await redis_cache.get(currency.value)
+    await set_rate_table_to_cache(rate_table=raw_rate_table)
+    cache_value = await redis_cache.get(EXCHANGE_RATES_KEY)
     assert isinstance(cache_value, bytes)
+    local_cache.clear()
     redis_connection.flushdb()
 
 
 @pytest.mark.asyncio
 async def test_get_conversion_result_from_cache(
-    raw_conversion_result, redis_connection, redis_test_database
+    raw_rate_table,
+    raw_rate_record,
+    conversion_result,
+    redis_connection,
+    redis_test_database,
 ):
 
-    currency = Currency.USD
-    await set_conversion_result_to_cache(
-        currency, raw_conversion_result=raw_conversion_result
-    )
-    cache_value = await get_conversion_result_from_cache(currency)
+    await set_rate_table_to_cache(rate_table=raw_rate_table)
+    local_cache.clear()
+    record = await get_rate_table_from_cache()
+    assert (record.day, record.rates) == (raw_rate_record.day, raw_rate_record.rates)
+    cache_value = await get_conversion_result_from_cache(Currency.USD)
     assert isinstance(cache_value, dict)
-    assert cache_value == raw_conversion_result
+    assert cache_value == conversion_result
+    # The base currency
+    cache_value = await get_conversion_result_from_cache(Currency.EUR)
+    assert cache_value == {"rate": 1, "date": "2021-08-08"}
+    local_cache.clear()
     redis_connection.flushdb()
 
 
 @pytest.mark.asyncio
 async def test_cache_invalidation(
-    raw_conversion_result, redis_connection, redis_test_database
+    raw_rate_table, redis_connection, redis_test_database
 ):
 
     currency = Currency.USD
-    await set_conversion_result_to_cache(
-        currency, raw_conversion_result=raw_conversion_result
-    )
-    cache_value = await redis_cache.get(currency.value)
-    value = json.loads(cache_value)
-    value["timestamp"] = (datetime.utcnow() - timedelta(1)).isoformat()
-    modified_value = value
-    modified_value = json.dumps(modified_value)
-    await redis_cache.set(currency.value, modified_value)
+    await set_rate_table_to_cache(rate_table=raw_rate_table)
+    # Expired by Redis at the next midnight
+    midnight = next_utc_midnight(datetime.utcnow())
+    ttl = redis_connection.pttl(EXCHANGE_RATES_KEY) / 1000
+    expected_ttl = (midnight - datetime.utcnow()).total_seconds()
+    assert expected_ttl - 5 < ttl <= expected_ttl + 1
+    assert redis_connection.ttl(LAST_GOOD_RATES_KEY) == settings.RATE_STALE_TTL
+    # As if it's the next day, for a worker which didn't cache it in process
+    redis_connection.delete(EXCHANGE_RATES_KEY)
+    local_cache.clear()
     # Should get empty dict if cache invalidation algorythm works
     cache_value = await get_conversion_result_from_cache(currency)
     assert cache_value == {}
+    # Unless stale data are allowed
+    cache_value = await get_conversion_result_from_cache(currency, stale=True)
+    assert cache_value == {"rate": 1.176132, "date": "2021-08-08", "stale": True}
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_rate_table_of_the_upcoming_day(
+    raw_rate_table, redis_connection, redis_test_database
+):
+    tomorrow = next_utc_midnight(datetime.utcnow())
+    await set_rate_table_to_cache(rate_table=raw_rate_table, timestamp=tomorrow)
+    ttl = redis_connection.ttl(EXCHANGE_RATES_KEY)
+    assert (next_utc_midnight(tomorrow) - datetime.utcnow()).total_seconds() - ttl < 5
+    local_cache.clear()
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_get_conversion_result_from_local_cache(
+    raw_rate_table, conversion_result, redis_connection, redis_test_database
+):
+
+    currency = Currency.USD
+    await set_rate_table_to_cache(rate_table=raw_rate_table)
+    local_cache.clear()
+    # The first read fills the local cache from redis
+    assert await get_conversion_result_from_cache(currency) == conversion_result
     redis_connection.flushdb()
+    hits = local_cache.hits
+    # Any currency is served by the cached table
+    for currency in Currency:
+        assert await get_conversion_result_from_cache(currency)
+    assert local_cache.hits == hits + len(Currency)
+    local_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_historical_rates_cache(
+    raw_rate_table, redis_connection, redis_test_database
+):
+
+    day = date(2021, 8, 8)
+    local_cache.clear()
+    assert await get_historical_conversion_result_from_cache(Currency.USD, day) == {}
+    await set_historical_rates_to_cache(
+        {day.isoformat(): raw_rate_table["rates"], "2021-08-07": {"USD": 1.18}}
+    )
+    assert await get_historical_conversion_result_from_cache(Currency.USD, day) == {
+        "rate": 1.176132,
+        "date": "2021-08-08",
+    }
+    redis_connection.flushdb()
+    # Historical rates never change, the local copy is kept
+    assert await get_historical_conversion_result_from_cache(Currency.GBP, day) == {
+        "rate": 0.848218,
+        "date": "2021-08-08",
+    }
+    local_cache.clear()
+
+
+def test_local_cache_eviction_and_expiration():
+    cache = LocalCache(max_size=2)
+    tomorrow = next_utc_midnight(datetime.utcnow())
+    cache.set("USD", 1, expires_at=tomorrow)
+    cache.set("GBP", 2, expires_at=tomorrow)
+    assert cache.get("USD") == 1
+    # GBP is the least recently used one
+    cache.set("JPY", 3, expires_at=tomorrow)
+    assert cache.get("GBP") is None
+    assert cache.evictions == 1
+    cache.set("CAD", 4, expires_at=datetime.utcnow() - timedelta(seconds=1))
+    assert cache.get("CAD") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    # Expired entries are removed upon reading
+    assert len(cache) == 1
+
+
+def test_next_utc_midnight():
+    assert next_utc_midnight(datetime(2021, 8, 8, 23, 59, 59, 999)) == datetime(
+        2021, 8, 9
+    )
@@ -1,9 +1,10 @@
 import ast
-from decimal import Decimal
+from decimal import ROUND_HALF_UP, Decimal
 
 import pytest
 
 from app.api.helpers import calculate_rate, convert_currency
+from app.api.helpers.calculation import format_cents, format_millis
 from app.schemas.conversion import Currency
 
 total_seconds = 4096
@@ -78,7 +79,20 @@ async def test_calculate_rate_all_whole_number() -> None:
 
 
 @pytest.mark.asyncio
-async def test_convert_currency(raw_conversion_result) -> None:
+async def test_calculate_rate_exact_rounding() -> None:
+    # 1.0005 and 0.0045 aren't exact binary floats, they're rounded half up
+    overall, energy, time, transaction = await calculate_rate(
+        total_seconds=3600,
+        total_kwh=1,
+        energy_rate=1.0005,
+        time_rate=0.0045,
+        transaction_rate=1,
+    )
+    assert (overall, energy, time, transaction) == ("2.01", "1.001", "0.005", 1)
+
+
+@pytest.mark.asyncio
+async def test_convert_currency(conversion_result) -> None:
     currency = Currency.USD
     overall = 10
     energy = 3
@@ -92,7 +106,7 @@ async def test_convert_currency(raw_conversion_result) -> None:
     }
 
     result = await convert_currency(
-        raw_conversion_result=raw_conversion_result,
+        conversion_result=conversion_result,
         overall=overall,
         currency=currency,
         energy=energy,
@@ -100,3 +114,45 @@ async def test_convert_currency(raw_conversion_result) -> None:
         transaction=transaction,
     )
     assert result == expected_result
+
+
+@pytest.mark.asyncio
+async def test_convert_currency_stale(conversion_result) -> None:
+    result = await convert_currency(
+        conversion_result={**conversion_result, "stale": True},
+        overall=10,
+        currency=Currency.USD,
+        energy=3,
+        time=2,
+        transaction=5,
+    )
+    assert result["stale"] is True
+    assert result["overall"] == "11.76"
+
+
+@pytest.mark.asyncio
+async def test_convert_currency_whole_number() -> None:
+    result = await convert_currency(
+        conversion_result={"rate": 2, "date": "2021-08-08"},
+        overall=10,
+        currency=Currency.USD,
+        energy=3,
+        time=2.5,
+        transaction=5,
+    )
+    assert result["overall"] == 20.0
+    assert result["components"] == {"energy": 6, "time": 5, "transaction": 10}
+
+
+@pytest.mark.parametrize("step", [1, 7, 1000, 3600])
+def test_format_fixed_same_as_decimal(step) -> None:
+    # Below and above the formatted lookup tables, on the rounding boundaries
+    for value in [0, 1, 9_999, 10_000, 123_456_789]:
+        for numerator in range(value * step - step, value * step + step + 1):
+            if numerator < 0:
+                continue
+            for places, format_rate in ((3, format_millis), (2, format_cents)):
+                rate = Decimal(numerator) / (step * 10**places)
+                rounded = rate.quantize(Decimal(1).scaleb(-places), ROUND_HALF_UP)
+                expected = int(rate) if rate == int(rate) else str(rounded)
+                assert format_rate(numerator, step) == expected
@@ -0,0 +1,36 @@
+from app.api.helpers import canonical_rate_query, etag_matches, rate_etag
+from app.schemas import CDR, Rate
+
+cdr = CDR(
+    timestamp_start="2021-04-05T10:04:00Z",
+    timestamp_stop="2021-04-05T11:27:00Z",
+    meter_start=1204307,
+    meter_stop=1215230,
+)
+
+
+def test_canonical_rate_query() -> None:
+    query = canonical_rate_query(
+        rate=Rate(energy=0.3, time=2, transaction="1"), cdr=cdr
+    )
+    assert query == (
+        "energy=0.3&meter_start=1204307&meter_stop=1215230"
+        "&time=2.0&timestamp_start=2021-04-05T10%3A04%3A00Z"
+        "&timestamp_stop=2021-04-05T11%3A27%3A00Z&transaction=1.0"
+    )
+
+
+def test_rate_etag() -> None:
+    etag = rate_etag("energy=0.3")
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == rate_etag("energy=0.3")
+    assert etag != rate_etag("energy=0.4")
+
+
+def test_etag_matches() -> None:
+    etag = rate_etag("energy=0.3")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
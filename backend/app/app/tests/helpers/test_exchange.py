@@ -0,0 +1,197 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from app.api.helpers import exchange
+from app.api.helpers.cache import (
+    EXCHANGE_RATES_KEY,
+    get_historical_conversion_result_from_cache,
+    get_rate_table_from_cache,
+    local_cache,
+)
+from app.api.helpers.exchange import (
+    EXCHANGE_LOCK_KEY,
+    CircuitBreaker,
+    SingleFlight,
+    fetch_conversion_result,
+    fetch_stats,
+    preload_historical_rates,
+    revalidate_rate_table,
+    single_flight,
+)
+from app.core.connections import redis_cache
+from app.schemas.conversion import Currency
+
+
+@pytest.fixture
+def fake_request(monkeypatch, raw_rate_table):
+    calls = []
+
+    async def request_rate_table():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return raw_rate_table
+
+    monkeypatch.setattr(exchange, "request_rate_table", request_rate_table)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    calls = []
+
+    async def function():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    flight = SingleFlight()
+    results = await asyncio.gather(*[flight.do("USD", function) for _ in range(5)])
+    assert results == [1] * 5
+    assert (flight.calls, flight.coalesced) == (1, 4)
+    # Once the call is done, the next one is a new call
+    assert await flight.do("USD", function) == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_exceptions():
+    async def function():
+        await asyncio.sleep(0.01)
+        raise ValueError
+
+    flight = SingleFlight()
+    results = await asyncio.gather(
+        flight.do("USD", function), flight.do("USD", function), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_fetch_conversion_result_single_fetch(
+    fake_request, raw_rate_table, raw_rate_record, redis_connection, redis_test_database
+):
+    local_cache.clear()
+    coalesced = single_flight.coalesced
+    # Even for different currencies, a single table is fetched
+    currencies = list(Currency) * 2
+    results = await asyncio.gather(
+        *[fetch_conversion_result(currency) for currency in currencies]
+    )
+    assert [result["rate"] for result in results] == [
+        raw_rate_table["rates"][currency.value] for currency in currencies
+    ]
+    assert fake_request == [1]
+    assert single_flight.coalesced == coalesced + len(currencies) - 1
+    local_cache.clear()
+    record = await get_rate_table_from_cache()
+    assert (record.day, record.rates) == (raw_rate_record.day, raw_rate_record.rates)
+    # The lock is released
+    assert not await redis_cache.exists(EXCHANGE_LOCK_KEY)
+    local_cache.clear()
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_fetch_conversion_result_waits_for_other_worker(
+    fake_request, conversion_result, redis_connection, redis_test_database
+):
+    local_cache.clear()
+    remote_coalesced = fetch_stats.remote_coalesced
+    # As if another worker is fetching it
+    await redis_cache.acquire_lock(EXCHANGE_LOCK_KEY, "other-worker", timeout_ms=5000)
+
+    async def other_worker_fetch():
+        await asyncio.sleep(0.1)
+        await exchange.fetch_and_cache()
+        local_cache.clear()
+        await redis_cache.release_lock(EXCHANGE_LOCK_KEY, "other-worker")
+
+    result, _ = await asyncio.gather(
+        fetch_conversion_result(Currency.USD), other_worker_fetch()
+    )
+    assert result == conversion_result
+    # Only the other worker fetched it
+    assert fake_request == [1]
+    assert fetch_stats.remote_coalesced == remote_coalesced + 1
+    local_cache.clear()
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=0.05)
+    breaker.record(success=False)
+    assert breaker.allow()
+    breaker.record(success=False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+    await asyncio.sleep(0.05)
+    # A single trial call, its failure opens the circuit again
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(success=False)
+    assert breaker.state == CircuitBreaker.OPEN
+    await asyncio.sleep(0.05)
+    assert breaker.allow()
+    breaker.record(success=True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_request_rate_table_fails_fast(monkeypatch):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+    breaker.record(success=False)
+    monkeypatch.setattr(exchange, "circuit_breaker", breaker)
+    fetches = fetch_stats.fetches
+    assert await exchange.request_rate_table() == {}
+    assert fetch_stats.fetches == fetches
+    assert breaker.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_revalidate_rate_table(
+    fake_request, raw_rate_table, raw_rate_record, redis_connection, redis_test_database
+):
+    local_cache.clear()
+    revalidate_rate_table()
+    # Already being revalidated
+    revalidate_rate_table()
+    assert single_flight.in_flight(EXCHANGE_RATES_KEY)
+    await asyncio.sleep(0.1)
+    assert fake_request == [1]
+    record = await get_rate_table_from_cache()
+    assert (record.day, record.rates) == (raw_rate_record.day, raw_rate_record.rates)
+    local_cache.clear()
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_preload_historical_rates(
+    monkeypatch, raw_rate_table, redis_connection, redis_test_database
+):
+    requests = []
+
+    async def request_timeseries(start, end):
+        requests.append((start, end))
+        return {"success": True, "rates": {start.isoformat(): raw_rate_table["rates"]}}
+
+    monkeypatch.setattr(exchange, "request_timeseries", request_timeseries)
+    monkeypatch.setattr(exchange, "TIMESERIES_MAX_DAYS", 10)
+    local_cache.clear()
+    days = await preload_historical_rates(date(2021, 8, 1), date(2021, 8, 25))
+    # A request per window of TIMESERIES_MAX_DAYS
+    assert requests == [
+        (date(2021, 8, 1), date(2021, 8, 10)),
+        (date(2021, 8, 11), date(2021, 8, 20)),
+        (date(2021, 8, 21), date(2021, 8, 25)),
+    ]
+    assert days == 3
+    result = await get_historical_conversion_result_from_cache(
+        Currency.USD, date(2021, 8, 11)
+    )
+    assert result == {"rate": 1.176132, "date": "2021-08-11"}
+    local_cache.clear()
+    redis_connection.flushdb()
@@ -0,0 +1,52 @@
+import json
+import math
+import struct
+from datetime import datetime
+
+from app.api.helpers.cache import conversion_result_of
+from app.api.helpers.records import (
+    HEADER,
+    RECORD_VERSION,
+    decode_rate_record,
+    encode_rate_record,
+    rate_record_of,
+)
+from app.schemas.conversion import Currency
+
+
+def test_rate_record_round_trip(raw_rate_table):
+    fetched_at = datetime(2021, 8, 8, 10, 4, 0, 123000)
+    record = rate_record_of(raw_rate_table, fetched_at=fetched_at)
+    data = encode_rate_record(record)
+    assert len(data) == HEADER.size + 8 * len(Currency)
+    # A fraction of the cached JSON of the service
+    assert len(data) * 5 < len(json.dumps(raw_rate_table))
+    assert decode_rate_record(data) == record
+    assert record.rate(Currency.USD) == 1.176132
+    assert record.rate(Currency.EUR) == 1
+
+
+def test_rate_record_missing_rates():
+    record = rate_record_of({"base": "EUR", "date": "2021-08-08", "rates": {}})
+    assert math.isnan(record.rates[1])
+    assert record.rate(Currency.USD) is None
+    assert conversion_result_of(record, Currency.USD) == {}
+    assert conversion_result_of(None, Currency.USD) == {}
+    assert conversion_result_of(record._replace(stale=True), Currency.EUR) == {
+        "rate": 1,
+        "date": "2021-08-08",
+        "stale": True,
+    }
+
+
+def test_decode_rate_record_of_other_formats():
+    # Cached as JSON by an earlier version
+    assert decode_rate_record(b'{"base":"EUR"}') is None
+    assert decode_rate_record(b"") is None
+    header = HEADER.pack(RECORD_VERSION, 738010, 0, 2)
+    assert decode_rate_record(header + struct.pack("<d", 1)) is None
+    # Written before currencies were appended, without their slots
+    record = decode_rate_record(header + struct.pack("<2d", 1, 1.17))
+    assert record.day == "2021-08-08"
+    assert record.rate(Currency.USD) == 1.17
+    assert record.rate(Currency.CAD) is None
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.api.helpers import exchange
+from app.api.helpers.cache import (
+    EXCHANGE_RATES_KEY,
+    get_rate_table_from_cache,
+    local_cache,
+    next_utc_midnight,
+    set_rate_table_to_cache,
+)
+from app.api.helpers.refresh import RateRefresher
+
+
+@pytest.fixture
+def fake_request(monkeypatch, raw_rate_table):
+    calls = []
+
+    async def request_rate_table():
+        calls.append(1)
+        return raw_rate_table
+
+    monkeypatch.setattr(exchange, "request_rate_table", request_rate_table)
+    return calls
+
+
+def test_next_run():
+    refresher = RateRefresher(jitter=60, retry_interval=5)
+    midnight = datetime(2021, 8, 9)
+    run_at = refresher.next_run(now=datetime(2021, 8, 8, 23, 59))
+    assert midnight <= run_at <= midnight + timedelta(seconds=60)
+
+
+def utc_midnight() -> datetime:
+    """Midnight (UTC) which started the current day"""
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+@pytest.mark.asyncio
+async def test_refresh_by_leader_only(
+    fake_request, raw_rate_table, raw_rate_record, redis_connection, redis_test_database
+):
+    local_cache.clear()
+    redis_connection.flushdb()
+    leader, other_worker = RateRefresher(60, 5), RateRefresher(60, 5)
+    assert await leader.refresh(midnight=utc_midnight())
+    # Cached already, so the other worker doesn't fetch the rates again
+    local_cache.clear()
+    assert await other_worker.refresh(midnight=utc_midnight())
+    assert fake_request == [1]
+    assert (leader.refreshes, other_worker.refreshes) == (1, 0)
+    local_cache.clear()
+    record = await get_rate_table_from_cache()
+    assert (record.day, record.rates) == (raw_rate_record.day, raw_rate_record.rates)
+    local_cache.clear()
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_rates_of_the_new_day_after_rollover(
+    fake_request, raw_rate_table, redis_connection, redis_test_database
+):
+    local_cache.clear()
+    redis_connection.flushdb()
+    midnight = utc_midnight()
+    yesterday = (midnight - timedelta(days=1)).date().isoformat()
+    # Cached yesterday, so it expired at midnight
+    await set_rate_table_to_cache(
+        rate_table={**raw_rate_table, "date": yesterday},
+        timestamp=midnight - timedelta(minutes=5),
+    )
+    local_cache.clear()
+    assert await get_rate_table_from_cache() is None
+    stale = await get_rate_table_from_cache(stale=True)
+    assert (stale.day, stale.stale) == (yesterday, True)
+
+    assert await RateRefresher(60, 5).refresh(midnight=midnight)
+    local_cache.clear()
+    record = await get_rate_table_from_cache()
+    assert (record.day, record.stale) == (raw_rate_table["date"], False)
+    # Expires at the next midnight, not a day later
+    until_midnight = next_utc_midnight(midnight) - datetime.utcnow()
+    assert (
+        redis_connection.pttl(EXCHANGE_RATES_KEY)
+        <= (until_midnight.total_seconds() + 1) * 1000
+    )
+    local_cache.clear()
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_refresh_retried_until_cached(
+    monkeypatch, raw_rate_table, redis_connection, redis_test_database
+):
+    local_cache.clear()
+    redis_connection.flushdb()
+    responses = [dict(), raw_rate_table]
+
+    async def request_rate_table():
+        return responses.pop(0)
+
+    monkeypatch.setattr(exchange, "request_rate_table", request_rate_table)
+    refresher = RateRefresher(jitter=0, retry_interval=0.01)
+    await refresher.refresh_until_cached(midnight=utc_midnight())
+    assert responses == []
+    assert refresher.refreshes == 1
+    local_cache.clear()
+    redis_connection.flushdb()
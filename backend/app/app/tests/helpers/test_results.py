@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.api.helpers.results import RESULTS_KEY, ResultCache, result_key
+from app.schemas import Currency
+
+result = {
+    "overall": 7.04,
+    "components": {"energy": 3.277, "time": 2.767, "transaction": 1},
+}
+
+
+def test_result_key():
+    key = result_key("rate", "energy=0.3")
+    assert key == result_key("rate", "energy=0.3")
+    assert key != result_key("conversion", "energy=0.3")
+
+
+@pytest.mark.asyncio
+async def test_result_cache(redis_connection, redis_test_database):
+    cache = ResultCache(max_size=2, ttl=60)
+    key = result_key("rate", "energy=0.3")
+    assert await cache.get(key) is None
+    await cache.set(key, result)
+    assert await cache.get(key) == result
+    assert 0 < redis_connection.ttl(RESULTS_KEY.format(key)) <= 60
+    # As if it's read by another worker
+    cache.clear()
+    assert await cache.get(key) == result
+    assert cache.stats() == {
+        "local_hits": 1,
+        "redis_hits": 1,
+        "misses": 1,
+        "hit_rate": 2 / 3,
+        "size": 1,
+    }
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_result_cache_expiration(redis_connection, redis_test_database):
+    cache = ResultCache(max_size=2, ttl=60)
+    key = result_key("rate", "energy=0.3")
+    await cache.set(key, result, expires_at=datetime.utcnow() - timedelta(seconds=1))
+    assert await cache.get(key) is None
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_result_cache_encodes_results(redis_connection, redis_test_database):
+    cache = ResultCache(max_size=2, ttl=60)
+    key = result_key("conversion", "currency=USD")
+    await cache.set(key, {**result, "currency": Currency.USD})
+    cache.clear()
+    assert await cache.get(key) == {**result, "currency": "USD"}
+    redis_connection.flushdb()
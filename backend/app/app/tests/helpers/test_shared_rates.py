@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.api_v1.endpoints import rate
+from app.api.helpers.cache import local_cache, set_rate_table_to_cache
+from app.api.helpers.results import result_cache
+from app.api.helpers.shared_rates import SEQUENCE, SharedRateTable
+from app.core.config import settings
+from app.schemas.conversion import Currency
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    return str(tmp_path / "rates")
+
+
+def test_shared_rate_table(table_path, raw_rate_record):
+    writer, reader = SharedRateTable(table_path, 1), SharedRateTable(table_path, 1)
+    writer.open()
+    reader.open()
+    assert reader.read() is None
+    assert writer.elect()
+    # A single writer on the node
+    assert not reader.elect()
+
+    tomorrow = datetime.utcnow() + timedelta(days=1)
+    writer.write(raw_rate_record, expires_at=tomorrow)
+    assert reader.read() == raw_rate_record
+    assert reader.conversion_result(Currency.USD) == {
+        "rate": 1.176132,
+        "date": "2021-08-08",
+    }
+    writer.write(raw_rate_record._replace(day="2021-08-09"), expires_at=tomorrow)
+    assert reader.read().day == "2021-08-09"
+
+    # While it's being written the record isn't read
+    (sequence,) = SEQUENCE.unpack_from(writer._map, 0)
+    SEQUENCE.pack_into(writer._map, 0, sequence + 1)
+    reader._sequence = -1
+    assert reader.read() is None
+    assert reader.retries > 0
+    SEQUENCE.pack_into(writer._map, 0, sequence)
+
+    # Expired records aren't served
+    writer.write(raw_rate_record, expires_at=datetime.utcnow())
+    assert reader.read() is None
+
+    # Another worker takes over once the writer exits
+    writer.close()
+    assert reader.elect()
+    reader.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_rate_table_fill(
+    table_path, raw_rate_table, raw_rate_record, redis_connection, redis_test_database
+):
+    writer = SharedRateTable(table_path, 1)
+    writer.open()
+    writer.elect()
+    await set_rate_table_to_cache(rate_table=raw_rate_table)
+    assert await writer.fill()
+    # Unchanged
+    assert not await writer.fill()
+    assert writer.read().rates == raw_rate_record.rates
+    writer.close()
+    local_cache.clear()
+    redis_connection.flushdb()
+
+
+def test_conversion_from_shared_rate_table(
+    client: TestClient, table_path, raw_rate_record, monkeypatch
+):
+    table = SharedRateTable(table_path, 1)
+    table.open()
+    table.elect()
+    # Distinct from any cached rate
+    record = raw_rate_record._replace(rates=(1, 2, 2, 2, 2), day="2021-08-09")
+    table.write(record, expires_at=datetime.utcnow() + timedelta(days=1))
+    monkeypatch.setattr(rate, "shared_rates", table)
+    lookups = result_cache.hits + result_cache.misses
+    r = client.get(
+        f"{settings.API_V1_STR}/rate/converted-rate/",
+        headers={"API-Key": settings.API_KEY_SECRET},
+        params=[
+            ("overall", 10.01),
+            ("energy", 4),
+            ("time", 3),
+            ("transaction", 3),
+            ("currency", "GBP"),
+        ],
+    )
+    table.close()
+    assert r.status_code == 200
+    assert r.json()["overall"] == 20.02
+    # Without a lookup of the result cache, so without Redis
+    assert result_cache.hits + result_cache.misses == lookups
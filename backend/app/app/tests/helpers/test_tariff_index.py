@@ -0,0 +1,98 @@
+import pytest
+from pydantic import ValidationError
+
+from app.api.helpers import calculate_rate, calculate_tariff_rate, compile_index
+from app.schemas import Tariff
+
+base = {"energy": 0.3, "time": 2, "transaction": 1}
+
+
+@pytest.mark.asyncio
+async def test_flat_tariff_matches_calculate_rate() -> None:
+    index = compile_index(Tariff(**base))
+    assert index.boundaries == [0]
+    result = await calculate_tariff_rate(
+        index, start_second=10 * 3600, total_seconds=4980, total_kwh=10.923
+    )
+    assert result == await calculate_rate(
+        total_seconds=4980,
+        total_kwh=10.923,
+        energy_rate=0.3,
+        time_rate=2,
+        transaction_rate=1,
+    )
+    assert result == ("7.04", "3.277", "2.767", 1)
+
+
+@pytest.mark.asyncio
+async def test_time_of_use_windows() -> None:
+    tariff = Tariff(
+        **base, windows=[{"start": "11:00", "end": "12:00", "energy": 0.5, "time": 4}]
+    )
+    index = compile_index(tariff)
+    assert index.boundaries == [0, 11 * 3600, 12 * 3600]
+    # 10:00 until 12:00, half of it within the window
+    result = await calculate_tariff_rate(
+        index, start_second=10 * 3600, total_seconds=7200, total_kwh=10
+    )
+    assert result == (11, 4, 6, 1)
+
+
+@pytest.mark.asyncio
+async def test_windows_across_midnight_and_days() -> None:
+    tariff = Tariff(**base, windows=[{"start": "22:00", "end": "06:00", "time": 1}])
+    # 20:00 until midnight, three days later
+    result = await calculate_tariff_rate(
+        compile_index(tariff),
+        start_second=20 * 3600,
+        total_seconds=76 * 3600,
+        total_kwh=76,
+    )
+    assert result == ("149.80", "22.800", 126, 1)
+
+
+@pytest.mark.asyncio
+async def test_energy_tiers() -> None:
+    tariff = Tariff(**base, tiers=[{"from_kwh": 4, "energy": 0.2}])
+    index = compile_index(tariff)
+    assert (index.tier_boundaries, index.tier_energy) == ([0, 4000], [300000, 200000])
+    result = await calculate_tariff_rate(
+        index, start_second=0, total_seconds=7200, total_kwh=10
+    )
+    assert result == ("7.40", "2.400", 4, 1)
+
+    # A tier from zero replaces the energy price of the tariff
+    tariff = Tariff(**base, tiers=[{"from_kwh": 0, "energy": 0.2}])
+    assert compile_index(tariff).tier_energy == [200000]
+
+
+@pytest.mark.asyncio
+async def test_window_energy_takes_precedence_over_tiers() -> None:
+    tariff = Tariff(
+        **base,
+        windows=[{"start": "01:00", "end": "02:00", "energy": 0.5}],
+        tiers=[{"from_kwh": 0.5, "energy": 0.2}],
+    )
+    # 2 kWh from 00:00 until 02:00, the tier starts at 00:30
+    result = await calculate_tariff_rate(
+        compile_index(tariff), start_second=0, total_seconds=7200, total_kwh=2
+    )
+    assert result[1] == "0.750"
+
+
+def test_tariff_validation() -> None:
+    with pytest.raises(ValidationError):
+        Tariff(
+            **base,
+            windows=[
+                {"start": "22:00", "end": "06:00", "time": 1},
+                {"start": "05:00", "end": "07:00", "time": 1},
+            ],
+        )
+    with pytest.raises(ValidationError):
+        Tariff(**base, windows=[{"start": "22:00", "end": "22:00"}])
+    with pytest.raises(ValidationError):
+        Tariff(
+            **base,
+            tiers=[{"from_kwh": 5, "energy": 0.2}, {"from_kwh": 5, "energy": 0.1}],
+        )
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from app.api.helpers.tariffs import TariffRegistry, tariff_registry
+from app.schemas import Tariff
+
+rate = Tariff(energy=0.3, time=2, transaction=1)
+
+
+@pytest.mark.asyncio
+async def test_tariff_registry(clear_cache, redis_connection, redis_test_database):
+    registry = TariffRegistry(ttl=60)
+    assert await registry.get("ac-22") is None
+
+    tariff = await registry.put("ac-22", rate)
+    assert (tariff.id, tariff.version, tariff.rate) == ("ac-22", 1, rate)
+    assert await registry.get("ac-22") == tariff
+    # Served by the compiled copy
+    hits = registry.compiled.hits
+    assert await registry.get("ac-22") == tariff
+    assert registry.compiled.hits == hits + 1
+
+    updated = await registry.put("ac-22", Tariff(energy=0.4, time=2, transaction=1))
+    assert updated.version == 2
+    assert await registry.get("ac-22") == updated
+    await registry.put("dc-50", rate)
+    assert [tariff.id for tariff in await registry.list()] == ["ac-22", "dc-50"]
+
+    assert await registry.delete("ac-22")
+    assert not await registry.delete("ac-22")
+    assert await registry.get("ac-22") is None
+    # Recreated tariffs get a new version
+    assert (await registry.put("ac-22", rate)).version == 3
+    redis_connection.flushdb()
+
+
+@pytest.mark.asyncio
+async def test_tariff_registry_updates(
+    clear_cache, redis_connection, redis_test_database
+):
+    # The registry of this worker listens to the updates since the startup,
+    # and the tariff is updated by another worker
+    other_registry = TariffRegistry(ttl=60)
+    await asyncio.sleep(0.05)
+
+    await other_registry.put("ac-22", rate)
+    assert (await tariff_registry.get("ac-22")).version == 1
+    await other_registry.put("ac-22", Tariff(energy=0.4, time=2, transaction=1))
+    await asyncio.sleep(0.05)
+    tariff = await tariff_registry.get("ac-22")
+    assert (tariff.version, tariff.rate.energy) == (2, 0.4)
+    redis_connection.flushdb()
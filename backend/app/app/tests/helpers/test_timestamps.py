@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from app.api.helpers import timestamps as timestamps_module
+from app.api.helpers.timestamps import parse_epoch_microseconds, parse_timestamps
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+timestamps = [
+    "2021-04-05T10:04:00Z",
+    "1970-01-01T00:00:00Z",
+    "2000-02-29T23:59:59Z",
+    "1969-12-31T23:59:59Z",
+    "2021-04-05T12:04:00+02:00",
+    "2021-04-05T10:04:00.250000Z",
+    "2021-04-05T10:04:00",
+    "2021-04-05 10:04:00Z",
+]
+invalid_timestamps = [
+    "2021-02-29T10:04:00Z",
+    "2021-13-05T10:04:00Z",
+    "2021-04-05T24:04:00Z",
+    "2021-04-05T10:04:00ZZ",
+    "2021-04-05T10:04:0xZ",
+    "not a timestamp",
+    "",
+]
+
+
+def reference_epoch_microseconds(timestamp: str) -> int:
+    """The previous parsing, `fromisoformat` after replacing the `Z`"""
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed - EPOCH) // ONE_MICROSECOND
+
+
+def test_parse_epoch_microseconds():
+    assert [parse_epoch_microseconds(timestamp) for timestamp in timestamps] == [
+        reference_epoch_microseconds(timestamp) for timestamp in timestamps
+    ]
+    for timestamp in invalid_timestamps + [None]:
+        with pytest.raises((ValueError, TypeError, AttributeError)):
+            parse_epoch_microseconds(timestamp)
+
+
+def test_parse_epoch_microseconds_hours_cache(monkeypatch):
+    monkeypatch.setattr(timestamps_module, "HOURS_CACHE_SIZE", 2)
+    timestamps_module.hour_microseconds.clear()
+    batch = timestamp_batch(1000)
+    assert [parse_epoch_microseconds(timestamp) for timestamp in batch] == [
+        reference_epoch_microseconds(timestamp) for timestamp in batch
+    ]
+    assert 0 < len(timestamps_module.hour_microseconds) <= 2
+
+
+def test_parse_timestamps_same_as_reference():
+    parsed = parse_timestamps(timestamps + invalid_timestamps + [None])
+    assert parsed[: len(timestamps)].tolist() == [
+        reference_epoch_microseconds(timestamp) for timestamp in timestamps
+    ]
+    assert parsed.mask.tolist() == [False] * len(timestamps) + [True] * (
+        len(invalid_timestamps) + 1
+    )
+    assert parse_timestamps([]).tolist() == []
+    assert parse_timestamps(["short"]).mask.tolist() == [True]
+
+
+def timestamp_batch(size: int) -> list:
+    start = datetime(2021, 1, 1)
+    return [
+        (start + timedelta(seconds=second * 37)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for second in range(size)
+    ]
+
+
+def test_parse_timestamps_batch_same_as_reference():
+    # A batch of the common shape, timed over a million timestamps by the
+    # parse_timestamps benchmarks
+    batch = timestamp_batch(10_000)
+    parsed = parse_timestamps(batch)
+    assert not parsed.mask.any()
+    assert np.array_equal(
+        parsed.data,
+        np.array([reference_epoch_microseconds(item) for item in batch]),
+    )
@@ -47,3 +47,11 @@ async def test_validate_timestamps_right_input() -> None:
         datetime.fromisoformat(two_hours_later) - datetime.fromisoformat(now)
     ).seconds
     assert result == expected_result
+
+
+@pytest.mark.asyncio
+async def test_validate_timestamps_multiple_days() -> None:
+    result = await validate_timestamps(
+        start="2021-04-05T10:04:00Z", stop="2021-04-07T11:04:00+01:00"
+    )
+    assert result == 2 * 24 * 3600
@@ -0,0 +1,50 @@
+import json
+import time
+
+import pytest
+
+from app.core.connections import RELEASE_LOCK_SCRIPT
+from benchmarks.__main__ import main
+from benchmarks.fake_redis import FakeRedis
+from benchmarks.runner import compare
+
+
+def test_compare() -> None:
+    baseline = {"a": {"median": 1.0}, "b": {"median": 1.0}}
+    results = {"a": {"median": 1.2}, "b": {"median": 1.3}, "c": {"median": 9.0}}
+    assert [regression.name for regression in compare(results, baseline, 0.25)] == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_fake_redis() -> None:
+    redis = FakeRedis()
+    assert await redis.set("lock", "token", pexpire=1000, exist="SET_IF_NOT_EXIST")
+    assert not await redis.set("lock", "other", pexpire=1000, exist="SET_IF_NOT_EXIST")
+    assert await redis.eval(RELEASE_LOCK_SCRIPT, keys=["lock"], args=["other"]) == 0
+    assert await redis.eval(RELEASE_LOCK_SCRIPT, keys=["lock"], args=["token"]) == 1
+    await redis.execute("set", "key", "value", "ex", 60)
+    assert await redis.get("key") == b"value"
+    await redis.hmset_dict("hash", {"field": 1})
+    assert await redis.hgetall("hash") == {b"field": b"1"}
+    transaction = redis.multi_exec()
+    transaction.set("expiring", "value")
+    transaction.pexpireat("expiring", int(time.time() * 1000) + 60_000)
+    assert await transaction.execute() == [True, True]
+    assert 59_000 < await redis.pttl("expiring") <= 60_000
+    assert await redis.mget("key", "missing") == [b"value", None]
+
+
+def test_benchmark_run_fails_on_regression(tmp_path) -> None:
+    output, baseline = str(tmp_path / "results.json"), str(tmp_path / "baseline.json")
+    args = ["--filter", "validate_meters", "--rounds", "1", "--min-round-time", "0"]
+    args += ["--output", output, "--baseline", baseline]
+    # Without a baseline to compare with
+    assert main(args) == 2
+    assert main(args + ["--save-baseline"]) == 0
+    assert "validate_meters" in json.load(open(baseline))["benchmarks"]
+
+    # Way faster baseline
+    document = json.load(open(baseline))
+    document["benchmarks"]["validate_meters"]["median"] /= 1000
+    json.dump(document, open(baseline, "w"))
+    assert main(args) == 1
@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+
+import pytest
+
+from app.api.helpers import calculate_rate
+from app.cli import main
+from app.core.security import hash_api_key
+
+cdr_rows = [
+    ["meter_start", "timestamp_start", "meter_stop", "timestamp_stop"],
+    ["1204307", "2021-04-05T10:04:00Z", "1215230", "2021-04-05T11:27:00Z"],
+    ["1204307", "2021-04-05T10:04:00Z", "1204307", "2021-04-05T11:27:00Z"],
+    ["1204307", "2021-04-05T10:04:00Z", "not a number", "2021-04-05T11:27:00Z"],
+    ["1204307", "2021-04-05T10:04:00Z", "1215230", "2021-04-05T11:27:00Z"],
+]
+
+
+@pytest.fixture
+def tariff_file(tmp_path):
+    path = tmp_path / "tariff.json"
+    path.write_text(json.dumps({"energy": 0.3, "time": 2, "transaction": 1}))
+    return str(path)
+
+
+@pytest.mark.asyncio
+async def test_rate_csv(tmp_path, tariff_file, capsys) -> None:
+    input_path, output_path = tmp_path / "cdrs.csv", tmp_path / "rated.csv"
+    with open(input_path, "w", newline="") as input_file:
+        csv.writer(input_file).writerows(cdr_rows)
+    # A small chunk size to rate the rows in multiple chunks
+    main(
+        [
+            "rate",
+            str(input_path),
+            str(output_path),
+            f"--tariff={tariff_file}",
+            "--workers=2",
+            "--chunk-size=10",
+        ]
+    )
+    with open(output_path, newline="") as output_file:
+        rows = list(csv.DictReader(output_file))
+    assert len(rows) == 4
+    assert rows[0] == rows[3]
+    # As the `/rate/` API rates and formats the row
+    expected = await calculate_rate(
+        total_seconds=4980,
+        total_kwh=10.923,
+        energy_rate=0.3,
+        time_rate=2,
+        transaction_rate=1,
+    )
+    assert rows[0] == {
+        "overall": "7.04",
+        "energy": "3.277",
+        "time": "2.767",
+        "transaction": "1",
+        "error": "",
+    }
+    rates = [rows[0][column] for column in ("overall", "energy", "time", "transaction")]
+    assert rates == [str(rate) for rate in expected]
+    assert rows[1]["error"].endswith("meter_stop or be equal!")
+    assert rows[2]["error"].startswith("Invalid row")
+    assert "Rated 4 rows (2 failed)" in capsys.readouterr().out
+
+
+def test_rate_parquet(tmp_path, tariff_file) -> None:
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    input_path, output_path = tmp_path / "cdrs.parquet", tmp_path / "rated.parquet"
+    header, *rows = cdr_rows[:3]
+    table = pa.table(
+        {
+            column: [row[index] for row in rows]
+            if column.startswith("timestamp")
+            else [int(row[index]) for row in rows]
+            for index, column in enumerate(header)
+        }
+    )
+    pq.write_table(table, input_path, row_group_size=1)
+    main(["rate", str(input_path), str(output_path), f"--tariff={tariff_file}"])
+    results = pq.read_table(output_path).to_pylist()
+    assert results[0] == {
+        "overall": 7.04,
+        "energy": 3.277,
+        "time": 2.767,
+        "transaction": 1.0,
+        "error": None,
+    }
+    assert results[1]["overall"] is None
+    assert results[1]["error"].endswith("meter_stop or be equal!")
+
+
+def test_hash_api_key(monkeypatch, capsys) -> None:
+    monkeypatch.setattr("sys.stdin", io.StringIO("secret\n"))
+    main(["hash-api-key"])
+    assert capsys.readouterr().out.strip() == hash_api_key("secret")
@@ -0,0 +1,99 @@
+import aiohttp
+import pytest
+from aiohttp import web
+
+from app.api.helpers import exchange
+from app.api.helpers.exchange import CircuitBreaker, request_rate_table
+from app.core.config import settings
+from loadtest.driver import drive, parse_mix, percentile
+from loadtest.stub import RATES, StubExchange
+
+
+def test_parse_mix() -> None:
+    assert parse_mix("rate=3,conversion") == {"rate": 3.0, "conversion": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("rate=1,unknown=1")
+
+
+def test_percentile() -> None:
+    latencies = [float(n) for n in range(1, 101)]
+    assert percentile(latencies, 0.5) == 50
+    assert percentile(latencies, 0.99) == 99
+    assert percentile(latencies, 1) == 100
+    assert percentile([], 0.5) == 0
+
+
+@pytest.mark.asyncio
+async def test_stub_outages_and_errors() -> None:
+    stub = StubExchange(outages=[(0, 60)])
+    url = await stub.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{url}/latest?base=EUR") as response:
+                assert response.status == 503
+            stub.outages = []
+            async with session.get(f"{url}/2021-04-05?symbols=USD") as response:
+                assert response.status == 200
+                assert await response.json() == {
+                    "success": True,
+                    "base": "EUR",
+                    "rates": {"USD": RATES["USD"]},
+                    "date": "2021-04-05",
+                }
+            stub.error_rate = 1
+            async with session.get(f"{url}/latest") as response:
+                assert response.status == 500
+    finally:
+        await stub.stop()
+    assert stub.stats() == {"requests": 3, "failures": 2}
+
+
+@pytest.mark.asyncio
+async def test_request_rate_table_from_stub(redis_test_database, monkeypatch) -> None:
+    stub = StubExchange()
+    url = await stub.start()
+    monkeypatch.setattr(settings, "EXCHANGE_API_URL", url)
+    monkeypatch.setattr(exchange, "circuit_breaker", CircuitBreaker(1, 60))
+    try:
+        rate_table = await request_rate_table()
+    finally:
+        await stub.stop()
+    assert rate_table["rates"]["USD"] == RATES["USD"]
+    assert stub.stats()["requests"] == 1
+
+
+@pytest.mark.asyncio
+async def test_drive() -> None:
+    async def respond(request: web.Request) -> web.Response:
+        assert request.headers["API-Key"] == "key"
+        if request.method == "POST":
+            assert "cdr" in await request.json()
+            return web.json_response({"overall": 7.04})
+        return web.json_response({"overall": 8.28}, status=400)
+
+    application = web.Application()
+    application.router.add_route("*", "/api/rate/{path:.*}", respond)
+    runner = web.AppRunner(application)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        report = await drive(
+            f"http://127.0.0.1:{port}/api",
+            "key",
+            {"rate": 1, "conversion": 1},
+            concurrency=4,
+            duration=0.2,
+            seed=1,
+        )
+    finally:
+        await runner.cleanup()
+
+    rate, conversion = report["scenarios"]["rate"], report["scenarios"]["conversion"]
+    assert rate["requests"] and conversion["requests"]
+    assert rate["errors"] == 0
+    assert conversion["errors"] == conversion["requests"]
+    total = report["total"]
+    assert total["requests"] == rate["requests"] + conversion["requests"]
+    assert 0 < total["p50"] <= total["p95"] <= total["p99"] <= total["max"]
@@ -0,0 +1,17 @@
+"""Benchmarks of the hot paths of the rating service.
+
+Usage:
+    python -m benchmarks
+    python -m benchmarks --save-baseline
+    python -m benchmarks --redis --filter cache
+
+Covers the rating arithmetic, the validators, the cache helpers and full
+requests to the rating and conversion APIs through the ASGI app (in process,
+without a server). Redis is an in memory fake unless `--redis` is given, in
+which case the Redis of the settings is used (database 15, which is flushed).
+
+The results are written as JSON and compared with the stored baseline, a run
+fails (exits with 1) if a benchmark is slower than its baseline by more than
+the tolerance. Baselines are only comparable on the same machine, so a baseline
+is recorded (`--save-baseline`) on the machine which runs the comparisons.
+"""
@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import os
+import sys
+from typing import List, Optional
+
+from app.core.connections import redis_cache
+
+from . import suites  # noqa: F401 # registers the benchmarks
+from .fake_redis import FakeRedis
+from .runner import (
+    BENCHMARKS,
+    compare,
+    format_report,
+    load_results,
+    results_document,
+    run_benchmarks,
+    save_results,
+)
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(DIRECTORY, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(DIRECTORY, "results.json")
+# Redis database of the benchmarks, flushed before and after a run
+REDIS_DATABASE = 15
+
+
+def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="Benchmarks of the hot paths"
+    )
+    parser.add_argument(
+        "--filter", default="", help="only run the benchmarks whose name contains it"
+    )
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument(
+        "--min-round-time",
+        type=float,
+        default=0.05,
+        help="min seconds of a round, the calls of a round are adjusted to it",
+    )
+    parser.add_argument("--redis", action="store_true", help="use a real Redis")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the baseline, instead of comparing with it",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="slowdown of the median allowed before a run fails, e.g. 0.25",
+    )
+    return parser.parse_args(args)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    pool = redis_cache.redis_cache
+    if args.redis:
+        await redis_cache.init_cache(db=REDIS_DATABASE)
+        await redis_cache.redis_cache.flushdb()
+    else:
+        redis_cache.redis_cache = FakeRedis()
+    try:
+        names = [name for name in BENCHMARKS if args.filter in name]
+        results = await run_benchmarks(names, args.rounds, args.min_round_time)
+    finally:
+        if args.redis:
+            await redis_cache.redis_cache.flushdb()
+        await redis_cache.close()
+        redis_cache.redis_cache = pool
+    return results_document(results, backend="redis" if args.redis else "fake")
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    args = parse_args(args)
+    document = asyncio.get_event_loop().run_until_complete(run(args))
+    results = document["benchmarks"]
+    save_results(args.output, document)
+
+    if args.save_baseline:
+        save_results(args.baseline, document)
+        print(format_report(results))
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        # Nothing to tell a regression by, which mustn't pass for a clean run
+        print(format_report(results))
+        print(
+            f"NO BASELINE at {args.baseline}, record one on this machine with "
+            "--save-baseline",
+            file=sys.stderr,
+        )
+        return 2
+
+    baseline = load_results(args.baseline)
+    print(format_report(results, baseline))
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression.name}: {regression.baseline * 1e6:.2f}us -> "
+            f"{regression.result * 1e6:.2f}us ({regression.ratio - 1:+.1%})",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
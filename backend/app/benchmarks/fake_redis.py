@@ -0,0 +1,161 @@
+import fnmatch
+import time
+from typing import Dict, Optional, Tuple
+
+from app.core.connections import RELEASE_LOCK_SCRIPT
+
+
+def encode(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class FakePipeline:
+    """Queued commands of a pipeline or a transaction, run on `execute`"""
+
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.redis, name), args, kwargs))
+
+        return queue
+
+    async def execute(self):
+        return [
+            await command(*args, **kwargs) for command, args, kwargs in self.commands
+        ]
+
+
+class FakeRedis:
+    """In memory stand-in of the aioredis pool of `RedisCache`, with the commands
+    the caches use, so the benchmarks don't measure the network and the server.
+    Values are returned as bytes, like aioredis does without an encoding.
+    """
+
+    def __init__(self):
+        # Key -> value and its expiration (monotonic seconds), if it expires
+        self.values: Dict[bytes, Tuple[object, Optional[float]]] = {}
+
+    def _get(self, key):
+        entry = self.values.get(encode(key))
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self.values[encode(key)]
+            return None
+        return value
+
+    def _set(self, key, value, expire: Optional[float] = None):
+        expires_at = time.monotonic() + expire if expire else None
+        self.values[encode(key)] = (value, expires_at)
+
+    async def get(self, key):
+        return self._get(key)
+
+    async def mget(self, *keys):
+        return [self._get(key) for key in keys]
+
+    async def pttl(self, key):
+        if self._get(key) is None:
+            return -2
+        expires_at = self.values[encode(key)][1]
+        if expires_at is None:
+            return -1
+        return int((expires_at - time.monotonic()) * 1000)
+
+    async def pexpireat(self, key, timestamp):
+        value = self._get(key)
+        if value is None:
+            return False
+        expires_at = time.monotonic() + timestamp / 1000 - time.time()
+        self.values[encode(key)] = (value, expires_at)
+        return True
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def multi_exec(self):
+        # Commands of the event loop don't interleave, so a pipeline is atomic
+        return FakePipeline(self)
+
+    async def set(self, key, value, expire=0, pexpire=0, exist=None):
+        if exist is not None and self._get(key) is not None:
+            return False
+        self._set(key, encode(value), expire or pexpire / 1000)
+        return True
+
+    async def execute(self, command, *args, **kwargs):
+        command = command.lower() if isinstance(command, str) else command.decode()
+        if command != "set":
+            raise NotImplementedError(command)
+        key, value, *options = args
+        expire = None
+        if options and str(options[0]).lower() == "ex":
+            expire = float(options[1])
+        elif options and str(options[0]).lower() == "px":
+            expire = float(options[1]) / 1000
+        self._set(key, encode(value), expire)
+        return b"OK"
+
+    async def keys(self, pattern):
+        pattern = encode(pattern).decode()
+        return [
+            key
+            for key in list(self.values)
+            if fnmatch.fnmatchcase(key.decode(), pattern) and self._get(key) is not None
+        ]
+
+    async def delete(self, key):
+        return int(self.values.pop(encode(key), None) is not None)
+
+    async def exists(self, key):
+        return int(self._get(key) is not None)
+
+    def _hash(self, key, create: bool = False) -> Optional[dict]:
+        mapping = self._get(key)
+        if mapping is None and create:
+            mapping = {}
+            self._set(key, mapping)
+        return mapping
+
+    async def hget(self, key, field):
+        return (self._hash(key) or {}).get(encode(field))
+
+    async def hmset_dict(self, key, mapping):
+        self._hash(key, create=True).update(
+            {encode(field): encode(value) for field, value in mapping.items()}
+        )
+        return True
+
+    async def hgetall(self, key):
+        return dict(self._hash(key) or {})
+
+    async def hdel(self, key, field):
+        return int((self._hash(key) or {}).pop(encode(field), None) is not None)
+
+    async def hincrby(self, key, field, increment=1):
+        mapping = self._hash(key, create=True)
+        value = int(mapping.get(encode(field), 0)) + increment
+        mapping[encode(field)] = encode(value)
+        return value
+
+    async def eval(self, script, keys=(), args=()):
+        if script != RELEASE_LOCK_SCRIPT:
+            raise NotImplementedError("Only the lock release script is supported")
+        if self._get(keys[0]) == encode(args[0]):
+            return await self.delete(keys[0])
+        return 0
+
+    async def publish(self, channel, message):
+        return 0
+
+    def close(self):
+        self.values.clear()
+
+    async def wait_closed(self):
+        return None
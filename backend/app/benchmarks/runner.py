@@ -0,0 +1,119 @@
+import json
+import platform
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+Operation = Callable[[], Awaitable]
+
+# Registered benchmarks, name -> factory of the benchmarked operation
+BENCHMARKS: Dict[str, Callable[[], Awaitable[Operation]]] = {}
+
+
+def benchmark(name: str):
+    """Register a benchmark. The decorated async function prepares the benchmark
+    and returns the operation (an async function without arguments) to be timed.
+    """
+
+    def register(factory: Callable[[], Awaitable[Operation]]):
+        BENCHMARKS[name] = factory
+        return factory
+
+    return register
+
+
+class Regression(NamedTuple):
+    name: str
+    baseline: float
+    result: float
+
+    @property
+    def ratio(self) -> float:
+        return self.result / self.baseline
+
+
+async def time_round(operation: Operation, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        await operation()
+    return time.perf_counter() - start
+
+
+async def measure(operation: Operation, rounds: int, min_round_time: float) -> dict:
+    """Time an operation, in seconds per call.
+    The number of calls of a round is doubled until a round lasts at least
+    `min_round_time`, which also warms the caches up, and then `rounds` rounds
+    are timed.
+    """
+    number = 1
+    while await time_round(operation, number) < min_round_time:
+        number *= 2
+    times = [await time_round(operation, number) / number for _ in range(rounds)]
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "rounds": rounds,
+        "number": number,
+    }
+
+
+async def run_benchmarks(
+    names: List[str], rounds: int, min_round_time: float
+) -> Dict[str, dict]:
+    results = {}
+    for name in names:
+        operation = await BENCHMARKS[name]()
+        results[name] = await measure(operation, rounds, min_round_time)
+    return results
+
+
+def results_document(results: Dict[str, dict], backend: str) -> dict:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "redis": backend,
+        "benchmarks": results,
+    }
+
+
+def compare(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float
+) -> List[Regression]:
+    """Benchmarks whose median is slower than the baseline by more than the
+    tolerance (a fraction, e.g. 0.25 for 25%). Benchmarks missing from either
+    side are not compared.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        regression = Regression(name, baseline[name]["median"], result["median"])
+        if regression.ratio > 1 + tolerance:
+            regressions.append(regression)
+    return regressions
+
+
+def format_report(
+    results: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None
+) -> str:
+    lines = [f"{'benchmark':<36} {'median':>12} {'min':>12} {'vs baseline':>12}"]
+    for name, result in results.items():
+        change = ""
+        if baseline and name in baseline:
+            change = f"{result['median'] / baseline[name]['median'] - 1:+.1%}"
+        lines.append(
+            f"{name:<36} {result['median'] * 1e6:>10.2f}us "
+            f"{result['min'] * 1e6:>10.2f}us {change:>12}"
+        )
+    return "\n".join(lines)
+
+
+def load_results(path: str) -> Dict[str, dict]:
+    with open(path) as results_file:
+        return json.load(results_file)["benchmarks"]
+
+
+def save_results(path: str, document: dict) -> None:
+    with open(path, "w") as results_file:
+        json.dump(document, results_file, indent=2, sort_keys=True)
+        results_file.write("\n")
@@ -0,0 +1,361 @@
+import itertools
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import List, Tuple
+from urllib.parse import urlencode
+
+from app.api.helpers import (
+    calculate_rate,
+    convert_currency,
+    get_conversion_result_from_cache,
+    get_historical_conversion_result_from_cache,
+    result_cache,
+    set_historical_rates_to_cache,
+    set_rate_table_to_cache,
+    validate_meters,
+    validate_timestamps,
+)
+from app.api.helpers.cache import local_cache
+from app.api.helpers.records import rate_record_of
+from app.api.helpers.shared_rates import SharedRateTable
+from app.api.helpers.timestamps import parse_epoch_microseconds, parse_timestamps
+from app.core.config import settings
+from app.core.rate_limit import RateLimiter
+from app.core.security import APIKeyRegistry, hash_api_key
+from app.main import app
+from app.schemas import Currency
+
+from .runner import benchmark
+
+RATE_TABLE = {
+    "success": True,
+    "base": "EUR",
+    "date": "2021-08-08",
+    "rates": {
+        "USD": 1.176132,
+        "GBP": 0.848218,
+        "JPY": 129.826443,
+        "CAD": 1.474531,
+        "EUR": 1,
+    },
+}
+HISTORICAL_DAY = date(2021, 4, 5)
+RATE = {"energy": 0.3, "time": 2, "transaction": 1}
+CDR = {
+    "timestamp_start": "2021-04-05T10:04:00Z",
+    "timestamp_stop": "2021-04-05T11:27:00Z",
+    "meter_start": 1204307,
+    "meter_stop": 1215230,
+}
+HEADERS = [(b"api-key", (settings.API_KEY_SECRET or "").encode())]
+
+
+async def seed_cache() -> None:
+    """Cache the exchange rates, so the benchmarks don't call the service"""
+    await set_rate_table_to_cache(rate_table=RATE_TABLE)
+    await set_historical_rates_to_cache(
+        {HISTORICAL_DAY.isoformat(): RATE_TABLE["rates"]}
+    )
+
+
+async def asgi_request(
+    app, method: str, path: str, query: str = "", body: bytes = b""
+) -> Tuple[int, bytes]:
+    """Send a request through the ASGI app in process, without a server"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [*HEADERS, (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    status, chunks = 0, []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+@benchmark("calculate_rate")
+async def bench_calculate_rate():
+    async def operation():
+        await calculate_rate(
+            total_seconds=4980,
+            total_kwh=10.923,
+            energy_rate=0.3,
+            time_rate=2,
+            transaction_rate=1,
+        )
+
+    return operation
+
+
+@benchmark("convert_currency")
+async def bench_convert_currency():
+    conversion_result = {"rate": 1.176132, "date": "2021-08-08"}
+
+    async def operation():
+        await convert_currency(
+            conversion_result=conversion_result,
+            overall=7.04,
+            currency=Currency.USD,
+            energy=3.277,
+            time=2.767,
+            transaction=1,
+        )
+
+    return operation
+
+
+@benchmark("validate_timestamps")
+async def bench_validate_timestamps():
+    async def operation():
+        await validate_timestamps(
+            start=CDR["timestamp_start"], stop=CDR["timestamp_stop"]
+        )
+
+    return operation
+
+
+@benchmark("validate_meters")
+async def bench_validate_meters():
+    async def operation():
+        await validate_meters(start=CDR["meter_start"], stop=CDR["meter_stop"])
+
+    return operation
+
+
+def timestamp_batch(size: int) -> List[str]:
+    start = datetime(2021, 1, 1)
+    return [
+        (start + timedelta(seconds=second * 37)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for second in range(size)
+    ]
+
+
+@benchmark("parse_timestamps_1m")
+async def bench_parse_timestamps():
+    batch = timestamp_batch(1_000_000)
+
+    async def operation():
+        parse_timestamps(batch)
+
+    return operation
+
+
+@benchmark("parse_timestamps_1m_scalar")
+async def bench_parse_timestamps_scalar():
+    # The parsing of the rating API, a timestamp at a time
+    batch = timestamp_batch(1_000_000)
+
+    async def operation():
+        for timestamp in batch:
+            parse_epoch_microseconds(timestamp)
+
+    return operation
+
+
+@benchmark("parse_timestamps_1m_fromisoformat")
+async def bench_parse_timestamps_fromisoformat():
+    # The previous parsing, a timestamp at a time, for comparison
+    batch = timestamp_batch(1_000_000)
+
+    async def operation():
+        for timestamp in batch:
+            datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+    return operation
+
+
+@benchmark("conversion_cache_local")
+async def bench_conversion_cache_local():
+    await seed_cache()
+
+    async def operation():
+        await get_conversion_result_from_cache(currency=Currency.USD)
+
+    return operation
+
+
+@benchmark("conversion_cache_redis")
+async def bench_conversion_cache_redis():
+    await seed_cache()
+
+    async def operation():
+        # Misses the in process cache, so the table is read from Redis
+        local_cache.clear()
+        await get_conversion_result_from_cache(currency=Currency.USD)
+
+    return operation
+
+
+@benchmark("conversion_shared_rates")
+async def bench_conversion_shared_rates():
+    table = SharedRateTable(os.path.join(tempfile.mkdtemp(), "rates"), interval=1)
+    table.open()
+    table.elect()
+    table.write(
+        rate_record_of(RATE_TABLE), expires_at=datetime.utcnow() + timedelta(days=1)
+    )
+
+    async def operation():
+        table.conversion_result(Currency.USD)
+
+    return operation
+
+
+@benchmark("api_key_rate_limit")
+async def bench_api_key_rate_limit():
+    registry = APIKeyRegistry({"acme": hash_api_key("acme-key")})
+    # Never runs out of tokens, so every call takes one
+    limiter = RateLimiter(rate=1e9, burst=10**9, quotas={}, interval=1)
+
+    async def operation():
+        limiter.acquire(registry.tenant_of("acme-key"))
+
+    return operation
+
+
+@benchmark("historical_cache_redis")
+async def bench_historical_cache_redis():
+    await seed_cache()
+
+    async def operation():
+        local_cache.clear()
+        await get_historical_conversion_result_from_cache(
+            currency=Currency.USD, day=HISTORICAL_DAY
+        )
+
+    return operation
+
+
+@benchmark("set_rate_table_to_cache")
+async def bench_set_rate_table_to_cache():
+    async def operation():
+        await set_rate_table_to_cache(rate_table=RATE_TABLE)
+
+    return operation
+
+
+@benchmark("result_cache_redis")
+async def bench_result_cache_redis():
+    result = {"overall": 7.04, "components": {"energy": "3.277", "time": "2.767"}}
+    await result_cache.set("benchmark", result)
+
+    async def operation():
+        result_cache.clear()
+        await result_cache.get("benchmark")
+
+    return operation
+
+
+@benchmark("rate_endpoint")
+async def bench_rate_endpoint():
+    path = f"{settings.API_V1_STR}/rate/"
+    # A new CDR for every call, so the result isn't memoized
+    meters = itertools.count(CDR["meter_stop"])
+
+    async def operation():
+        body = {"rate": RATE, "cdr": {**CDR, "meter_stop": next(meters)}}
+        status, _ = await asgi_request(
+            app, "POST", path, body=json.dumps(body).encode()
+        )
+        assert status == 200, status
+
+    return operation
+
+
+@benchmark("rate_endpoint_memoized")
+async def bench_rate_endpoint_memoized():
+    path = f"{settings.API_V1_STR}/rate/"
+    body = json.dumps({"rate": RATE, "cdr": CDR}).encode()
+
+    async def operation():
+        status, _ = await asgi_request(app, "POST", path, body=body)
+        assert status == 200, status
+
+    return operation
+
+
+@benchmark("conversion_endpoint")
+async def bench_conversion_endpoint():
+    await seed_cache()
+    path = f"{settings.API_V1_STR}/rate/converted-rate/"
+    amounts = itertools.count(1)
+
+    async def operation():
+        query = urlencode(
+            {
+                "overall": 7 + next(amounts) / 100,
+                "energy": 3.277,
+                "time": 2.767,
+                "transaction": 1,
+                "currency": "USD",
+            }
+        )
+        status, _ = await asgi_request(app, "GET", path, query=query)
+        assert status == 200, status
+
+    return operation
+
+
+def fast_responses(operation):
+    """Run the operation with `FAST_RESPONSES`, for comparison with the validated
+    responses of the response models.
+    """
+
+    async def fast_operation():
+        settings.FAST_RESPONSES = True
+        try:
+            await operation()
+        finally:
+            settings.FAST_RESPONSES = False
+
+    return fast_operation
+
+
+@benchmark("rate_endpoint_memoized_fast")
+async def bench_rate_endpoint_memoized_fast():
+    return fast_responses(await bench_rate_endpoint_memoized())
+
+
+async def memoized_conversion():
+    await seed_cache()
+    path = f"{settings.API_V1_STR}/rate/converted-rate/"
+    query = urlencode(
+        {"overall": 7.04, "energy": 3.277, "time": 2.767, "transaction": 1}
+    )
+
+    async def operation():
+        status, _ = await asgi_request(app, "GET", path, query=query)
+        assert status == 200, status
+
+    return operation
+
+
+@benchmark("conversion_endpoint_memoized")
+async def bench_conversion_endpoint_memoized():
+    return await memoized_conversion()
+
+
+@benchmark("conversion_endpoint_memoized_fast")
+async def bench_conversion_endpoint_memoized_fast():
+    return fast_responses(await memoized_conversion())
@@ -0,0 +1,21 @@
+"""Load test of the rating and conversion APIs, against a local stub of the
+exchange rate service.
+
+Usage:
+    python -m loadtest
+    python -m loadtest --cold --concurrency 64 --latency 0.2
+    python -m loadtest --outage 10:15 --duration 40
+    python -m loadtest --rollover-at 10 --mix conversion=1
+    python -m loadtest --target http://localhost:8000 --stub-port 9000
+
+Starts the stub (see `stub.StubExchange`) with the given latency, error rate and
+outages, spawns the app under gunicorn with `EXCHANGE_API_URL` pointed at the
+stub (or targets a running app, which has to be configured with the URL of the
+stub), and sends a traffic mix of concurrent requests for a while. Reports the
+throughput and the p50/p95/p99 latencies per scenario, and the requests which
+reached the stub.
+
+`--cold` drops the cached rates and results first (a cold cache stampede), and
+`--rollover-at` expires the cached rate table during the run (the midnight
+rollover). Redis is the one of the settings, shared with the app.
+"""
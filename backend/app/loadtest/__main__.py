@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import aiohttp
+
+from app.api.helpers.cache import (
+    EXCHANGE_RATES_KEY,
+    HISTORICAL_RATES_KEY,
+    LAST_GOOD_RATES_KEY,
+)
+from app.core.config import settings
+from app.core.connections import redis_cache
+
+from .driver import drive, format_report, parse_mix
+from .stub import StubExchange
+
+# Keys dropped for a cold start: the exchange rates, the fetch locks and the
+# memoized results
+COLD_KEYS = (
+    EXCHANGE_RATES_KEY,
+    LAST_GOOD_RATES_KEY,
+    HISTORICAL_RATES_KEY,
+    "lock:*",
+    "results:*",
+)
+
+
+def parse_outage(value: str) -> Tuple[float, float]:
+    start, _, duration = value.partition(":")
+    return float(start), float(duration)
+
+
+def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m loadtest",
+        description="Load test of the rating and conversion APIs",
+    )
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument(
+        "--target",
+        help="URL of a running app, e.g. http://localhost:8000, which must use "
+        "the stub (its URL is printed) as EXCHANGE_API_URL",
+    )
+    target.add_argument(
+        "--workers", type=int, default=2, help="workers of the spawned app"
+    )
+    parser.add_argument(
+        "--port", type=int, default=8765, help="port of the spawned app"
+    )
+    parser.add_argument("--stub-port", type=int, default=0)
+    parser.add_argument("--mix", default="rate=3,conversion=2,conversion_historical=1")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=1000,
+        help="distinct inputs of a scenario, fewer have more memoized results",
+    )
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--latency", type=float, default=0.05, help="of the stub")
+    parser.add_argument("--jitter", type=float, default=0.05, help="of the stub")
+    parser.add_argument("--error-rate", type=float, default=0, help="of the stub")
+    parser.add_argument(
+        "--outage",
+        type=parse_outage,
+        action="append",
+        default=[],
+        metavar="START:DURATION",
+        help="seconds into the run the stub fails all the requests, repeatable",
+    )
+    parser.add_argument(
+        "--cold", action="store_true", help="drop the cached rates and results first"
+    )
+    parser.add_argument(
+        "--rollover-at",
+        type=float,
+        metavar="SECONDS",
+        help="expire the cached rate table, seconds into the run",
+    )
+    parser.add_argument("--output", help="write the report as JSON")
+    return parser.parse_args(args)
+
+
+async def drop_cached(patterns=COLD_KEYS) -> int:
+    dropped = 0
+    for pattern in patterns:
+        for key in await redis_cache.keys(pattern):
+            await redis_cache.delete(key)
+            dropped += 1
+    return dropped
+
+
+async def roll_over(after: float = 0) -> None:
+    """Expire the cached exchange rate table, as Redis does at the midnight"""
+    await asyncio.sleep(after)
+    await redis_cache.delete(EXCHANGE_RATES_KEY)
+
+
+def spawn_app(args: argparse.Namespace, stub_url: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "EXCHANGE_API_URL": stub_url,
+        # Only the traffic of the run reaches the stub
+        "RATE_REFRESH_ENABLED": "false",
+    }
+    if args.rollover_at is not None:
+        # Tables cached in process would hide the rollover until they expire
+        env.update(LOCAL_CACHE_MAX_SIZE="0", RESULT_CACHE_MAX_SIZE="0")
+    command = [
+        "gunicorn",
+        "-k",
+        "uvicorn.workers.UvicornWorker",
+        "-w",
+        str(args.workers),
+        "-b",
+        f"127.0.0.1:{args.port}",
+        "app.main:app",
+    ]
+    return subprocess.Popen(command, env=env)
+
+
+async def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{url}{settings.API_V1_STR}/ping/") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"The app at {url} isn't up after {timeout} seconds")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    mix = parse_mix(args.mix)
+    stub = StubExchange(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        outages=args.outage,
+    )
+    stub_url = await stub.start(port=args.stub_port)
+    print(f"Stub exchange rate service at {stub_url}")
+    await redis_cache.init_cache()
+    process = None
+    try:
+        if args.cold:
+            print(f"Dropped {await drop_cached()} cached keys")
+        url = args.target
+        if url is None:
+            process = spawn_app(args, stub_url)
+            url = f"http://127.0.0.1:{args.port}"
+        await wait_ready(url)
+        # The outages are timed from the start of the traffic
+        stub.restart_clock()
+        rollover = None
+        if args.rollover_at is not None:
+            rollover = asyncio.ensure_future(roll_over(after=args.rollover_at))
+        report = await drive(
+            f"{url}{settings.API_V1_STR}",
+            settings.API_KEY_SECRET or "",
+            mix,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            distinct=args.distinct,
+            seed=args.seed,
+        )
+        if rollover is not None and not rollover.done():
+            rollover.cancel()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        await redis_cache.close()
+        await stub.stop()
+    report["upstream"] = stub.stats()
+    return report
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    args = parse_args(args)
+    report = asyncio.get_event_loop().run_until_complete(run(args))
+    print(format_report(report))
+    upstream = report["upstream"]
+    print(f"Upstream requests: {upstream['requests']}, failed: {upstream['failures']}")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+            output_file.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import asyncio
+import random
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+
+# Request of a scenario: method, path (under the API prefix), query and JSON body
+Request = Tuple[str, str, Optional[dict], Optional[dict]]
+
+RATE = {"energy": 0.3, "time": 2, "transaction": 1}
+CDR = {
+    "timestamp_start": "2021-04-05T10:04:00Z",
+    "timestamp_stop": "2021-04-05T11:27:00Z",
+    "meter_start": 1204307,
+}
+CURRENCIES = ("USD", "GBP", "JPY", "CAD")
+
+
+def rate_request(rng: random.Random, distinct: int) -> Request:
+    cdr = {**CDR, "meter_stop": CDR["meter_start"] + 1 + rng.randrange(distinct)}
+    return "POST", "/rate/", None, {"rate": RATE, "cdr": cdr}
+
+
+def rate_get_request(rng: random.Random, distinct: int) -> Request:
+    cdr = {**CDR, "meter_stop": CDR["meter_start"] + 1 + rng.randrange(distinct)}
+    return "GET", "/rate/", {**RATE, **cdr}, None
+
+
+def conversion_query(rng: random.Random, distinct: int) -> dict:
+    return {
+        "overall": 1 + rng.randrange(distinct) / 100,
+        "energy": 3.277,
+        "time": 2.767,
+        "transaction": 1,
+        "currency": rng.choice(CURRENCIES),
+    }
+
+
+def conversion_request(rng: random.Random, distinct: int) -> Request:
+    return "GET", "/rate/converted-rate/", conversion_query(rng, distinct), None
+
+
+def historical_conversion_request(rng: random.Random, distinct: int) -> Request:
+    day = date.today() - timedelta(days=1 + rng.randrange(30))
+    query = {**conversion_query(rng, distinct), "date": day.isoformat()}
+    return "GET", "/rate/converted-rate/", query, None
+
+
+# Scenarios of the traffic mixes, name -> builder of a request
+SCENARIOS: Dict[str, Callable[[random.Random, int], Request]] = {
+    "rate": rate_request,
+    "rate_get": rate_get_request,
+    "conversion": conversion_request,
+    "conversion_historical": historical_conversion_request,
+}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse a traffic mix, e.g. `rate=3,conversion=1`, to scenario weights"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(
+                f"Unknown scenario {name!r}, one of {', '.join(SCENARIOS)}"
+            )
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest rank percentile of sorted values"""
+    if not ordered:
+        return 0.0
+    rank = max(1, int(-(-fraction * len(ordered) // 1)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Outcome(NamedTuple):
+    scenario: str
+    status: int
+    latency: float
+
+
+def summarize(outcomes: List[Outcome], duration: float) -> dict:
+    latencies = sorted(outcome.latency for outcome in outcomes)
+    errors = sum(outcome.status != 200 for outcome in outcomes)
+    return {
+        "requests": len(outcomes),
+        "errors": errors,
+        "throughput": len(outcomes) / duration if duration else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def build_report(outcomes: List[Outcome], duration: float) -> dict:
+    by_scenario: Dict[str, List[Outcome]] = {}
+    for outcome in outcomes:
+        by_scenario.setdefault(outcome.scenario, []).append(outcome)
+    return {
+        "duration": duration,
+        "total": summarize(outcomes, duration),
+        "scenarios": {
+            name: summarize(scenario_outcomes, duration)
+            for name, scenario_outcomes in sorted(by_scenario.items())
+        },
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{'scenario':<24} {'requests':>9} {'errors':>7} {'req/s':>9} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    ]
+    for name, summary in [*report["scenarios"].items(), ("total", report["total"])]:
+        lines.append(
+            f"{name:<24} {summary['requests']:>9} {summary['errors']:>7} "
+            f"{summary['throughput']:>9.1f} "
+            + " ".join(
+                f"{summary[key] * 1000:>9.2f}" for key in ("p50", "p95", "p99", "max")
+            )
+        )
+    return "\n".join(lines)
+
+
+async def drive(
+    api_url: str,
+    api_key: str,
+    mix: Dict[str, float],
+    concurrency: int,
+    duration: float,
+    distinct: int = 1000,
+    seed: Optional[int] = None,
+    timeout: float = 30,
+) -> dict:
+    """Send the traffic mix to the API with `concurrency` concurrent clients for
+    `duration` seconds, each client sends its next request once the previous
+    one is answered (a closed loop).
+
+    Args:
+        api_url (str): URL of the API, including its prefix, e.g. `.../api/v1`
+        api_key (str): Key of the `API-Key` header
+        mix (Dict[str, float]): Scenario weights, see `parse_mix`
+        concurrency (int): Concurrent clients
+        duration (float): Seconds to send requests for
+        distinct (int): Number of distinct inputs of a scenario, lower values
+        have more of the results memoized
+        seed (int): Seed of the random inputs, for reproducible runs
+
+    Returns:
+        dict: Throughput and latency percentiles (seconds), in total and per scenario
+    """
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    outcomes: List[Outcome] = []
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    headers = {"API-Key": api_key}
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(
+        connector=connector, headers=headers, timeout=client_timeout
+    ) as session:
+        deadline = time.monotonic() + duration
+
+        async def client():
+            while time.monotonic() < deadline:
+                scenario = rng.choices(names, weights)[0]
+                method, path, query, body = SCENARIOS[scenario](rng, distinct)
+                start = time.perf_counter()
+                try:
+                    async with session.request(
+                        method, f"{api_url}{path}", params=query, json=body
+                    ) as response:
+                        await response.read()
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    status = 0
+                outcomes.append(Outcome(scenario, status, time.perf_counter() - start))
+
+        started = time.monotonic()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return build_report(outcomes, elapsed)
@@ -0,0 +1,130 @@
+import asyncio
+import random
+import time
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+from aiohttp import web
+
+# Rates of the currencies against the base currency (EUR)
+RATES = {"USD": 1.176132, "GBP": 0.848218, "JPY": 129.826443, "CAD": 1.474531}
+
+
+class StubExchange:
+    """Local stub of the exchange rate service (exchangerate.host), with
+    configurable latency, error rate and outages.
+
+    Responses have the shape of the service's responses for the latest, the
+    historical and the time series rates. During an outage every request fails
+    with `503`, and otherwise a request fails at random with the probability of
+    `error_rate`. Outages are (start, duration) pairs in seconds since `start`
+    was called, they can also be switched on and off with `outage`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        outages: Optional[List[Tuple[float, float]]] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.outages = outages or []
+        self.down = False
+        self.requests = 0
+        self.failures = 0
+        self.url = ""
+        self._started_at = 0.0
+        self._runner: Optional[web.AppRunner] = None
+
+    def in_outage(self) -> bool:
+        if self.down:
+            return True
+        elapsed = time.monotonic() - self._started_at
+        return any(start <= elapsed < start + length for start, length in self.outages)
+
+    def restart_clock(self) -> None:
+        """Time the outages from now on"""
+        self._started_at = time.monotonic()
+
+    def outage(self, down: bool) -> None:
+        self.down = down
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "failures": self.failures}
+
+    async def respond(self, payload) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.in_outage():
+            self.failures += 1
+            return web.json_response({"success": False}, status=503)
+        if random.random() < self.error_rate:
+            self.failures += 1
+            return web.json_response({"success": False}, status=500)
+        return web.json_response({"success": True, **payload})
+
+    @staticmethod
+    def rates(request: web.Request) -> dict:
+        symbols = request.query.get("symbols")
+        base = request.query.get("base", "EUR")
+        rates = {**RATES, "EUR": 1}
+        if symbols:
+            rates = {
+                symbol: rates[symbol]
+                for symbol in symbols.split(",")
+                if symbol in rates
+            }
+        return {"base": base, "rates": rates}
+
+    async def latest(self, request: web.Request) -> web.Response:
+        return await self.respond(
+            {**self.rates(request), "date": date.today().isoformat()}
+        )
+
+    async def historical(self, request: web.Request) -> web.Response:
+        try:
+            day = date.fromisoformat(request.match_info["day"])
+        except ValueError:
+            raise web.HTTPNotFound()
+        return await self.respond({**self.rates(request), "date": day.isoformat()})
+
+    async def timeseries(self, request: web.Request) -> web.Response:
+        try:
+            start = date.fromisoformat(request.query["start_date"])
+            end = date.fromisoformat(request.query["end_date"])
+        except (KeyError, ValueError):
+            raise web.HTTPBadRequest()
+        rates = self.rates(request)["rates"]
+        days = (
+            (start + timedelta(days=n)).isoformat()
+            for n in range((end - start).days + 1)
+        )
+        return await self.respond(
+            {"timeseries": True, "base": "EUR", "rates": {day: rates for day in days}}
+        )
+
+    def application(self) -> web.Application:
+        application = web.Application()
+        application.router.add_get("/latest", self.latest)
+        application.router.add_get("/timeseries", self.timeseries)
+        application.router.add_get("/{day}", self.historical)
+        return application
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving, returns the base URL of the stub"""
+        self._runner = web.AppRunner(self.application(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        self._started_at = time.monotonic()
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None